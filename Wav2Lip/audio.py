@@ -4,7 +4,11 @@ import numpy as np
 # import tensorflow as tf
 from scipy import signal
 from scipy.io import wavfile
-import hparams as hp
+try:
+    from .hparams import hparams as hp
+except ImportError:
+    # Imported as a top-level module (training scripts run from this directory)
+    from hparams import hparams as hp
 import os, sys
 
 
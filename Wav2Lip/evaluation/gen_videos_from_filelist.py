@@ -7,9 +7,11 @@ from glob import glob
 import torch
 
 sys.path.append('../')
+# The face detector loads its weights through Wav2Lip.models.registry
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 import audio
 import face_detection
-from models import Wav2Lip
+from Wav2Lip.models.backends import BACKENDS, load_backend
 
 parser = argparse.ArgumentParser(description='Code to generate results for test filelists')
 
@@ -26,6 +28,8 @@ parser.add_argument('--pads', nargs='+', type=int, default=[0, 0, 0, 0],
 parser.add_argument('--face_det_batch_size', type=int, 
 					help='Single GPU batch size for face detection', default=64)
 parser.add_argument('--wav2lip_batch_size', type=int, help='Batch size for Wav2Lip', default=128)
+parser.add_argument('--backend', default='eager', choices=BACKENDS,
+					help='Run Wav2Lip in eager PyTorch, TorchScript or ONNX Runtime (CPU)')
 
 # parser.add_argument('--resize_factor', default=1, type=int)
 
@@ -126,26 +130,9 @@ print('Using {} for inference.'.format(device))
 detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
 											flip_input=False, device=device)
 
-def _load(checkpoint_path):
-	if device == 'cuda':
-		checkpoint = torch.load(checkpoint_path)
-	else:
-		checkpoint = torch.load(checkpoint_path,
-								map_location=lambda storage, loc: storage)
-	return checkpoint
-
 def load_model(path):
-	model = Wav2Lip()
 	print("Load checkpoint from: {}".format(path))
-	checkpoint = _load(path)
-	s = checkpoint["state_dict"]
-	new_s = {}
-	for k, v in s.items():
-		new_s[k.replace('module.', '')] = v
-	model.load_state_dict(new_s)
-
-	model = model.to(device)
-	return model.eval()
+	return load_backend(path, device, args.backend, optimize=False)
 
 model = load_model(args.checkpoint_path)
 
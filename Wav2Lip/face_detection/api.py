@@ -12,7 +12,7 @@ except BaseException:
 
 from .models import FAN, ResNetDepth
 from .utils import *
-from Wav2Lip.face_detection.detection.sfd.sfd_detector import FaceDetector
+from .detection import create_detector
 
 
 class LandmarksType(Enum):
@@ -46,7 +46,10 @@ ROOT = os.path.dirname(os.path.abspath(__file__))
 
 class FaceAlignment:
     def __init__(self, landmarks_type, network_size=NetworkSize.LARGE,
-                 device='cuda', flip_input=False, face_detector='sfd', verbose=False):
+                 device='cuda', flip_input=False, face_detector='sfd', verbose=False, min_face_size=None,
+                 tile_size=None, optimize=True, precision='fp32'):
+        # inference.py and preprocess.py pass the device as a string
+        device = torch.device(device)
         self.device = device
         self.flip_input = flip_input
         self.landmarks_type = landmarks_type
@@ -57,10 +60,14 @@ class FaceAlignment:
         if device.type == 'cuda':
             torch.backends.cudnn.benchmark = True
 
-        # Get the face detector
-        self.face_detector = FaceDetector(device=device, verbose=verbose)
+        # Get the face detector: a registered backend name (see detection.available_detectors)
+        # or a FaceDetector instance
+        if isinstance(face_detector, str):
+            face_detector = create_detector(face_detector, device, verbose=verbose, min_face_size=min_face_size,
+                                            tile_size=tile_size, optimize=optimize, precision=precision)
+        self.face_detector = face_detector
 
-    def get_detections_for_batch(self, images):
+    def get_detections_for_batch(self, images, return_scores=False):
         images = images[..., ::-1]
         detected_faces = self.face_detector.detect_from_batch(images.copy())
         results = []
@@ -73,6 +80,9 @@ class FaceAlignment:
             d = np.clip(d, 0, None)
             
             x1, y1, x2, y2 = map(int, d[:-1])
-            results.append((x1, y1, x2, y2))
+            if return_scores:
+                results.append((x1, y1, x2, y2, float(d[-1])))
+            else:
+                results.append((x1, y1, x2, y2))
 
         return results
\ No newline at end of file
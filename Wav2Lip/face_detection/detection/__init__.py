@@ -1 +1,2 @@
-from .core import FaceDetector
\ No newline at end of file
+from .core import FaceDetector
+from .registry import available_detectors, create_detector, register_detector
@@ -0,0 +1 @@
+from .cascade_detector import CascadeDetector
@@ -0,0 +1,83 @@
+import os
+import cv2
+import numpy as np
+
+from ..core import FaceDetector
+
+
+class CascadeDetector(FaceDetector):
+    """OpenCV Haar cascade face detector.
+
+    Orders of magnitude cheaper than S3FD on CPU, but less accurate and with
+    a different box geometry (tighter, and without the chin). Frames are
+    downscaled to at most ``max_size`` pixels before detection.
+
+    The score of a face is derived from the number of neighbouring cascade
+    hits that support it: n / (n + ``neighbours_half_score``), so
+    ``neighbours_half_score`` neighbours give a score of 0.5.
+
+    Keyword Arguments:
+        cascade {str} -- cascade file, or the name of one shipped with cv2
+        max_size {int} -- longest side frames are downscaled to
+        scale_factor {float} -- cascade scale step
+        min_neighbors {int} -- hits a face needs to be returned
+        neighbours_half_score {float} -- neighbours scoring 0.5
+        min_face_size {int} -- smallest face looked for, in pixels of the input image
+        box_adjust {tuple} -- (x1, y1, x2, y2) offsets, as fractions of the box size,
+            added to every box to bring it closer to the S3FD box of the same face
+            (see benchmarks/face_detector_benchmark.py)
+    """
+
+    def __init__(self, device, verbose=False, cascade='haarcascade_frontalface_default.xml', max_size=480,
+                 scale_factor=1.1, min_neighbors=4, neighbours_half_score=10.0, min_face_size=None,
+                 box_adjust=(0, 0, 0, 0), **kwargs):
+        super(CascadeDetector, self).__init__(device, verbose)
+
+        path = cascade if os.path.isfile(cascade) else os.path.join(cv2.data.haarcascades, cascade)
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise IOError('Could not load the cascade {}'.format(path))
+
+        self.max_size = max_size
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.neighbours_half_score = neighbours_half_score
+        self.min_face_size = min_face_size
+        self.box_adjust = np.asarray(box_adjust, dtype=np.float32)
+
+    def detect_from_image(self, tensor_or_path):
+        image = self.tensor_or_path_to_ndarray(tensor_or_path)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+        scale = min(1.0, self.max_size / float(max(gray.shape[:2])))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.equalizeHist(gray)
+
+        min_size = max(20, int((self.min_face_size or 0) * scale))
+        rects, neighbours = self.cascade.detectMultiScale2(gray, scaleFactor=self.scale_factor,
+                                                           minNeighbors=self.min_neighbors,
+                                                           minSize=(min_size, min_size))
+        if len(rects) == 0:
+            return np.zeros((0, 5), dtype=np.float32)
+
+        rects = np.asarray(rects, dtype=np.float32) / scale
+        neighbours = np.asarray(neighbours, dtype=np.float32).reshape(-1)
+        boxes = np.column_stack([rects[:, 0], rects[:, 1], rects[:, 0] + rects[:, 2], rects[:, 1] + rects[:, 3]])
+        boxes += self.box_adjust * np.column_stack([rects[:, 2], rects[:, 3], rects[:, 2], rects[:, 3]])
+        scores = neighbours / (neighbours + self.neighbours_half_score)
+
+        order = np.argsort(-scores, kind='stable')
+        return np.column_stack([boxes, scores])[order].astype(np.float32)
+
+    @property
+    def reference_scale(self):
+        return 195
+
+    @property
+    def reference_x_shift(self):
+        return 0
+
+    @property
+    def reference_y_shift(self):
+        return 0
@@ -51,6 +51,17 @@ class FaceDetector(object):
         """
         raise NotImplementedError
 
+    def detect_from_batch(self, images):
+        """Detects faces in a batch of images (one ``detect_from_image`` call per image by default).
+
+        Arguments:
+            images {numpy.ndarray} -- (B, H, W, 3) RGB images
+
+        Returns:
+            list -- per image, a (num_faces, 5) array of x1, y1, x2, y2, score
+        """
+        return [np.asarray(self.detect_from_image(image), dtype=np.float32).reshape(-1, 5) for image in images]
+
     def detect_from_directory(self, path, extensions=['.jpg', '.png'], recursive=False, show_progress_bar=True):
         """Detects faces from all the images present in a given directory.
 
@@ -0,0 +1,76 @@
+import numpy as np
+
+from .core import FaceDetector
+
+
+class FastThenVerifyDetector(FaceDetector):
+    """Run a cheap detector on every image and the accurate one only where it is unsure.
+
+    An image is settled by the fast detector when its best face scores at
+    least ``confidence``; every other image (no face, or only weak ones)
+    goes through the verifier, in one batch.
+
+    Arguments:
+        fast {FaceDetector} -- cheap detector (e.g. CascadeDetector)
+        verify {FaceDetector} -- accurate detector (e.g. SFDDetector)
+
+    Keyword Arguments:
+        confidence {float} -- minimum fast score of a face that is not verified
+    """
+
+    def __init__(self, device, fast, verify, confidence=0.6, verbose=False):
+        super(FastThenVerifyDetector, self).__init__(device, verbose)
+        self.fast = fast
+        self.verify = verify
+        self.confidence = confidence
+        self.fast_accepted = 0
+        self.verified = 0
+
+    @property
+    def min_face_size(self):
+        return getattr(self.verify, 'min_face_size', None)
+
+    @min_face_size.setter
+    def min_face_size(self, value):
+        for detector in (self.fast, self.verify):
+            if hasattr(detector, 'min_face_size'):
+                detector.min_face_size = value
+
+    def _sure(self, boxes):
+        return len(boxes) > 0 and boxes[0][4] >= self.confidence
+
+    def detect_from_image(self, tensor_or_path):
+        image = self.tensor_or_path_to_ndarray(tensor_or_path)
+        return self.detect_from_batch(image[None])[0]
+
+    def detect_from_batch(self, images):
+        results = [np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+                   for boxes in self.fast.detect_from_batch(images)]
+        unsure = [i for i, boxes in enumerate(results) if not self._sure(boxes)]
+        if unsure:
+            verified = self.verify.detect_from_batch(np.ascontiguousarray(images[unsure]))
+            for i, boxes in zip(unsure, verified):
+                results[i] = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+        self.fast_accepted += len(images) - len(unsure)
+        self.verified += len(unsure)
+        return results
+
+    def stats(self):
+        total = self.fast_accepted + self.verified
+        return {
+            'fast_accepted': self.fast_accepted,
+            'verified': self.verified,
+            'verified_fraction': self.verified / total if total else 0.0,
+        }
+
+    @property
+    def reference_scale(self):
+        return self.verify.reference_scale
+
+    @property
+    def reference_x_shift(self):
+        return self.verify.reference_x_shift
+
+    @property
+    def reference_y_shift(self):
+        return self.verify.reference_y_shift
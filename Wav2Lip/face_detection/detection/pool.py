@@ -0,0 +1,310 @@
+import math
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .core import FaceDetector
+
+
+def _worker_main(worker_id, detector_name, detector_kwargs, threads, tasks, results):
+    """Detection process: one detector, frames read straight from the parent's shared memory."""
+    import cv2
+    import torch
+
+    from .registry import create_detector
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    torch.set_grad_enabled(False)
+    try:
+        detector = create_detector(detector_name, torch.device('cpu'), **detector_kwargs)
+    except BaseException:
+        results.put(('error', worker_id, None, traceback.format_exc()))
+        return
+    results.put(('ready', worker_id, None, None))
+
+    buffers = {}
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, buffer_name, offset, shape, options = task
+            try:
+                if buffer_name not in buffers:
+                    # The parent reallocates its ring when frames grow; drop the old one
+                    for old in buffers.values():
+                        old.close()
+                    buffers = {buffer_name: shared_memory.SharedMemory(name=buffer_name)}
+                for key, value in options.items():
+                    if getattr(detector, key, None) != value:
+                        setattr(detector, key, value)
+                frames = np.ndarray(shape, dtype=np.uint8, buffer=buffers[buffer_name].buf, offset=offset)
+                detections = [np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+                              for boxes in detector.detect_from_batch(frames)]
+                del frames
+                results.put(('done', worker_id, seq, detections))
+            except BaseException:
+                results.put(('error', worker_id, seq, traceback.format_exc()))
+    finally:
+        for buffer in buffers.values():
+            buffer.close()
+
+
+class DetectionPool(FaceDetector):
+    """Face detection spread over worker processes, each with its own detector.
+
+    Meant for CPU boxes with many cores, where one S3FD process cannot keep
+    them busy. Frames are not pickled: every worker owns a ring of
+    ``slots_per_worker`` slots in one shared memory block, the parent copies
+    a chunk of frames into a free slot and sends the worker only the slot
+    (name, offset, shape). Detections come back through a queue and are
+    reassembled in frame order.
+
+    The pool is a FaceDetector, so it can be passed to
+    ``FaceAlignment(face_detector=pool)``; ``detect_from_batch`` splits the
+    batch over the workers, ``imap`` streams a whole video through them.
+    Workers are spawned, so the main module is imported again in each of
+    them: scripts must keep their work under ``if __name__ == '__main__'``.
+
+    Keyword Arguments:
+        num_workers {int} -- detection processes (default: cpu_count // threads_per_worker)
+        face_detector {str} -- detector backend of the workers (see available_detectors)
+        threads_per_worker {int} -- torch/OpenCV threads of each worker
+            (default: cpu_count // num_workers, or 4 when both are unset)
+        chunk_size {int} -- frames per task in ``imap``
+        slots_per_worker {int} -- tasks in flight per worker
+        min_face_size {int} -- passed on to the workers' detectors
+    """
+
+    def __init__(self, device=None, num_workers=None, face_detector='sfd', threads_per_worker=None, chunk_size=4,
+                 slots_per_worker=2, min_face_size=None, verbose=False, **detector_kwargs):
+        import torch
+        super(DetectionPool, self).__init__(torch.device('cpu') if device is None else device, verbose)
+
+        cpus = os.cpu_count() or 1
+        if num_workers is None:
+            threads_per_worker = threads_per_worker or min(4, cpus)
+            num_workers = max(1, cpus // threads_per_worker)
+        self.num_workers = max(1, int(num_workers))
+        self.threads_per_worker = threads_per_worker or max(1, cpus // self.num_workers)
+        self.face_detector = face_detector
+        self.detector_kwargs = detector_kwargs
+        self.chunk_size = chunk_size
+        self.slots_per_worker = slots_per_worker
+        self.min_face_size = min_face_size
+
+        self._context = mp.get_context('spawn')
+        self._workers = []
+        self._tasks = []
+        self._results = None
+        self._buffers = []
+        self._slot_bytes = 0
+        self._free = []
+        self.load_seconds = 0.0
+        self.frames = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        """Start the workers and wait until their detectors are loaded (done on first use otherwise)."""
+        if self._workers:
+            return
+        start = time.perf_counter()
+        self._results = self._context.Queue()
+        for worker_id in range(self.num_workers):
+            tasks = self._context.Queue()
+            worker = self._context.Process(target=_worker_main, daemon=True,
+                                           args=(worker_id, self.face_detector, self.detector_kwargs,
+                                                 self.threads_per_worker, tasks, self._results))
+            worker.start()
+            self._workers.append(worker)
+            self._tasks.append(tasks)
+            if worker_id == 0:
+                # The first worker downloads the weights if needed; the others then load them from disk
+                self._wait_ready(1)
+        self._wait_ready(self.num_workers - 1)
+        self.load_seconds = time.perf_counter() - start
+        if self.verbose:
+            print('Detection pool: {} workers x {} threads ready in {:.1f}s'.format(
+                self.num_workers, self.threads_per_worker, self.load_seconds))
+
+    def _wait_ready(self, count):
+        for _ in range(count):
+            kind, worker_id, _, error = self._get_result()
+            if kind == 'error':
+                self.close()
+                raise RuntimeError('Detection worker {} failed to start:\n{}'.format(worker_id, error))
+
+    def _get_result(self):
+        while True:
+            try:
+                return self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [i for i, worker in enumerate(self._workers) if not worker.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError('Detection worker(s) {} died'.format(dead))
+
+    def _allocate(self, slot_bytes):
+        """(Re)create every worker's ring with slots of at least ``slot_bytes``."""
+        self._release_buffers()
+        self._slot_bytes = slot_bytes
+        self._buffers = [shared_memory.SharedMemory(create=True, size=slot_bytes * self.slots_per_worker)
+                         for _ in range(self.num_workers)]
+        self._free = [deque(range(self.slots_per_worker)) for _ in range(self.num_workers)]
+
+    def _release_buffers(self):
+        for buffer in self._buffers:
+            buffer.close()
+            buffer.unlink()
+        self._buffers = []
+        self._free = []
+
+    def _free_worker(self):
+        """Worker with the most free slots, or None when every ring is full."""
+        if not self._free:
+            return None
+        worker_id = max(range(self.num_workers), key=lambda i: len(self._free[i]))
+        return worker_id if self._free[worker_id] else None
+
+    def _dispatch(self, seq, chunk, worker_id):
+        slot = self._free[worker_id].popleft()
+        buffer = self._buffers[worker_id]
+        offset = slot * self._slot_bytes
+        np.ndarray(chunk.shape, dtype=np.uint8, buffer=buffer.buf, offset=offset)[...] = chunk
+        self._tasks[worker_id].put((seq, buffer.name, offset, chunk.shape, {'min_face_size': self.min_face_size}))
+        return slot
+
+    def imap(self, frames, chunk_size=None):
+        """Detect faces in a stream of frames, yielding per frame a (num_faces, 5) array, in order.
+
+        Arguments:
+            frames {iterable} -- (H, W, 3) uint8 RGB frames
+
+        Keyword Arguments:
+            chunk_size {int} -- frames per task (default: self.chunk_size)
+        """
+        self.start()
+        chunk_size = chunk_size or self.chunk_size
+        chunks = self._chunks(frames, chunk_size)
+        in_flight = {}  # seq -> (worker, slot)
+        done = {}
+        next_seq = next_out = 0
+        pending = None
+        start = time.perf_counter()
+        try:
+            while True:
+                # Fill the free slots
+                while True:
+                    if pending is None:
+                        pending = next(chunks, None)
+                        if pending is None:
+                            break
+                    if pending.nbytes > self._slot_bytes:
+                        if in_flight:
+                            break
+                        self._allocate(pending.nbytes)
+                    worker_id = self._free_worker()
+                    if worker_id is None:
+                        break
+                    in_flight[next_seq] = (worker_id, self._dispatch(next_seq, pending, worker_id))
+                    next_seq += 1
+                    pending = None
+
+                if not in_flight:
+                    break
+                kind, worker_id, seq, payload = self._get_result()
+                if kind == 'error':
+                    raise RuntimeError('Face detection failed in worker {}:\n{}'.format(worker_id, payload))
+                _, slot = in_flight.pop(seq)
+                self._free[worker_id].append(slot)
+                done[seq] = payload
+                while next_out in done:
+                    detections = done.pop(next_out)
+                    self.frames += len(detections)
+                    for boxes in detections:
+                        yield boxes
+                    next_out += 1
+        except BaseException:
+            # Results of abandoned tasks would be mistaken for the next call's
+            if in_flight:
+                self.close()
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - start
+
+    @staticmethod
+    def _chunks(frames, chunk_size):
+        chunk = []
+        for frame in frames:
+            if chunk and frame.shape != chunk[0].shape:
+                yield np.stack(chunk)
+                chunk = []
+            chunk.append(frame)
+            if len(chunk) == chunk_size:
+                yield np.stack(chunk)
+                chunk = []
+        if chunk:
+            yield np.stack(chunk)
+
+    def detect_from_batch(self, images):
+        # Spread the batch evenly, one chunk per worker
+        chunk_size = max(1, int(math.ceil(len(images) / float(self.num_workers))))
+        return list(self.imap(np.ascontiguousarray(images, dtype=np.uint8), chunk_size=chunk_size))
+
+    def detect_from_image(self, tensor_or_path):
+        image = self.tensor_or_path_to_ndarray(tensor_or_path)
+        return self.detect_from_batch(image[None])[0]
+
+    def stats(self):
+        return {
+            'workers': self.num_workers,
+            'threads_per_worker': self.threads_per_worker,
+            'frames': self.frames,
+            'load_seconds': self.load_seconds,
+            'frames_per_second': self.frames / self.busy_seconds if self.busy_seconds else 0.0,
+        }
+
+    def close(self):
+        for tasks, worker in zip(self._tasks, self._workers):
+            if worker.is_alive():
+                tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+        self._tasks = []
+        self._release_buffers()
+        self._slot_bytes = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @property
+    def reference_scale(self):
+        return 195
+
+    @property
+    def reference_x_shift(self):
+        return 0
+
+    @property
+    def reference_y_shift(self):
+        return 0
@@ -0,0 +1,64 @@
+import importlib
+
+# name -> (module, class, default keyword arguments); modules are only imported when used,
+# so the OpenCV backends do not load torch models
+_BACKENDS = {
+    'sfd': ('.sfd.sfd_detector', 'SFDDetector', {}),
+    'sfd_half': ('.sfd.sfd_detector', 'ReducedScaleSFDDetector', {'scale': 0.5}),
+    'sfd_quarter': ('.sfd.sfd_detector', 'ReducedScaleSFDDetector', {'scale': 0.25}),
+    # int8 S3FD on the CPU, from Wav2Lip/quantize_s3fd.py
+    'sfd_int8': ('.sfd.quantized', 'QuantizedSFDDetector', {}),
+    'cascade': ('.cascade.cascade_detector', 'CascadeDetector', {}),
+}
+
+# name -> (fast backend, verifying backend)
+_FAST_THEN_VERIFY = {
+    'cascade+sfd': ('cascade', 'sfd'),
+    'cascade+sfd_half': ('cascade', 'sfd_half'),
+    'cascade+sfd_int8': ('cascade', 'sfd_int8'),
+}
+
+
+def register_detector(name, module, class_name, **defaults):
+    """Make a FaceDetector subclass available as ``name`` (e.g. for FaceAlignment(face_detector=name)).
+
+    Arguments:
+        name {str} -- backend name
+        module {str} -- module defining the class (absolute, or relative to this package)
+        class_name {str} -- FaceDetector subclass, constructed as cls(device, **kwargs)
+    """
+    _BACKENDS[name] = (module, class_name, defaults)
+
+
+def available_detectors():
+    return sorted(list(_BACKENDS) + list(_FAST_THEN_VERIFY))
+
+
+def create_detector(name, device, **kwargs):
+    """Build the detector backend ``name``.
+
+    Backends take the keyword arguments they know about (min_face_size,
+    tile_size, ...) and ignore the others, so the same options can be passed
+    whatever the backend.
+
+    Arguments:
+        name {str} -- one of ``available_detectors()``
+        device {torch.device} -- device of the network backends
+    """
+    if name in _FAST_THEN_VERIFY:
+        from .fast_verify import FastThenVerifyDetector
+        fast, verify = _FAST_THEN_VERIFY[name]
+        confidence = kwargs.pop('confidence', 0.6)
+        return FastThenVerifyDetector(device, create_detector(fast, device, **kwargs),
+                                      create_detector(verify, device, **kwargs), confidence=confidence,
+                                      verbose=kwargs.get('verbose', False))
+    if name not in _BACKENDS:
+        raise ValueError('Unknown face detector {!r} (available: {})'.format(name, ', '.join(available_detectors())))
+
+    module, class_name, defaults = _BACKENDS[name]
+    cls = getattr(importlib.import_module(module, package=__package__), class_name)
+    options = dict(defaults, **kwargs)
+    # Options only some backends understand
+    if not hasattr(cls, 'detect_from_batch_tiled'):
+        options.pop('tile_size', None)
+    return cls(device, **{k: v for k, v in options.items() if v is not None or k in defaults})
@@ -64,6 +64,51 @@ def nms(dets, thresh):
     return keep
 
 
+def batched_nms(dets, thresh, score_threshold):
+    """NMS + score filtering of a whole batch, as ``[d[nms(d, thresh)] > score_threshold]`` per image.
+
+    Greedy NMS never lets a box suppress a higher scoring one, so boxes at or
+    below ``score_threshold`` cannot change which higher boxes survive: only
+    the prefix of each score-sorted list above the threshold goes through NMS,
+    with all its overlaps computed in one array op. The sort is the same as in
+    ``nms``, so ties are broken identically.
+
+    Args:
+        dets (numpy.ndarray): (num_candidates, BB, 5) boxes and scores, as from batch_detect
+        thresh (float): IoU above which a box is suppressed
+        score_threshold (float): Minimum score of a returned box
+
+    Returns:
+        list: Per image, a (num_faces, 5) array of the kept boxes in descending score order
+    """
+    results = []
+    scores = dets[:, :, 4].T
+    orders = scores.argsort(axis=1)[:, ::-1]
+    counts = (scores > score_threshold).sum(axis=1)
+    for b in range(dets.shape[1]):
+        # Boxes above the threshold are a prefix of the descending order
+        order = orders[b, :counts[b]]
+        boxes = dets[order, b, :]
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+
+        xx1, yy1 = np.maximum(x1[:, None], x1[None, :]), np.maximum(y1[:, None], y1[None, :])
+        xx2, yy2 = np.minimum(x2[:, None], x2[None, :]), np.minimum(y2[:, None], y2[None, :])
+        w, h = np.maximum(0.0, xx2 - xx1 + 1), np.maximum(0.0, yy2 - yy1 + 1)
+        ovr = w * h / (areas[:, None] + areas[None, :] - w * h)
+
+        keep = []
+        suppressed = np.zeros(len(order), dtype=bool)
+        for i in range(len(order)):
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            # Same test as nms (which keeps ovr <= thresh), so NaN overlaps also suppress
+            suppressed[i + 1:] |= ~(ovr[i, i + 1:] <= thresh)
+        results.append(boxes[keep])
+    return results
+
+
 def encode(matched, priors, variances):
     """Encode the variances from the priorbox layers into the ground truth boxes
     we have matched (based on jaccard overlap) with the prior boxes.
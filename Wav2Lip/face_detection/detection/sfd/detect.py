@@ -16,79 +16,120 @@ from .net_s3fd import s3fd
 from .bbox import *
 
 
-def detect(net, img, device):
-    img = img - np.array([104, 117, 123])
-    img = img.transpose(2, 0, 1)
-    img = img.reshape((1,) + img.shape)
-
-    if 'cuda' in device:
-        torch.backends.cudnn.benchmark = True
-
-    img = torch.from_numpy(img).float().to(device)
-    BB, CC, HH, WW = img.size()
-    with torch.no_grad():
-        olist = net(img)
-
-    bboxlist = []
-    for i in range(len(olist) // 2):
-        olist[i * 2] = F.softmax(olist[i * 2], dim=1)
-    olist = [oelem.data.cpu() for oelem in olist]
+# Anchor centres and sizes, per (stride, feature map height, feature map width)
+_prior_cache = {}
+
+# Anchor size of each detection head (4 x stride)
+ANCHOR_SIZES = [16, 32, 64, 128, 256, 512]
+
+
+def first_head_for(min_face_size):
+    """Index of the finest head worth running when no face is smaller than min_face_size pixels.
+
+    A head still finds faces up to about twice its anchor size, so only the
+    heads whose anchors are less than half of min_face_size are skipped.
+    The two coarsest heads are always kept.
+    """
+    if not min_face_size:
+        return 0
+    return min(sum(1 for size in ANCHOR_SIZES if size * 2 < min_face_size), len(ANCHOR_SIZES) - 2)
+
+
+def get_priors(stride, FH, FW):
+    """Priors (FH, FW, 4) of one detection head, in the (cx, cy, w, h) form used by decode."""
+    key = (stride, FH, FW)
+    priors = _prior_cache.get(key)
+    if priors is None:
+        ayc, axc = np.meshgrid(stride / 2 + np.arange(FH) * stride, stride / 2 + np.arange(FW) * stride,
+                               indexing='ij')
+        priors = np.stack([axc, ayc, np.full_like(axc, stride * 4.0), np.full_like(axc, stride * 4.0)], axis=-1)
+        priors = torch.from_numpy(priors.astype(np.float32))
+        _prior_cache[key] = priors
+    return priors
+
+
+def tile_origins(length, tile, overlap):
+    """Start offsets of tiles of size tile covering [0, length), overlapping by at least overlap.
+
+    The last tile is aligned to the end, so every tile is full size.
+    """
+    if length <= tile:
+        return [0]
+    step = max(1, tile - overlap)
+    origins = list(range(0, length - tile, step))
+    return origins + [length - tile]
+
+
+def decode_candidates(olist):
+    """Decode every anchor scoring above 0.05 in any image of the batch.
+
+    Candidates are listed head by head, in (image, row, column) order, with one
+    box per image of the batch for each of them, as in the original per-anchor
+    loop (including its duplicates when several images score at the same
+    anchor), so NMS sees exactly the same input.
+
+    Returns:
+        numpy.ndarray: (num_candidates, BB, 5) float32 array of x1, y1, x2, y2, score
+    """
+    variances = [0.1, 0.2]
+    candidates = []
     for i in range(len(olist) // 2):
         ocls, oreg = olist[i * 2], olist[i * 2 + 1]
+        if ocls is None:
+            # Head skipped for min_face_size
+            continue
         FB, FC, FH, FW = ocls.size()  # feature map size
         stride = 2**(i + 2)    # 4,8,16,32,64,128
-        anchor = stride * 4
-        poss = zip(*np.where(ocls[:, 1, :, :] > 0.05))
-        for Iindex, hindex, windex in poss:
-            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
-            score = ocls[0, 1, hindex, windex]
-            loc = oreg[0, :, hindex, windex].contiguous().view(1, 4)
-            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]])
-            variances = [0.1, 0.2]
-            box = decode(loc, priors, variances)
-            x1, y1, x2, y2 = box[0] * 1.0
-            # cv2.rectangle(imgshow,(int(x1),int(y1)),(int(x2),int(y2)),(0,0,255),1)
-            bboxlist.append([x1, y1, x2, y2, score])
-    bboxlist = np.array(bboxlist)
-    if 0 == len(bboxlist):
-        bboxlist = np.zeros((1, 5))
-
-    return bboxlist
-
-def batch_detect(net, imgs, device):
-    imgs = imgs - np.array([104, 117, 123])
+        index = torch.nonzero(ocls[:, 1, :, :] > 0.05)
+        if len(index) == 0:
+            continue
+        hindex, windex = index[:, 1], index[:, 2]
+        priors = get_priors(stride, FH, FW)[hindex, windex].unsqueeze(1)   # K, 1, 4
+        loc = oreg[:, :, hindex, windex].permute(2, 0, 1).contiguous()    # K, BB, 4
+        score = ocls[:, 1, hindex, windex].t().unsqueeze(2)                # K, BB, 1
+        box = batch_decode(loc, priors, variances)
+        candidates.append(torch.cat([box, score], 2))
+    if not candidates:
+        return None
+    return torch.cat(candidates, 0).numpy()
+
+
+def _input_dtype(net):
+    # Reduced-precision weights (see Wav2Lip.models.registry) take inputs of the same type
+    parameter = next(net.parameters(), None) if isinstance(net, torch.nn.Module) else None
+    return parameter.dtype if parameter is not None else torch.float32
+
+
+def _forward(net, imgs, device, first_head=0):
+    imgs = imgs - np.array([104, 117, 123], dtype=np.float32)
     imgs = imgs.transpose(0, 3, 1, 2)
 
-    if 'cuda' in device:
+    if torch.device(device).type == 'cuda':
         torch.backends.cudnn.benchmark = True
 
-    imgs = torch.from_numpy(imgs).float().to(device)
-    BB, CC, HH, WW = imgs.size()
+    # The NHWC -> NCHW transpose is a view: the batch stays channels_last in memory
+    imgs = torch.from_numpy(imgs).to(device, _input_dtype(net))
     with torch.no_grad():
-        olist = net(imgs)
+        olist = net(imgs, first_head) if first_head else net(imgs)
 
-    bboxlist = []
-    for i in range(len(olist) // 2):
-        olist[i * 2] = F.softmax(olist[i * 2], dim=1)
-    olist = [oelem.data.cpu() for oelem in olist]
     for i in range(len(olist) // 2):
-        ocls, oreg = olist[i * 2], olist[i * 2 + 1]
-        FB, FC, FH, FW = ocls.size()  # feature map size
-        stride = 2**(i + 2)    # 4,8,16,32,64,128
-        anchor = stride * 4
-        poss = zip(*np.where(ocls[:, 1, :, :] > 0.05))
-        for Iindex, hindex, windex in poss:
-            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
-            score = ocls[:, 1, hindex, windex]
-            loc = oreg[:, :, hindex, windex].contiguous().view(BB, 1, 4)
-            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
-            variances = [0.1, 0.2]
-            box = batch_decode(loc, priors, variances)
-            box = box[:, 0] * 1.0
-            # cv2.rectangle(imgshow,(int(x1),int(y1)),(int(x2),int(y2)),(0,0,255),1)
-            bboxlist.append(torch.cat([box, score.unsqueeze(1)], 1).cpu().numpy())
-    bboxlist = np.array(bboxlist)
-    if 0 == len(bboxlist):
+        if olist[i * 2] is not None:
+            olist[i * 2] = F.softmax(olist[i * 2].float(), dim=1)
+    # Decoded in float32 whatever the network ran in
+    return [None if oelem is None else oelem.data.float().cpu() for oelem in olist]
+
+
+def detect(net, img, device, min_face_size=None):
+    img = img.reshape((1,) + img.shape)
+    bboxlist = decode_candidates(_forward(net, img, device, first_head_for(min_face_size)))
+    if bboxlist is None:
+        return np.zeros((1, 5))
+    return bboxlist[:, 0, :]
+
+def batch_detect(net, imgs, device, min_face_size=None):
+    BB = imgs.shape[0]
+    bboxlist = decode_candidates(_forward(net, imgs, device, first_head_for(min_face_size)))
+    if bboxlist is None:
         bboxlist = np.zeros((1, BB, 5))
 
     return bboxlist
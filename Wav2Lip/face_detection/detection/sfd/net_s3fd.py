@@ -14,8 +14,9 @@ class L2Norm(nn.Module):
         self.weight.data += self.scale
 
     def forward(self, x):
-        norm = x.pow(2).sum(dim=1, keepdim=True).sqrt() + self.eps
-        x = x / norm * self.weight.view(1, -1, 1, 1)
+        # Summed in float32, also when the network runs in bfloat16
+        norm = x.float().pow(2).sum(dim=1, keepdim=True).sqrt() + self.eps
+        x = x / norm.to(x.dtype) * self.weight.view(1, -1, 1, 1)
         return x
 
 
@@ -67,7 +68,12 @@ class s3fd(nn.Module):
         self.conv7_2_mbox_conf = nn.Conv2d(256, 2, kernel_size=3, stride=1, padding=1)
         self.conv7_2_mbox_loc = nn.Conv2d(256, 4, kernel_size=3, stride=1, padding=1)
 
-    def forward(self, x):
+    def forward(self, x, first_head=0):
+        """Detection head outputs, finest stride first.
+
+        Heads before ``first_head`` (see ``detect.first_head_for``) are not
+        computed and come out as None, so outputs keep their stride position.
+        """
         h = F.relu(self.conv1_1(x))
         h = F.relu(self.conv1_2(h))
         h = F.max_pool2d(h, 2, 2)
@@ -104,26 +110,30 @@ class s3fd(nn.Module):
         h = F.relu(self.conv7_2(h))
         f7_2 = h
 
-        f3_3 = self.conv3_3_norm(f3_3)
-        f4_3 = self.conv4_3_norm(f4_3)
-        f5_3 = self.conv5_3_norm(f5_3)
-
-        cls1 = self.conv3_3_norm_mbox_conf(f3_3)
-        reg1 = self.conv3_3_norm_mbox_loc(f3_3)
-        cls2 = self.conv4_3_norm_mbox_conf(f4_3)
-        reg2 = self.conv4_3_norm_mbox_loc(f4_3)
-        cls3 = self.conv5_3_norm_mbox_conf(f5_3)
-        reg3 = self.conv5_3_norm_mbox_loc(f5_3)
-        cls4 = self.fc7_mbox_conf(ffc7)
-        reg4 = self.fc7_mbox_loc(ffc7)
+        cls1 = reg1 = cls2 = reg2 = cls3 = reg3 = cls4 = reg4 = None
+        if first_head <= 0:
+            f3_3 = self.conv3_3_norm(f3_3)
+            cls1 = self.conv3_3_norm_mbox_conf(f3_3)
+            reg1 = self.conv3_3_norm_mbox_loc(f3_3)
+
+            # max-out background label
+            chunk = torch.chunk(cls1, 4, 1)
+            bmax = torch.max(torch.max(chunk[0], chunk[1]), chunk[2])
+            cls1 = torch.cat([bmax, chunk[3]], dim=1)
+        if first_head <= 1:
+            f4_3 = self.conv4_3_norm(f4_3)
+            cls2 = self.conv4_3_norm_mbox_conf(f4_3)
+            reg2 = self.conv4_3_norm_mbox_loc(f4_3)
+        if first_head <= 2:
+            f5_3 = self.conv5_3_norm(f5_3)
+            cls3 = self.conv5_3_norm_mbox_conf(f5_3)
+            reg3 = self.conv5_3_norm_mbox_loc(f5_3)
+        if first_head <= 3:
+            cls4 = self.fc7_mbox_conf(ffc7)
+            reg4 = self.fc7_mbox_loc(ffc7)
         cls5 = self.conv6_2_mbox_conf(f6_2)
         reg5 = self.conv6_2_mbox_loc(f6_2)
         cls6 = self.conv7_2_mbox_conf(f7_2)
         reg6 = self.conv7_2_mbox_loc(f7_2)
 
-        # max-out background label
-        chunk = torch.chunk(cls1, 4, 1)
-        bmax = torch.max(torch.max(chunk[0], chunk[1]), chunk[2])
-        cls1 = torch.cat([bmax, chunk[3]], dim=1)
-
         return [cls1, reg1, cls2, reg2, cls3, reg3, cls4, reg4, cls5, reg5, cls6, reg6]
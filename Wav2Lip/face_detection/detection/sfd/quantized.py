@@ -0,0 +1,173 @@
+import copy
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from Wav2Lip.models.quantization import METADATA_FILE, quantized_engine
+from Wav2Lip.models.registry import get_model_registry
+
+from .sfd_detector import SFDDetector
+
+# Written by Wav2Lip/quantize_s3fd.py, next to the float weights
+INT8_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 's3fd.int8.pt')
+
+
+def preprocess(frames):
+    """(B, H, W, 3) frames, as detect_from_batch gets them -> the s3fd input batch, as in detect._forward."""
+    frames = np.asarray(frames, dtype=np.float32) - np.array([104, 117, 123], dtype=np.float32)
+    return torch.from_numpy(frames.transpose(0, 3, 1, 2))
+
+
+class _S3FDGraph(nn.Module):
+    """s3fd with every detection head computed and a tuple output, as FX and tracing need."""
+
+    def __init__(self, net):
+        super(_S3FDGraph, self).__init__()
+        self.net = net
+
+    def forward(self, x):
+        return tuple(self.net(x))
+
+
+def quantize_s3fd(net, frames, engine=None):
+    """Static int8 post-training quantization of the s3fd network.
+
+    The VGG backbone and the detection heads run as int8 convolutions
+    (per-channel weights, ReLU fused); the L2Norm layers and the max-out of
+    the first head stay in float. Activation ranges are observed on ``frames``.
+
+    Arguments:
+        net {s3fd} -- float network in eval mode, on the CPU (left unchanged)
+        frames {list} -- calibration frames with faces in them, (H, W, 3) uint8 arrays
+            as detect_from_batch gets them (RGB, see FaceAlignment.get_detections_for_batch)
+
+    Keyword Arguments:
+        engine {str} -- quantized kernel library (default: best available)
+
+    Returns:
+        torch.nn.Module -- the quantized network (returns a tuple of the 12 head outputs)
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = engine or quantized_engine()
+    torch.backends.quantized.engine = engine
+    graph = _S3FDGraph(copy.deepcopy(net).cpu().eval())
+    prepared = prepare_fx(graph, get_default_qconfig_mapping(engine), (preprocess(frames[:1]),))
+    with torch.no_grad():
+        for frame in frames:
+            prepared(preprocess(frame[None]))
+    return convert_fx(prepared).eval()
+
+
+def save_quantized_s3fd(net, path, metadata, example_frame):
+    """Save a quantized s3fd as TorchScript, with ``metadata`` stored alongside.
+
+    The network is traced on ``example_frame``; it runs on frames of any size.
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(net, preprocess(example_frame[None]))
+    torch.jit.save(traced, path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+
+
+class QuantizedS3FD(object):
+    """An int8 s3fd checkpoint, called like the float network by detect.py (CPU only)."""
+
+    def __init__(self, path):
+        extra_files = {METADATA_FILE: ''}
+        if not os.path.isfile(path):
+            raise FileNotFoundError('No int8 S3FD at {}: create it with Wav2Lip/quantize_s3fd.py'.format(path))
+        module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        if not extra_files[METADATA_FILE]:
+            raise ValueError('{} is not an int8 S3FD checkpoint (see Wav2Lip/quantize_s3fd.py)'.format(path))
+        self.metadata = json.loads(extra_files[METADATA_FILE])
+        engine = self.metadata.get('engine')
+        torch.backends.quantized.engine = engine if engine in torch.backends.quantized.supported_engines \
+            else quantized_engine()
+        self.module = torch.jit.freeze(module.eval())
+        self.nbytes = os.path.getsize(path)
+
+    def __call__(self, x, first_head=0):
+        outputs = list(self.module(x))
+        # The graph computes every head: drop the ones s3fd.forward skips for first_head
+        # (up to fc7 included), so the detections match the float network's
+        for i in range(2 * first_head):
+            outputs[i] = None
+        return outputs
+
+
+class QuantizedSFDDetector(SFDDetector):
+    """SFDDetector on an int8 s3fd, on the CPU whatever ``device`` is.
+
+    Detections are filtered, decoded and merged exactly as for the float
+    network; how far they are from its boxes is reported by quantize_s3fd.py.
+    """
+
+    def __init__(self, device, path_to_detector=INT8_PATH, **kwargs):
+        if torch.device(device).type != 'cpu':
+            print('The int8 S3FD runs on the CPU')
+        super(QuantizedSFDDetector, self).__init__(torch.device('cpu'), path_to_detector=path_to_detector, **kwargs)
+
+    def _load_network(self, path_to_detector, optimize):
+        # Already folded and fused when it was quantized: optimize and precision do not apply
+        return get_model_registry().get('s3fd-int8', path_to_detector, self.device,
+                                        loader=lambda path, device: QuantizedS3FD(path))
+
+
+def box_iou(a, b):
+    """(N, M) IoU of x1, y1, x2, y2 boxes a (N, 4) and b (M, 4)."""
+    x1, y1 = np.maximum(a[:, None, 0], b[None, :, 0]), np.maximum(a[:, None, 1], b[None, :, 1])
+    x2, y2 = np.minimum(a[:, None, 2], b[None, :, 2]), np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def box_agreement(reference, detections, iou_threshold=0.5):
+    """How closely a detector's boxes match reference boxes (e.g. int8 against float S3FD).
+
+    Both are per-frame outputs of ``detect_from_batch``, i.e. already cut at
+    the score threshold. Boxes are matched greedily, highest IoU first.
+
+    Arguments:
+        reference {list} -- per frame, (N, 5) x1, y1, x2, y2, score arrays of the reference
+        detections {list} -- the same for the detector under test
+
+    Keyword Arguments:
+        iou_threshold {float} -- smallest IoU of a match
+
+    Returns:
+        dict -- recall and precision against the reference, mean IoU and mean
+            absolute score difference of the matched boxes, and the share of
+            frames with as many faces as the reference
+    """
+    faces = found = matched = same_count = 0
+    ious, score_diffs = [], []
+    for ref, det in zip(reference, detections):
+        ref, det = np.asarray(ref, dtype=np.float32).reshape(-1, 5), np.asarray(det, dtype=np.float32).reshape(-1, 5)
+        faces += len(ref)
+        found += len(det)
+        same_count += len(ref) == len(det)
+        if not len(ref) or not len(det):
+            continue
+        overlaps = box_iou(ref[:, :4], det[:, :4])
+        while overlaps.size and overlaps.max() >= iou_threshold:
+            i, j = np.unravel_index(overlaps.argmax(), overlaps.shape)
+            ious.append(float(overlaps[i, j]))
+            score_diffs.append(abs(float(ref[i, 4] - det[j, 4])))
+            overlaps[i, :] = -1
+            overlaps[:, j] = -1
+            matched += 1
+    return {
+        'frames': len(reference),
+        'faces': faces,
+        'recall': matched / faces if faces else 1.0,
+        'precision': matched / found if found else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+        'mean_score_diff': float(np.mean(score_diffs)) if score_diffs else 0.0,
+        'same_face_count': same_count / len(reference) if reference else 1.0,
+    }
@@ -2,6 +2,8 @@ import os
 import cv2
 from torch.utils.model_zoo import load_url
 
+from Wav2Lip.models.registry import get_model_registry
+
 from ..core import FaceDetector
 
 from .net_s3fd import s3fd
@@ -13,38 +15,125 @@ models_urls = {
 }
 
 
+def load_s3fd(path_to_detector, device):
+    if not os.path.isfile(path_to_detector):
+        model_weights = load_url(models_urls['s3fd'])
+    else:
+        model_weights = torch.load(path_to_detector, map_location=lambda storage, loc: storage)
+
+    net = s3fd()
+    net.load_state_dict(model_weights)
+    return net.to(device).eval()
+
+
 class SFDDetector(FaceDetector):
-    def __init__(self, device, path_to_detector=os.path.join(os.path.dirname(os.path.abspath(__file__)), 's3fd.pth'), verbose=False):
+    # Minimum confidence of a returned face
+    score_threshold = 0.5
+
+    def __init__(self, device, path_to_detector=os.path.join(os.path.dirname(os.path.abspath(__file__)), 's3fd.pth'), verbose=False,
+                 min_face_size=None, tile_size=None, optimize=True, precision='fp32'):
         super(SFDDetector, self).__init__(device, verbose)
 
-        # Initialise the face detector
-        if not os.path.isfile(path_to_detector):
-            model_weights = load_url(models_urls['s3fd'])
-        else:
-            model_weights = torch.load(path_to_detector)
+        # Smallest face (in pixels of the input image) to look for; the detection heads of
+        # much smaller anchors are not computed (None = all heads)
+        self.min_face_size = min_face_size
+        # Frames larger than this (in either dimension) are detected in overlapping tiles
+        # of this size (None = whole frames)
+        self.tile_size = tile_size
+        self.tile_overlap = None
+        self.tile_batch_size = 8
+
+        # Weight precision of the network ('fp32', or 'bf16' on recent CPUs; see Wav2Lip.models.registry)
+        self.precision = precision
+        self.face_detector = self._load_network(path_to_detector, optimize)
 
-        self.face_detector = s3fd()
-        self.face_detector.load_state_dict(model_weights)
-        self.face_detector.to(device)
-        self.face_detector.eval()
+    def _load_network(self, path_to_detector, optimize):
+        # Shared with every other SFDDetector on this device; optimize folds the
+        # L2Norm scales into the heads and runs channels_last
+        return get_model_registry().get('s3fd', path_to_detector, self.device, precision=self.precision,
+                                        loader=load_s3fd, optimize=optimize)
 
     def detect_from_image(self, tensor_or_path):
         image = self.tensor_or_path_to_ndarray(tensor_or_path)
 
-        bboxlist = detect(self.face_detector, image, device=self.device)
-        keep = nms(bboxlist, 0.3)
-        bboxlist = bboxlist[keep, :]
-        bboxlist = [x for x in bboxlist if x[-1] > 0.5]
-
-        return bboxlist
+        bboxlist = detect(self.face_detector, image, device=self.device, min_face_size=self.min_face_size)
+        return batched_nms(bboxlist[:, None, :], 0.3, self.score_threshold)[0]
 
     def detect_from_batch(self, images):
-        bboxlists = batch_detect(self.face_detector, images, device=self.device)
-        keeps = [nms(bboxlists[:, i, :], 0.3) for i in range(bboxlists.shape[1])]
-        bboxlists = [bboxlists[keep, i, :] for i, keep in enumerate(keeps)]
-        bboxlists = [[x for x in bboxlist if x[-1] > 0.5] for bboxlist in bboxlists]
+        if self.tile_size and max(images.shape[1:3]) > self.tile_size:
+            return self.detect_from_batch_tiled(images)
+        bboxlists = batch_detect(self.face_detector, images, device=self.device, min_face_size=self.min_face_size)
+        return batched_nms(bboxlists, 0.3, self.score_threshold)
+
+    def _detect_chunked(self, images):
+        """Whole-image detection of a list of same-size images, tile_batch_size at a time."""
+        results = []
+        for i in range(0, len(images), self.tile_batch_size):
+            bboxlists = batch_detect(self.face_detector, np.stack(images[i:i + self.tile_batch_size]),
+                                     device=self.device, min_face_size=self.min_face_size)
+            results.extend(batched_nms(bboxlists, 0.3, self.score_threshold))
+        return results
+
+    def detect_from_batch_tiled(self, images, tile_size=None, overlap=None):
+        """Detect faces in large frames through overlapping tiles.
+
+        Every frame is cut into tile_size x tile_size tiles overlapping by
+        ``overlap`` pixels, and the tiles of all the frames go through the
+        network tile_batch_size at a time, so peak memory depends on the tile
+        size, not on the frame size. Boxes touching an inner tile border are
+        dropped (the face lies whole in the neighbouring tile if it is smaller
+        than the overlap). Larger faces are found on a copy of the frame
+        downscaled to tile_size. All boxes of a frame then go through one
+        global NMS.
+
+        Arguments:
+            images {numpy.ndarray} -- (B, H, W, 3) frames
+
+        Keyword Arguments:
+            tile_size {int} -- tile side (default: self.tile_size)
+            overlap {int} -- tile overlap (default: a quarter of the tile)
+
+        Returns:
+            list -- per frame, a (num_faces, 5) array as from detect_from_batch
+        """
+        tile_size = tile_size or self.tile_size
+        overlap = overlap or self.tile_overlap or tile_size // 4
+        B, H, W = images.shape[:3]
+        th, tw = min(tile_size, H), min(tile_size, W)
+        ys, xs = tile_origins(H, th, overlap), tile_origins(W, tw, overlap)
+        tiles = [(b, y, x) for b in range(B) for y in ys for x in xs]
+        margin = 2
+
+        per_frame = [[] for _ in range(B)]
+        detections = self._detect_chunked([images[b, y:y + th, x:x + tw] for b, y, x in tiles])
+        for (b, y, x), boxes in zip(tiles, detections):
+            boxes = np.array(boxes, dtype=np.float32).reshape(-1, 5)
+            cut = np.zeros(len(boxes), dtype=bool)
+            if x > 0: cut |= boxes[:, 0] <= margin
+            if y > 0: cut |= boxes[:, 1] <= margin
+            if x + tw < W: cut |= boxes[:, 2] >= tw - margin
+            if y + th < H: cut |= boxes[:, 3] >= th - margin
+            boxes = boxes[~cut]
+            boxes[:, [0, 2]] += x
+            boxes[:, [1, 3]] += y
+            per_frame[b].append(boxes)
+
+        if max(H, W) > tile_size:
+            # Faces larger than the overlap are cut in every tile: find them on the downscaled frame
+            scale = tile_size / float(max(H, W))
+            size = (max(1, int(round(W * scale))), max(1, int(round(H * scale))))
+            small = [cv2.resize(image, size, interpolation=cv2.INTER_AREA) for image in images]
+            for b, boxes in enumerate(self._detect_chunked(small)):
+                boxes = np.array(boxes, dtype=np.float32).reshape(-1, 5)
+                boxes[:, [0, 2]] *= W / float(size[0])
+                boxes[:, [1, 3]] *= H / float(size[1])
+                per_frame[b].append(boxes)
 
-        return bboxlists
+        results = []
+        for boxes in per_frame:
+            boxes = np.concatenate(boxes) if boxes else np.zeros((0, 5), dtype=np.float32)
+            results.append(batched_nms(boxes[:, None, :], 0.3, self.score_threshold)[0] if len(boxes) else boxes)
+        return results
 
     @property
     def reference_scale(self):
@@ -57,3 +146,46 @@ class SFDDetector(FaceDetector):
     @property
     def reference_y_shift(self):
         return 0
+
+
+class ReducedScaleSFDDetector(SFDDetector):
+    """S3FD run on images downscaled by ``scale``, with boxes mapped back to the input image.
+
+    Detection cost falls with the square of the scale; faces smaller than
+    about 16 / scale pixels are lost.
+    """
+
+    def __init__(self, device, scale=0.5, min_face_size=None, **kwargs):
+        super(ReducedScaleSFDDetector, self).__init__(device, **kwargs)
+        self.scale = scale
+        self.input_min_face_size = min_face_size
+
+    @property
+    def min_face_size(self):
+        # Given in pixels of the input image, applied to the downscaled one
+        return self.input_min_face_size * self.scale if self.input_min_face_size else None
+
+    @min_face_size.setter
+    def min_face_size(self, value):
+        self.input_min_face_size = value
+
+    def _resize(self, image):
+        h, w = image.shape[:2]
+        size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    def _map_back(self, boxes, shape, small_shape):
+        boxes = np.array(boxes, dtype=np.float32).reshape(-1, 5)
+        boxes[:, [0, 2]] *= shape[1] / float(small_shape[1])
+        boxes[:, [1, 3]] *= shape[0] / float(small_shape[0])
+        return boxes
+
+    def detect_from_image(self, tensor_or_path):
+        image = self.tensor_or_path_to_ndarray(tensor_or_path)
+        small = self._resize(image)
+        return self._map_back(super(ReducedScaleSFDDetector, self).detect_from_image(small), image.shape, small.shape)
+
+    def detect_from_batch(self, images):
+        small = np.stack([self._resize(image) for image in images])
+        return [self._map_back(boxes, images.shape[1:3], small.shape[1:3])
+                for boxes in super(ReducedScaleSFDDetector, self).detect_from_batch(small)]
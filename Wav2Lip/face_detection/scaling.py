@@ -0,0 +1,167 @@
+import time
+
+import cv2
+import numpy as np
+
+# Marks a frame wrap has to detect (None is a valid detection: no face)
+_NOT_PROBED = object()
+
+
+class DetectionScalePolicy(object):
+    """Run face detection on frames scaled so the face is about ``target_face_size`` pixels.
+
+    S3FD finds faces from ~16 px to several hundred pixels, so a face that
+    covers a third of a 4K frame is found just as well on a frame a tenth of
+    the size, for a hundredth of the compute. ``choose`` probes a few frames
+    (themselves downscaled to ``probe_size``) to measure the face, picks the
+    scale, and ``wrap`` turns a detector into one that runs at that scale and
+    returns boxes in full-resolution coordinates. Frames are never upscaled.
+    The probed frames are not detected again: ``wrap`` reuses their probe
+    detections when the probe ran at the chosen scale or a finer one.
+
+    Keyword Arguments:
+        target_face_size {int} -- face size (longest side, in pixels) to scale frames to
+        probe_size {int} -- longest side of the probe frames
+        probe_frames {int} -- number of frames probed
+        min_scale {float} -- lower bound of the scale
+        scale {float} -- fixed scale (no probing); None picks it automatically
+    """
+
+    def __init__(self, target_face_size=160, probe_size=1280, probe_frames=3, min_scale=0.05, scale=None):
+        self.target_face_size = target_face_size
+        self.probe_size = probe_size
+        self.probe_frames = probe_frames
+        self.min_scale = min_scale
+        self.fixed_scale = scale
+        self.scale = 1.0 if scale is None else float(scale)
+        self.face_size = None
+        self.probe_seconds = 0.0
+        self.detect_seconds = 0.0
+        self.frames = 0
+        self.reused_frames = 0
+        # (frame, probe scale, detect_fn output in full-resolution coordinates) of every probed frame
+        self._probed = []
+
+    @staticmethod
+    def resize(frame, scale):
+        if scale == 1.0:
+            return frame
+        h, w = frame.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def unscale(boxes, frame, scaled):
+        """Map (..., 4+) boxes found on ``scaled`` back to the coordinates of ``frame``."""
+        if scaled is frame:
+            return boxes
+        boxes = np.array(boxes, dtype=np.float32)
+        sy, sx = (np.array(frame.shape[:2], dtype=np.float32) / np.array(scaled.shape[:2], dtype=np.float32))
+        boxes[..., [0, 2]] *= sx
+        boxes[..., [1, 3]] *= sy
+        return boxes
+
+    @staticmethod
+    def largest(boxes):
+        """Largest of a frame's boxes: one (x1, y1, x2, y2, ...) box, an (N, 4+) array or None."""
+        if boxes is None:
+            return None
+        boxes = np.asarray(boxes, dtype=np.float32)
+        if boxes.ndim == 1:
+            return boxes if boxes.size else None
+        if not len(boxes):
+            return None
+        return boxes[np.argmax((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))]
+
+    def choose(self, detect_fn, frames):
+        """Pick the scale from the faces found in a few of ``frames``.
+
+        Arguments:
+            detect_fn {callable} -- takes a list of frames, returns per frame an
+                (x1, y1, x2, y2, score) box, an array of boxes or None (the detector
+                later passed to ``wrap``, whose outputs are reused)
+            frames {list} -- the first frames of the clip
+
+        Returns:
+            float -- the scale (1.0 when no face was found)
+        """
+        if self.fixed_scale is not None or not frames:
+            return self.scale
+
+        start = time.perf_counter()
+        step = max(1, len(frames) // self.probe_frames)
+        sample = frames[::step][:self.probe_frames]
+        probe_scale = min(1.0, self.probe_size / float(max(sample[0].shape[:2])))
+
+        sizes = self._face_sizes(detect_fn, sample, probe_scale)
+        if not sizes and probe_scale < 1.0:
+            # Faces too small for the probe resolution
+            sizes = self._face_sizes(detect_fn, sample[:1], 1.0)
+        self.probe_seconds = time.perf_counter() - start
+
+        if sizes:
+            self.face_size = float(np.median(sizes))
+            self.scale = float(np.clip(self.target_face_size / self.face_size, self.min_scale, 1.0))
+        else:
+            self.scale = 1.0
+        return self.scale
+
+    def _face_sizes(self, detect_fn, frames, scale):
+        scaled = [self.resize(frame, scale) for frame in frames]
+        sizes = []
+        for frame, small, boxes in zip(frames, scaled, detect_fn(scaled)):
+            boxes = None if boxes is None else self.unscale(boxes, frame, small)
+            self._probed.append((frame, scale, boxes))
+            box = self.largest(boxes)
+            if box is not None:
+                x1, y1, x2, y2 = box[:4]
+                sizes.append(max(x2 - x1, y2 - y1))
+        return sizes
+
+    def _take_probed(self, frame):
+        """Probe detections of ``frame`` if it was probed at the chosen scale or finer, else _NOT_PROBED."""
+        matches = [entry for entry in self._probed if entry[0] is frame and entry[1] >= self.scale]
+        if not matches:
+            return _NOT_PROBED
+        # Each frame is detected once per clip: the entries are not needed any more
+        self._probed = [entry for entry in self._probed if entry[0] is not frame]
+        return max(matches, key=lambda entry: entry[1])[2]
+
+    def wrap(self, detect_fn):
+        """``detect_fn`` running on frames at the chosen scale, returning full-resolution boxes.
+
+        ``detect_fn`` may return per frame a box, an array of boxes or None.
+        """
+        def detect(frames):
+            start = time.perf_counter()
+            boxes = [self._take_probed(frame) for frame in frames] if self._probed else [_NOT_PROBED] * len(frames)
+            todo = [i for i, box in enumerate(boxes) if box is _NOT_PROBED]
+            self.reused_frames += len(frames) - len(todo)
+            if todo:
+                scaled = [self.resize(frames[i], self.scale) for i in todo]
+                for i, small, box in zip(todo, scaled, detect_fn(scaled)):
+                    boxes[i] = None if box is None else self.unscale(box, frames[i], small)
+            self.detect_seconds += time.perf_counter() - start
+            self.frames += len(frames)
+            return boxes
+        return detect
+
+    def report(self):
+        # Not measured: S3FD is fully convolutional, so its cost is taken to grow with the number of pixels
+        full_resolution_seconds = self.detect_seconds / (self.scale * self.scale)
+        return {
+            'scale': self.scale,
+            'face_size': self.face_size,
+            'frames': self.frames,
+            'reused_frames': self.reused_frames,
+            'detect_seconds': self.detect_seconds,
+            'probe_seconds': self.probe_seconds,
+            'estimated_seconds_saved': full_resolution_seconds - self.detect_seconds - self.probe_seconds,
+        }
+
+    def print_report(self):
+        report = self.report()
+        face = '{:.0f} px face'.format(report['face_size']) if report['face_size'] else 'no face probed'
+        print('Face detection scale: {:.3f} ({}), {:.2f}s detecting, about {:.2f}s saved vs full resolution '
+              '(estimated from the pixel count)'
+              .format(report['scale'], face, report['detect_seconds'], report['estimated_seconds_saved']))
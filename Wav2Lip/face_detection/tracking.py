@@ -0,0 +1,224 @@
+import itertools
+
+import cv2
+import numpy as np
+
+# Where the box of a frame came from
+DETECTED, TRACKED, INTERPOLATED, MISSING = 0, 1, 2, 3
+
+
+def smooth_boxes(boxes, T=5, shots=None):
+    """Average every box with the next T - 1 ones, in O(N).
+
+    Same window as the old ``get_smoothened_boxes`` loop (the last T boxes
+    for the tail of the clip), but always over the original boxes: the loop
+    averaged in place, so its tail windows read boxes it had already
+    smoothed. The result keeps the dtype of ``boxes`` (int boxes are
+    truncated, as before).
+
+    Arguments:
+        boxes {numpy.ndarray} -- (N, 4) boxes
+        T {int} -- window length
+
+    Keyword Arguments:
+        shots {list} -- [start, end) frame ranges smoothed independently, so no
+            window spans a cut (default: the whole clip is one shot)
+
+    Returns:
+        numpy.ndarray -- (N, 4) smoothed boxes
+    """
+    boxes = np.asarray(boxes)
+    n = len(boxes)
+    if shots:
+        # Only the cuts matter: the last shot runs to the end of the clip
+        cuts = [0] + [start for start, _ in shots if 0 < start < n] + [n]
+        smoothed = boxes.copy()
+        for start, end in zip(cuts[:-1], cuts[1:]):
+            smoothed[start:end] = smooth_boxes(boxes[start:end], T)
+        return smoothed
+
+    if n == 0:
+        return boxes.copy()
+
+    csum = np.concatenate([np.zeros((1,) + boxes.shape[1:]), np.cumsum(boxes, axis=0, dtype=np.float64)])
+    start = np.minimum(np.arange(n), max(n - T, 0))
+    end = np.minimum(start + T, n)
+    means = (csum[end] - csum[start]) / (end - start)[:, None]
+    return means.astype(boxes.dtype)
+
+
+def interpolate_boxes(tracks):
+    """Fill NaN rows of a (N, C) track by linear interpolation between the known rows.
+
+    Rows before the first (after the last) known row take its value.
+
+    Returns:
+        numpy.ndarray -- filled copy of ``tracks`` (unchanged if no row is known)
+    """
+    tracks = np.array(tracks, dtype=np.float32)
+    known = ~np.isnan(tracks[:, 0])
+    if known.all() or not known.any():
+        return tracks
+    frames = np.arange(len(tracks))
+    for c in range(tracks.shape[1]):
+        tracks[~known, c] = np.interp(frames[~known], frames[known], tracks[known, c])
+    return tracks
+
+
+class KeyframeFaceTracker(object):
+    """Run the face detector on keyframes only and track the face in between.
+
+    Every ``keyframe_interval``-th frame goes through the detector (in
+    batches); the frames in between are tracked by template matching of the
+    last detected face inside an enlarged region around the previous box.
+    When the match confidence drops below ``min_confidence`` the frame is
+    sent to the detector instead. Frames where neither finds a face are
+    interpolated from their neighbours.
+
+    Arguments:
+        detect_fn {callable} -- takes a list of frames, returns per frame an
+            (x1, y1, x2, y2, score) box or None
+
+    Keyword Arguments:
+        keyframe_interval {int} -- run the detector every K frames (1 = every frame)
+        min_confidence {float} -- minimum normalized cross-correlation of a tracked box
+        search_margin {float} -- search region around the previous box, as a fraction of its size
+        batch_size {int} -- frames read (and keyframes detected) at a time
+        template_size {int} -- faces are tracked at (at most) this width, in pixels
+    """
+
+    def __init__(self, detect_fn, keyframe_interval=5, min_confidence=0.6, search_margin=0.5, batch_size=16,
+                 template_size=48):
+        self.detect_fn = detect_fn
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.min_confidence = min_confidence
+        self.search_margin = search_margin
+        self.batch_size = max(1, int(batch_size))
+        self.template_size = template_size
+        self.reset()
+
+    def reset(self):
+        """Forget the tracked face and the statistics."""
+        self.detector_calls = 0
+        self.sources = np.zeros(0, dtype=np.int8)
+        self._template = None
+        self._box = None
+
+    def _detect(self, frames):
+        self.detector_calls += len(frames)
+        return self.detect_fn(frames)
+
+    def _set_template(self, frame, box):
+        x1, y1, x2, y2 = [int(round(v)) for v in box[:4]]
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+        if x2 - x1 < 4 or y2 - y1 < 4:
+            self._template = None
+            return
+        scale = min(1.0, self.template_size / float(x2 - x1))
+        gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        self._template = (cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale,
+                          (x2 - x1, y2 - y1))
+        self._box = np.array([x1, y1, x2, y2], dtype=np.float32)
+
+    def _track(self, frame):
+        """Locate the template near the previous box; returns (box, confidence)."""
+        if self._template is None or self._box is None:
+            return None, 0.0
+        template, scale, (bw, bh) = self._template
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = self._box
+        mx, my = bw * self.search_margin, bh * self.search_margin
+        rx1, ry1 = int(max(0, x1 - mx)), int(max(0, y1 - my))
+        rx2, ry2 = int(min(w, x2 + mx)), int(min(h, y2 + my))
+
+        roi = cv2.cvtColor(frame[ry1:ry2, rx1:rx2], cv2.COLOR_BGR2GRAY)
+        roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else roi
+        if roi.shape[0] < template.shape[0] or roi.shape[1] < template.shape[1]:
+            return None, 0.0
+
+        response = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, (dx, dy) = cv2.minMaxLoc(response)
+        nx1, ny1 = rx1 + dx / scale, ry1 + dy / scale
+        return np.array([nx1, ny1, nx1 + bw, ny1 + bh], dtype=np.float32), float(confidence)
+
+    def track(self, frames, start_index=0):
+        """Boxes of every frame.
+
+        Every call starts from scratch (e.g. once per shot); the statistics
+        add up over calls until ``reset``.
+
+        Arguments:
+            frames {iterable} -- frames (a list or a stream); only batch_size are held at a time
+
+        Keyword Arguments:
+            start_index {int} -- index of the first frame in the clip (sets the keyframe phase)
+
+        Returns:
+            numpy.ndarray -- (N, 5) float32 boxes and scores (detector score for detected
+            frames, match confidence for tracked ones); all NaN if no face was ever found.
+            ``sources`` tells for every frame whether it was DETECTED, TRACKED,
+            INTERPOLATED or MISSING.
+        """
+        self._template, self._box = None, None
+        tracks, sources = [], []
+        frame_iter = iter(frames)
+        index = start_index
+        while True:
+            batch = list(itertools.islice(frame_iter, self.batch_size))
+            if not batch:
+                break
+
+            keyframes = [i for i in range(len(batch)) if (index + i) % self.keyframe_interval == 0]
+            detections = dict(zip(keyframes, self._detect([batch[i] for i in keyframes]))) if keyframes else {}
+
+            for i, frame in enumerate(batch):
+                box, source = detections.get(i), DETECTED
+                if i not in detections or box is None:
+                    tracked, confidence = self._track(frame)
+                    if tracked is not None and confidence >= self.min_confidence:
+                        box, source = np.append(tracked, confidence), TRACKED
+                    elif i not in detections:
+                        # Tracking lost: ask the detector
+                        box = self._detect([frame])[0]
+
+                if box is None:
+                    tracks.append(np.full(5, np.nan, dtype=np.float32))
+                    sources.append(MISSING)
+                    continue
+
+                box = np.asarray(box, dtype=np.float32)[:5]
+                if source == DETECTED:
+                    self._set_template(frame, box)
+                else:
+                    self._box = box[:4]
+                tracks.append(box)
+                sources.append(source)
+
+            index += len(batch)
+
+        tracks = np.array(tracks, dtype=np.float32).reshape(-1, 5)
+        sources = np.array(sources, dtype=np.int8)
+        missing = sources == MISSING
+        if missing.any() and not missing.all():
+            tracks = interpolate_boxes(tracks)
+            sources[missing] = INTERPOLATED
+        self.sources = np.concatenate([self.sources, sources])
+        return tracks
+
+    def stats(self):
+        frames = len(self.sources)
+        return {
+            'frames': frames,
+            'detector_calls': self.detector_calls,
+            'calls_saved': frames - self.detector_calls,
+            'tracked': int((self.sources == TRACKED).sum()),
+            'interpolated': int((self.sources == INTERPOLATED).sum()),
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        saved = 100.0 * stats['calls_saved'] / stats['frames'] if stats['frames'] else 0.0
+        print('Face detection: {} detector calls for {} frames ({} saved, {:.0f}%), {} tracked, {} interpolated'
+              .format(stats['detector_calls'], stats['frames'], stats['calls_saved'], saved, stats['tracked'],
+                      stats['interpolated']))
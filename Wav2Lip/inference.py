@@ -6,14 +6,22 @@ import cv2
 import subprocess
 from tqdm import tqdm
 from glob import glob
+from itertools import chain, islice
 import torch, face_detection
-from Wav2Lip.models.wav2lip import Wav2Lip
-import platform
-import imageio_ffmpeg as ffmpeg
+from Wav2Lip.models.backends import BACKENDS, load_backend
+from Wav2Lip.models.registry import PRECISIONS, get_model_registry
+from Wav2Lip.models.feature_cache import FaceFeatureCache
+from Wav2Lip.models.quantization import CalibrationRecorder
 from Wav2Lip import audio
-
-
-ffmpeg_path = "C:\\ffmpeg\\ffmpeg.exe"
+from face_detection.detection.pool import DetectionPool
+from face_detection.detection.sfd.sfd_detector import SFDDetector
+from face_detection.scaling import DetectionScalePolicy
+from face_detection.tracking import KeyframeFaceTracker, interpolate_boxes, smooth_boxes
+from app.core.cache import FaceTrackCache, MelCache
+from app.core.frame_decoder import FFmpegFrameDecoder, ffmpeg_decoder_available, probe_video
+from app.core.pipeline import StagedPipeline
+from app.core.shot_detection import ShotBoundaryDetector
+from app.core.video_writer import JobWorkspace, find_ffmpeg, open_video_writer
 
 
 parser = argparse.ArgumentParser(description='Inference code to lip-sync videos in the wild using Wav2Lip models')
@@ -57,6 +65,75 @@ parser.add_argument('--rotate', default=False, action='store_true',
 
 parser.add_argument('--nosmooth', default=False, action='store_true',
 					help='Prevent smoothing face detections over a short temporal window')
+parser.add_argument('--detect_every', type=int, default=1,
+					help='Run the face detector every N frames and track the face in between (1 = every frame). '
+					'Frames where tracking is unsure still go through the detector')
+parser.add_argument('--detect_scale', type=str, default='auto',
+					help='Scale frames are resized by for face detection (boxes are mapped back). auto probes the '
+					'first frames and scales the face to about 160 px; 1 detects at full resolution')
+parser.add_argument('--min_face_size', type=int, default=None,
+					help='Smallest face to detect, in pixels of the input video. S3FD then skips its finest detection '
+					'heads, whose anchors are far smaller (e.g. 80 skips the stride 4 and 8 heads)')
+parser.add_argument('--tile_size', type=int, default=None,
+					help='Detect faces in overlapping tiles of this size on frames larger than it (e.g. 1024 for 4K), '
+					'keeping detection memory bounded without downscaling away small faces. Also used automatically '
+					'(1024) when detection runs out of memory at batch size 1')
+parser.add_argument('--face_detector', type=str, default='sfd', choices=face_detection.available_detectors(),
+					help='Face detector backend. cascade is an OpenCV Haar cascade (fast on CPU, looser boxes); '
+					'sfd_half / sfd_quarter run S3FD at reduced scale; sfd_int8 runs the int8 S3FD written by '
+					'quantize_s3fd.py on the CPU; cascade+sfd only runs S3FD on frames where the cascade is unsure')
+parser.add_argument('--detect_workers', type=int, default=0,
+					help='Run CPU face detection in this many worker processes, each with its own detector '
+					'(frames are handed over through shared memory). 0 detects in this process')
+parser.add_argument('--detect_threads', type=int, default=None,
+					help='Torch threads of each detection worker (default: CPU cores / detect_workers)')
+parser.add_argument('--no_optimize', default=False, action='store_true',
+					help='Run Wav2Lip and S3FD as trained, without folding BatchNorm / L2Norm scales into the '
+					'convolutions and switching them to channels_last')
+parser.add_argument('--backend', default='eager', choices=BACKENDS,
+					help='How Wav2Lip runs: eager PyTorch, TorchScript, or ONNX Runtime (CPU). Exported models '
+					'are cached next to the checkpoint and rebuilt when it changes. int8 runs a checkpoint '
+					'quantized by quantize.py (pass it as --checkpoint_path)')
+parser.add_argument('--precision', default='fp32', choices=list(PRECISIONS),
+					help='Weight precision of Wav2Lip (eager backend) and S3FD. bf16 pays off on CPUs with native '
+					'bfloat16 (AVX512-BF16 / AMX); fp16 is for GPUs')
+parser.add_argument('--record_calibration', type=str, default=None,
+					help='Save a sample of the face crops and mel windows fed to Wav2Lip to this directory, '
+					'as int8 calibration data for quantize.py')
+parser.add_argument('--shots', default=False, action='store_true',
+					help='Detect the cuts of the video and restart face tracking and box smoothing at each of them')
+parser.add_argument('--shot_index', type=str, default=None,
+					help='Where the shot index of --shots is saved (default: cache directory)')
+
+parser.add_argument('--pipeline_queue_size', type=int, default=4,
+					help='Number of batches buffered between the decode, inference and encode stages')
+
+parser.add_argument('--preset', type=str, default='medium',
+					help='x264 encoder preset of the output video (ultrafast ... veryslow)')
+parser.add_argument('--crf', type=int, default=18,
+					help='x264 constant rate factor of the output video (lower is better quality)')
+parser.add_argument('--encoder_threads', type=int, default=0,
+					help='Number of ffmpeg encoder threads (0 = auto)')
+parser.add_argument('--workdir', type=str, default=None,
+					help='Parent directory of the per-job working directory (default: system temp dir)')
+
+parser.add_argument('--decoder', type=str, default='auto', choices=['auto', 'ffmpeg', 'opencv'],
+					help='Video decoder. ffmpeg applies resize_factor, rotate and crop inside the decoder; '
+					'auto uses ffmpeg when available')
+
+parser.add_argument('--stream', default=False, action='store_true',
+					help='Decode the video in two streaming passes (face detection, then inference) instead of '
+					'loading every frame into memory. Peak memory is bounded by the batch sizes, not the clip length')
+
+parser.add_argument('--face_feature_cache_mb', type=int, default=512,
+					help='Memory budget for reusing face-encoder features of repeated frames (static image or looped video); 0 disables')
+
+parser.add_argument('--cache_dir', type=str, default=None,
+					help='Root of the on-disk caches (default: $LIPSYNC_CACHE_DIR or ~/.cache/lip-sync-program)')
+parser.add_argument('--no_face_cache', default=False, action='store_true',
+					help='Always run face detection instead of reusing the boxes of an already processed video')
+parser.add_argument('--no_mel_cache', default=False, action='store_true',
+					help='Always recompute the mel spectrogram instead of reusing the one of an already processed audio')
 
 args = parser.parse_args()
 args.img_size = 96
@@ -64,63 +141,170 @@ args.img_size = 96
 if os.path.isfile(args.face) and args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
 	args.static = True
 
-def get_smoothened_boxes(boxes, T):
-	for i in range(len(boxes)):
-		if i + T > len(boxes):
-			window = boxes[len(boxes) - T:]
+if args.decoder == 'auto':
+	args.decoder = 'ffmpeg' if ffmpeg_decoder_available() else 'opencv'
+
+face_cache = None if args.no_face_cache else FaceTrackCache(args.cache_dir)
+mel_cache = None if args.no_mel_cache else MelCache(args.cache_dir)
+
+def face_cache_key():
+	"""Face-track cache key of the input video and every setting that changes its boxes."""
+	if face_cache is None:
+		return None
+	return face_cache.key(args.face, pads=args.pads, resize_factor=args.resize_factor, crop=args.crop,
+						rotate=args.rotate, decoder=args.decoder, detector=args.face_detector,
+						threshold=SFDDetector.score_threshold, detect_every=args.detect_every,
+						detect_scale=args.detect_scale, min_face_size=args.min_face_size, tile_size=args.tile_size,
+						shots=args.shots and not args.static,
+						# fp32 keys stay as they were before --precision
+						**({'precision': args.precision} if args.precision != 'fp32' else {}))
+
+shot_index = None
+
+def shot_ranges():
+	"""[start, end) frame range of every shot of the input video, or None without --shots."""
+	global shot_index
+	if not args.shots or args.static:
+		return None
+	if shot_index is None:
+		shot_index = ShotBoundaryDetector().detect_video(args.face, args.shot_index, decoder=args.decoder)
+	return shot_index.shots
+
+def face_detect_boxes(images, num_frames=None):
+	"""Run face detection over a list or stream of frames, keeping only the padded (and smoothed) boxes.
+
+	images holds the first frames of the input video (at most num_frames of them). Boxes are
+	looked up in the face-track cache first; a hit skips detection, and decoding when images
+	is a lazy stream.
+	"""
+	cache_key = face_cache_key()
+	if cache_key is not None:
+		tracks = face_cache.load_tracks(cache_key, num_frames)
+		if tracks is not None:
+			print('Using cached face detections ({} frames)'.format(len(tracks)))
+			boxes = tracks[:, :4].astype(np.int64)
+			if not args.nosmooth: boxes = smooth_boxes(boxes, T=5, shots=shot_ranges())
+			return boxes
+
+	face_detector = args.face_detector
+	if args.detect_workers > 0 and device == 'cpu':
+		face_detector = DetectionPool(num_workers=args.detect_workers, face_detector=args.face_detector,
+									threads_per_worker=args.detect_threads, tile_size=args.tile_size,
+									optimize=not args.no_optimize, precision=args.precision, verbose=True)
+	try:
+		detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
+												flip_input=False, device=device, face_detector=face_detector,
+												tile_size=args.tile_size, optimize=not args.no_optimize,
+												precision=args.precision)
+
+		batch_size = [args.face_det_batch_size]
+
+		def detect(frames):
+			while 1:
+				predictions = []
+				try:
+					for i in range(0, len(frames), batch_size[0]):
+						predictions.extend(detector.get_detections_for_batch(np.array(frames[i:i + batch_size[0]]),
+																			return_scores=True))
+				except RuntimeError:
+					face_detector = detector.face_detector
+					if batch_size[0] > 1:
+						batch_size[0] //= 2
+						print('Recovering from OOM error; New batch size: {}'.format(batch_size[0]))
+					elif hasattr(face_detector, 'tile_size') and not face_detector.tile_size:
+						# Frames too large for a single forward pass: detect them in tiles instead
+						face_detector.tile_size = 1024
+						print('Recovering from OOM error; Detecting faces in {}px tiles'.format(face_detector.tile_size))
+					elif getattr(face_detector, 'tile_batch_size', 1) > 1:
+						face_detector.tile_batch_size //= 2
+						print('Recovering from OOM error; New tile batch size: {}'.format(face_detector.tile_batch_size))
+					else:
+						raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
+					continue
+				return predictions
+
+		# Probe the first frames for the face size and detect at the scale that brings it near the target
+		frame_iter = iter(images)
+		head = list(islice(frame_iter, args.face_det_batch_size))
+		if not head:
+			raise ValueError('Face not detected! Ensure the video contains a face.')
+		scale_policy = DetectionScalePolicy(scale=None if args.detect_scale == 'auto' else float(args.detect_scale))
+		scale_policy.choose(detect, head)
+		if args.min_face_size:
+			# In pixels of the (scaled) frames the detector sees
+			detector.face_detector.min_face_size = args.min_face_size * scale_policy.scale
+		tracker = KeyframeFaceTracker(scale_policy.wrap(detect), keyframe_interval=args.detect_every,
+									batch_size=args.face_det_batch_size)
+
+		# Frames without a face are interpolated from their neighbours, within their shot
+		shots = shot_ranges()
+		frame_iter = iter(tqdm(chain(head, frame_iter)))
+		if shots:
+			shot_tracks = [tracker.track(islice(frame_iter, end - start)) for start, end in shots[:-1]]
+			shot_tracks.append(tracker.track(frame_iter))
+			tracks = np.concatenate(shot_tracks)
+			print('{} shots'.format(len(shots)))
 		else:
-			window = boxes[i : i + T]
-		boxes[i] = np.mean(window, axis=0)
-	return boxes
+			tracks = tracker.track(frame_iter)
+		tracker.print_stats()
+		scale_policy.print_report()
+		detector_stats = detector.face_detector.stats() if hasattr(detector.face_detector, 'stats') else {}
+		if 'verified' in detector_stats:
+			print('{} frames settled by the fast detector, {} verified ({:.0%})'.format(
+				detector_stats['fast_accepted'], detector_stats['verified'], detector_stats['verified_fraction']))
+		if 'workers' in detector_stats:
+			print('Detection pool: {} workers x {} threads, {:.1f} frames/sec'.format(
+				detector_stats['workers'], detector_stats['threads_per_worker'], detector_stats['frames_per_second']))
+		if len(tracks) == 0 or np.isnan(tracks[:, 0]).all():
+			raise ValueError('Face not detected! Ensure the video contains a face.')
+		if np.isnan(tracks[:, 0]).any():
+			# A shot without any face: borrow the boxes of the other shots rather than failing
+			tracks = interpolate_boxes(tracks)
+
+		pady1, pady2, padx1, padx2 = args.pads
+		height, width = head[0].shape[:2]
+		results = np.column_stack([np.maximum(0, tracks[:, 0] - padx1), np.maximum(0, tracks[:, 1] - pady1),
+								np.minimum(width, tracks[:, 2] + padx2), np.minimum(height, tracks[:, 3] + pady2)])
+		scores = tracks[:, 4]
+
+		boxes = results.astype(np.int64)
+		if cache_key is not None:
+			# Fewer frames than requested means the whole video was scanned
+			complete = num_frames is None or len(boxes) < num_frames
+			face_cache.store_tracks(cache_key, np.column_stack([boxes, scores]), complete=complete, video=args.face)
+			face_cache.print_stats()
+		if not args.nosmooth: boxes = smooth_boxes(boxes, T=5, shots=shots)
+		return boxes
+	finally:
+		# Pool workers and their shared-memory rings go away even when detection fails
+		if isinstance(face_detector, DetectionPool):
+			face_detector.close()
+
+def face_detect(images, num_frames=None):
+	boxes = face_detect_boxes(images, num_frames)
+	results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2)] for image, (x1, y1, x2, y2) in zip(images, boxes)]
+	return results 
 
-def face_detect(images):
-	detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
-											flip_input=False, device=device)
+def prepare_batch(img_batch, mel_batch):
+	img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
 
-	batch_size = args.face_det_batch_size
-	
-	while 1:
-		predictions = []
-		try:
-			for i in tqdm(range(0, len(images), batch_size)):
-				predictions.extend(detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
-		except RuntimeError:
-			if batch_size == 1: 
-				raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
-			batch_size //= 2
-			print('Recovering from OOM error; New batch size: {}'.format(batch_size))
-			continue
-		break
-
-	results = []
-	pady1, pady2, padx1, padx2 = args.pads
-	for rect, image in zip(predictions, images):
-		if rect is None:
-			cv2.imwrite('temp/faulty_frame.jpg', image) # check this frame where the face was not detected.
-			raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
-
-		y1 = max(0, rect[1] - pady1)
-		y2 = min(image.shape[0], rect[3] + pady2)
-		x1 = max(0, rect[0] - padx1)
-		x2 = min(image.shape[1], rect[2] + padx2)
-		
-		results.append([x1, y1, x2, y2])
-
-	boxes = np.array(results)
-	if not args.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
-	results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2)] for image, (x1, y1, x2, y2) in zip(images, boxes)]
+	img_masked = img_batch.copy()
+	img_masked[:, args.img_size//2:] = 0
 
-	del detector
-	return results 
+	# float32 throughout: the model never sees float64
+	img_batch = np.concatenate((img_masked, img_batch), axis=3).astype(np.float32) / 255.
+	mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1]).astype(np.float32)
+
+	return img_batch, mel_batch
 
 def datagen(frames, mels):
-	img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+	img_batch, mel_batch, frame_batch, coords_batch, idx_batch = [], [], [], [], []
 
 	if args.box[0] == -1:
 		if not args.static:
-			face_det_results = face_detect(frames) # BGR2RGB for CNN face detection
+			face_det_results = face_detect(frames, num_frames=len(mels)) # BGR2RGB for CNN face detection
 		else:
-			face_det_results = face_detect([frames[0]])
+			face_det_results = face_detect([frames[0]], num_frames=1)
 	else:
 		print('Using the specified bounding box instead of face detection...')
 		y1, y2, x1, x2 = args.box
@@ -137,101 +321,153 @@ def datagen(frames, mels):
 		mel_batch.append(m)
 		frame_batch.append(frame_to_save)
 		coords_batch.append(coords)
+		idx_batch.append(idx)
 
 		if len(img_batch) >= args.wav2lip_batch_size:
-			img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+			img_batch, mel_batch = prepare_batch(img_batch, mel_batch)
 
-			img_masked = img_batch.copy()
-			img_masked[:, args.img_size//2:] = 0
+			yield img_batch, mel_batch, frame_batch, coords_batch, idx_batch
+			img_batch, mel_batch, frame_batch, coords_batch, idx_batch = [], [], [], [], []
 
-			img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-			mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+	if len(img_batch) > 0:
+		img_batch, mel_batch = prepare_batch(img_batch, mel_batch)
 
-			yield img_batch, mel_batch, frame_batch, coords_batch
-			img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+		yield img_batch, mel_batch, frame_batch, coords_batch, idx_batch
 
-	if len(img_batch) > 0:
-		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+def stream_datagen(frame_source, num_frames, boxes, mels):
+	"""Streaming counterpart of datagen.
 
-		img_masked = img_batch.copy()
-		img_masked[:, args.img_size//2:] = 0
+	Frames are pulled from frame_source() (a fresh decode of the input each call)
+	and referenced by index: looping restarts the stream instead of keeping old
+	frames around, and static mode keeps a single decoded frame. Only a few
+	batches of frames are alive at a time.
+	"""
+	img_batch, mel_batch, frame_batch, coords_batch, idx_batch = [], [], [], [], []
+	frame_iter, frame = None, None
 
-		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+	for i, m in enumerate(mels):
+		idx = 0 if args.static else i%num_frames
+		if frame_iter is None or (idx == 0 and not args.static):
+			frame_iter = frame_source() # (re)start the stream when looping
+		if frame is None or not args.static:
+			frame = next(frame_iter)
 
-		yield img_batch, mel_batch, frame_batch, coords_batch
+		x1, y1, x2, y2 = boxes[idx]
+		face = cv2.resize(frame[y1: y2, x1:x2], (args.img_size, args.img_size))
+
+		img_batch.append(face)
+		mel_batch.append(m)
+		frame_batch.append(frame.copy() if args.static else frame) # the static frame is pasted into per output
+		coords_batch.append((y1, y2, x1, x2))
+		idx_batch.append(idx)
+
+		if len(img_batch) >= args.wav2lip_batch_size:
+			img_batch, mel_batch = prepare_batch(img_batch, mel_batch)
+
+			yield img_batch, mel_batch, frame_batch, coords_batch, idx_batch
+			img_batch, mel_batch, frame_batch, coords_batch, idx_batch = [], [], [], [], []
+
+	if len(img_batch) > 0:
+		img_batch, mel_batch = prepare_batch(img_batch, mel_batch)
+
+		yield img_batch, mel_batch, frame_batch, coords_batch, idx_batch
 
 mel_step_size = 16
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print('Using {} for inference.'.format(device))
 
-def _load(checkpoint_path):
-	if device == 'cuda':
-		checkpoint = torch.load(checkpoint_path)
-	else:
-		checkpoint = torch.load(checkpoint_path,
-								map_location=lambda storage, loc: storage)
-	return checkpoint
-
 def load_model(path):
-	model = Wav2Lip()
-	print("Load checkpoint from: {}".format(path))
-	checkpoint = _load(path)
-	s = checkpoint["state_dict"]
-	new_s = {}
-	for k, v in s.items():
-		new_s[k.replace('module.', '')] = v
-	model.load_state_dict(new_s)
-
-	model = model.to(device)
-	return model.eval()
+	print("Load checkpoint from: {} ({} backend)".format(path, args.backend))
+	return load_backend(path, device, args.backend, optimize=not args.no_optimize, precision=args.precision)
+
+def preprocess_frame(frame):
+	if args.resize_factor > 1:
+		frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
+
+	if args.rotate:
+		frame = cv2.rotate(frame, cv2.cv2.ROTATE_90_CLOCKWISE)
+
+	y1, y2, x1, x2 = args.crop
+	if x2 == -1: x2 = frame.shape[1]
+	if y2 == -1: y2 = frame.shape[0]
+
+	return frame[y1:y2, x1:x2]
+
+def read_frames(path):
+	"""Yield the frames of a video one at a time, with resize_factor, rotate and crop applied."""
+	if args.decoder == 'ffmpeg':
+		# Resize, rotate and crop run inside ffmpeg; frame shapes match preprocess_frame
+		_, (w, h), _ = probe_video(path)
+		size = (w//args.resize_factor, h//args.resize_factor) if args.resize_factor > 1 else None
+		yield from FFmpegFrameDecoder(path, size=size, crop=args.crop, rotate=args.rotate)
+		return
+
+	video_stream = cv2.VideoCapture(path)
+	try:
+		while 1:
+			still_reading, frame = video_stream.read()
+			if not still_reading:
+				break
+			yield preprocess_frame(frame)
+	finally:
+		video_stream.release()
 
 def main():
+	workspace = JobWorkspace(args.workdir)
+	try:
+		run(workspace)
+	finally:
+		workspace.cleanup()
+
+def run(workspace):
 	if not os.path.isfile(args.face):
 		raise ValueError('--face argument must be a valid path to video/image file')
 
 	elif args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
 		full_frames = [cv2.imread(args.face)]
 		fps = args.fps
+		args.stream = False
 
-	else:
+	elif args.stream:
 		video_stream = cv2.VideoCapture(args.face)
 		fps = video_stream.get(cv2.CAP_PROP_FPS)
+		video_stream.release()
 
-		print('Reading video frames...')
-
-		full_frames = []
-		while 1:
-			still_reading, frame = video_stream.read()
-			if not still_reading:
-				video_stream.release()
-				break
-			if args.resize_factor > 1:
-				frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
-
-			if args.rotate:
-				frame = cv2.rotate(frame, cv2.cv2.ROTATE_90_CLOCKWISE)
+		print('Streaming video frames (two passes)...')
 
-			y1, y2, x1, x2 = args.crop
-			if x2 == -1: x2 = frame.shape[1]
-			if y2 == -1: y2 = frame.shape[0]
+	else:
+		video_stream = cv2.VideoCapture(args.face)
+		fps = video_stream.get(cv2.CAP_PROP_FPS)
+		video_stream.release()
 
-			frame = frame[y1:y2, x1:x2]
+		print('Reading video frames...')
 
-			full_frames.append(frame)
+		full_frames = list(read_frames(args.face))
 
-	print ("Number of frames available for inference: "+str(len(full_frames)))
+	if not args.stream:
+		print ("Number of frames available for inference: "+str(len(full_frames)))
 
-	if not args.audio.endswith('.wav'):
-		print('Extracting raw audio...')
+	mel = None
+	if mel_cache is not None:
+		# Keyed by the original file, so a hit also skips the wav extraction below
+		mel_key = mel_cache.mel_key(args.audio, 16000, audio)
+		entry = mel_cache.load(mel_key, mmap_mode='r')
+		if entry is not None:
+			print('Using cached mel spectrogram')
+			mel = entry[0]
 
-		command = '{} -loglevel panic -y -i {} -strict -2 {}'.format(ffmpeg_path, audio_src, '../temp/temp.wav')
+	if mel is None:
+		audio_path = args.audio
+		if not args.audio.endswith('.wav'):
+			print('Extracting raw audio...')
 
-		subprocess.call(command, shell=True)
-		args.audio = 'temp/temp.wav'
+			audio_path = workspace.file('audio.wav')
+			subprocess.call([find_ffmpeg() or 'ffmpeg', '-loglevel', 'panic', '-y', '-i', args.audio, '-strict', '-2', audio_path])
 
-	wav = audio.load_wav(args.audio, 16000)
-	mel = audio.melspectrogram(wav)
+		wav = audio.load_wav(audio_path, 16000)
+		mel = audio.melspectrogram(wav).astype(np.float32)
+		if mel_cache is not None:
+			mel_cache.store(mel_key, mel, audio=os.path.abspath(args.audio))
 	print(mel.shape)
 
 	if np.isnan(mel.reshape(-1)).sum() > 0:
@@ -250,29 +486,76 @@ def main():
 
 	print("Length of mel chunks: {}".format(len(mel_chunks)))
 
-	full_frames = full_frames[:len(mel_chunks)]
-
 	batch_size = args.wav2lip_batch_size
-	gen = datagen(full_frames.copy(), mel_chunks)
 
-	for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen, 
-											total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
-		if i == 0:
-			model = load_model(args.checkpoint_path)
-			print ("Model loaded")
+	if args.stream:
+		frame_source = lambda: read_frames(args.face)
+		num_frames = 1 if args.static else len(mel_chunks)
 
-			frame_h, frame_w = full_frames[0].shape[:-1]
-			out = cv2.VideoWriter('temp/result.avi', 
-									cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
+		if args.box[0] == -1:
+			# Decode on a background thread while the detector runs
+			prefetch = StagedPipeline([], queue_size=args.face_det_batch_size)
+			boxes = face_detect_boxes(prefetch.iterate(islice(frame_source(), num_frames)), num_frames)
+		else:
+			print('Using the specified bounding box instead of face detection...')
+			y1, y2, x1, x2 = args.box
+			boxes = [(x1, y1, x2, y2)] * sum(1 for _ in islice(frame_source(), num_frames))
 
-		img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
-		mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
+		num_frames = len(boxes)
+		print ("Number of frames available for inference: "+str(num_frames))
+		gen = stream_datagen(frame_source, num_frames, boxes, mel_chunks)
+	else:
+		full_frames = full_frames[:len(mel_chunks)]
+		num_frames = 1 if args.static else len(full_frames)
+		gen = datagen(full_frames.copy(), mel_chunks)
+
+	model = load_model(args.checkpoint_path)
+	print ("Model loaded")
+	# Inputs are cast to the weights' type (--precision applies to the eager backend only)
+	dtype = PRECISIONS[args.precision]
+
+	# The audio encoder sees every mel chunk exactly once: embed them all up front
+	with torch.no_grad():
+		mels = torch.from_numpy(np.asarray(mel_chunks, dtype=np.float32)).unsqueeze(1)
+		audio_embeddings = model.encode_audio_chunks(mels.to(device, dtype))
+
+	# Frames come back (static image, video looped over a longer audio): reuse their face features
+	feature_cache = None
+	if args.face_feature_cache_mb > 0 and len(mel_chunks) > num_frames:
+		feature_cache = FaceFeatureCache(args.face_feature_cache_mb * 1024 * 1024, num_keys=num_frames)
+
+	recorder = CalibrationRecorder(args.record_calibration) if args.record_calibration else None
+	writer = {}
+	position = [0]
+
+	def infer(batch):
+		img_batch, mel_batch, frames, coords, frame_ids = batch
+		img_batch = torch.from_numpy(np.transpose(img_batch, (0, 3, 1, 2))).to(device, dtype)
+		start = position[0]
+		position[0] += len(frames)
+		if recorder is not None:
+			recorder.record(torch.from_numpy(np.transpose(mel_batch, (0, 3, 1, 2))), img_batch)
 
 		with torch.no_grad():
-			pred = model(mel_batch, img_batch)
+			if feature_cache is not None:
+				feats = feature_cache.encode(model, frame_ids, img_batch)
+			else:
+				feats = model.encode_face(img_batch)
+			pred = model.decode(audio_embeddings[start:start + len(frames)], feats)
+
+		pred = pred.float().cpu().numpy().transpose(0, 2, 3, 1) * 255.
+		return pred, frames, coords
+
+	def encode(result):
+		pred, frames, coords = result
+		if 'out' not in writer:
+			frame_h, frame_w = frames[0].shape[:-1]
+			# Frames are piped straight into ffmpeg, which muxes the audio in the same pass
+			writer['out'] = open_video_writer(args.outfile, fps, (frame_w, frame_h), audio_path=args.audio,
+											workspace=workspace, preset=args.preset, crf=args.crf,
+											threads=args.encoder_threads)
+		out = writer['out']
 
-		pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
-		
 		for p, f, c in zip(pred, frames, coords):
 			y1, y2, x1, x2 = c
 			p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
@@ -280,10 +563,29 @@ def main():
 			f[y1:y2, x1:x2] = p
 			out.write(f)
 
-	out.release()
+	# datagen (decode/crop) -> Wav2Lip -> paste-back + encode, each on its own thread
+	pipeline = StagedPipeline([('infer', infer), ('encode', encode)], queue_size=args.pipeline_queue_size,
+								source_name='datagen')
+	try:
+		pipeline.run(tqdm(gen, total=int(np.ceil(float(len(mel_chunks))/batch_size))))
+	except Exception:
+		if 'out' in writer:
+			writer['out'].abort()
+		raise
+	pipeline.print_stats()
+	if recorder is not None:
+		recorder.flush()
+	if feature_cache is not None:
+		stats = feature_cache.stats()
+		if stats['bypassed']:
+			print('Face feature cache: off, the {} frames do not fit in --face_feature_cache_mb {}'.format(
+				num_frames, args.face_feature_cache_mb))
+		else:
+			print('Face feature cache: {} hits, {} misses'.format(stats['hits'], stats['misses']))
+	get_model_registry().print_stats()
 
-	command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, 'temp/result.avi', args.outfile)
-	subprocess.call(command, shell=platform.system() != 'Windows')
+	writer['out'].release()
+	print('Result saved to {}'.format(args.outfile))
 
 if __name__ == '__main__':
 	main()
@@ -1,2 +1,5 @@
 from .wav2lip import Wav2Lip, Wav2Lip_disc_qual
-from .syncnet import SyncNet_color
\ No newline at end of file
+from .syncnet import SyncNet_color
+from .feature_cache import FaceFeatureCache
+from .registry import ModelRegistry, get_model_registry
+from .backends import BACKENDS, load_backend
@@ -0,0 +1,256 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import torch
+from torch import nn
+
+BACKENDS = ('eager', 'torchscript', 'onnx', 'int8')
+
+# Methods of the generator the lip-sync loops call, all traced/exported separately
+_METHODS = ('encode_audio', 'encode_face', 'decode')
+_ONNX_OPSET = 17
+
+_hashes = {}
+
+
+def checkpoint_hash(checkpoint_path):
+    """sha256 of a checkpoint file (memoised per path, size and mtime)."""
+    stat = os.stat(checkpoint_path)
+    memo_key = (os.path.abspath(checkpoint_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _hashes:
+        digest = hashlib.sha256()
+        with open(checkpoint_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _hashes[memo_key] = digest.hexdigest()
+    return _hashes[memo_key]
+
+
+def artifact_paths(checkpoint_path, backend):
+    """Exported files of a checkpoint, next to it: <stem>.<hash>.torchscript.pt or <stem>.<hash>.<part>.onnx."""
+    stem = os.path.splitext(checkpoint_path)[0]
+    digest = checkpoint_hash(checkpoint_path)[:16]
+    if backend == 'torchscript':
+        return [f"{stem}.{digest}.torchscript.pt"]
+    if backend == 'onnx':
+        return [f"{stem}.{digest}.{method}.onnx" for method in _METHODS]
+    raise ValueError(f"Backend {backend!r} has no exported artifacts")
+
+
+def _remove_stale(checkpoint_path, backend, current):
+    # Exports of earlier versions of the checkpoint
+    stem = glob.escape(os.path.splitext(checkpoint_path)[0])
+    pattern = f"{stem}.*.torchscript.pt" if backend == 'torchscript' else f"{stem}.*.*.onnx"
+    for path in glob.glob(pattern):
+        if path not in current:
+            os.remove(path)
+
+
+class _ExportWrapper(nn.Module):
+    """Wav2Lip with flat tensor signatures, as tracing and ONNX export need them."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def encode_audio(self, audio_sequences):
+        return self.model.encode_audio(audio_sequences)
+
+    def encode_face(self, face_sequences):
+        return tuple(self.model.encode_face(face_sequences))
+
+    def decode(self, audio_embedding, *feats):
+        return self.model.decode(audio_embedding, list(feats))
+
+    def forward(self, audio_sequences, face_sequences):
+        return self.decode(self.encode_audio(audio_sequences), *self.encode_face(face_sequences))
+
+
+class _MethodModule(nn.Module):
+    """One method of _ExportWrapper as a module's forward (torch.onnx exports forward only)."""
+
+    def __init__(self, wrapper, method):
+        super().__init__()
+        self.wrapper = wrapper
+        self.method = method
+
+    def forward(self, *inputs):
+        return getattr(self.wrapper, self.method)(*inputs)
+
+
+def _example_inputs(model, batch_size=2):
+    mel = torch.randn(batch_size, 1, 80, 16)
+    faces = torch.rand(batch_size, 6, 96, 96)
+    with torch.no_grad():
+        embedding = model.encode_audio(mel)
+        feats = tuple(model.encode_face(faces))
+    return {'encode_audio': (mel,), 'encode_face': (faces,), 'decode': (embedding,) + feats}
+
+
+def export_torchscript(model, path, extra_files=None):
+    """Trace encode_audio, encode_face and decode of an eval-mode CPU Wav2Lip into one TorchScript file
+    (``extra_files``: name -> str stored in the archive, see torch.jit.save)."""
+    wrapper = _ExportWrapper(model).eval()
+    inputs = _example_inputs(model)
+    with torch.no_grad():
+        traced = torch.jit.trace_module(wrapper, {method: inputs[method] for method in _METHODS})
+    torch.jit.save(traced, path, _extra_files=extra_files or {})
+
+
+def export_onnx(model, paths):
+    """Export encode_audio, encode_face and decode of an eval-mode CPU Wav2Lip, batch size left dynamic."""
+    wrapper = _ExportWrapper(model).eval()
+    inputs = _example_inputs(model)
+    for method, path in zip(_METHODS, paths):
+        example = inputs[method]
+        input_names = [f"input_{i}" for i in range(len(example))]
+        with torch.no_grad():
+            outputs = _MethodModule(wrapper, method)(*example)
+        outputs = outputs if isinstance(outputs, tuple) else (outputs,)
+        output_names = [f"output_{i}" for i in range(len(outputs))]
+        torch.onnx.export(_MethodModule(wrapper, method), example, path, input_names=input_names,
+                          output_names=output_names, opset_version=_ONNX_OPSET,
+                          dynamic_axes={name: {0: 'batch'} for name in input_names + output_names})
+
+
+class ExportedWav2Lip(object):
+    """The Wav2Lip generator interface (encode_audio, encode_face, decode, forward)
+    over an exported graph, so the lip-sync loops do not care which backend runs."""
+
+    backend = None
+
+    def __init__(self, device):
+        self.device = torch.device(device)
+
+    def encode_audio_chunks(self, audio_sequences, batch_size=512):
+        return torch.cat([self.encode_audio(audio_sequences[i:i + batch_size])
+                          for i in range(0, len(audio_sequences), batch_size)], dim=0)
+
+    def forward(self, audio_sequences, face_sequences):
+        # (B, 1, 80, 16) and (B, 6, 96, 96) batches, as at inference
+        return self.decode(self.encode_audio(audio_sequences), self.encode_face(face_sequences))
+
+    def __call__(self, audio_sequences, face_sequences):
+        return self.forward(audio_sequences, face_sequences)
+
+    def eval(self):
+        return self
+
+
+class TorchScriptWav2Lip(ExportedWav2Lip):
+    backend = 'torchscript'
+
+    def __init__(self, path, device):
+        super().__init__(device)
+        module = self._load(path).eval()
+        # Freezing inlines the weights and folds BatchNorm into the convolutions
+        self.module = torch.jit.freeze(module, preserved_attrs=list(_METHODS))
+        self.nbytes = os.path.getsize(path)
+
+    def _load(self, path):
+        return torch.jit.load(path, map_location=self.device)
+
+    def encode_audio(self, audio_sequences):
+        return self.module.encode_audio(audio_sequences)
+
+    def encode_face(self, face_sequences):
+        return list(self.module.encode_face(face_sequences))
+
+    def decode(self, audio_embedding, feats):
+        return self.module.decode(audio_embedding, *feats)
+
+
+class OnnxWav2Lip(ExportedWav2Lip):
+    """ONNX Runtime, CPU execution provider; inputs and outputs are torch tensors on ``device``."""
+
+    backend = 'onnx'
+
+    def __init__(self, paths, device, threads=None):
+        import onnxruntime
+
+        super().__init__(device)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sessions = {method: onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+                         for method, path in zip(_METHODS, paths)}
+        self.nbytes = sum(os.path.getsize(path) for path in paths)
+
+    def _run(self, method, *inputs):
+        session = self.sessions[method]
+        feed = {arg.name: np.ascontiguousarray(x.detach().float().cpu().numpy())
+                for arg, x in zip(session.get_inputs(), inputs)}
+        return [torch.from_numpy(out).to(self.device) for out in session.run(None, feed)]
+
+    def encode_audio(self, audio_sequences):
+        return self._run('encode_audio', audio_sequences)[0]
+
+    def encode_face(self, face_sequences):
+        return self._run('encode_face', face_sequences)
+
+    def decode(self, audio_embedding, feats):
+        return self._run('decode', audio_embedding, *feats)[0]
+
+
+def load_exported(checkpoint_path, device, backend):
+    """Exported generator of a checkpoint, exporting it first if its artifacts are missing or stale.
+
+    Args:
+        checkpoint_path (str): Wav2Lip checkpoint
+        device: Torch device of the inputs and outputs
+        backend (str): 'torchscript' or 'onnx' (CPU only)
+
+    Returns:
+        ExportedWav2Lip: Object with the Wav2Lip inference methods
+    """
+    from .registry import load_wav2lip
+
+    paths = artifact_paths(checkpoint_path, backend)
+    if not all(os.path.isfile(path) for path in paths):
+        print(f"Exporting {os.path.basename(checkpoint_path)} to {backend}...")
+        model = load_wav2lip(checkpoint_path, torch.device('cpu'))
+        # Written under temporary names, so an interrupted export is never picked up
+        partial = [path + '.partial' for path in paths]
+        if backend == 'torchscript':
+            export_torchscript(model, partial[0])
+        else:
+            export_onnx(model, partial)
+        for src, dst in zip(partial, paths):
+            os.replace(src, dst)
+        _remove_stale(checkpoint_path, backend, paths)
+
+    if backend == 'torchscript':
+        return TorchScriptWav2Lip(paths[0], device)
+    if torch.device(device).type != 'cpu':
+        print("ONNX Runtime runs on the CPU; tensors are copied to and from the device")
+    return OnnxWav2Lip(paths, device)
+
+
+def load_backend(checkpoint_path, device, backend='eager', optimize=True, precision='fp32'):
+    """The Wav2Lip generator of a checkpoint on a given backend, shared through the model registry.
+
+    Args:
+        checkpoint_path (str): Wav2Lip checkpoint
+        device: Torch device
+        backend (str): 'eager', 'torchscript', 'onnx', or 'int8' for a checkpoint
+            quantized by Wav2Lip/quantize.py (``checkpoint_path`` is then that file)
+        optimize (bool): Eager only: fold BatchNorm and run channels_last
+            (TorchScript and ONNX Runtime do their own graph optimizations)
+        precision (str): Eager only: weight precision, 'fp32', 'bf16' (CPUs with
+            native bfloat16) or 'fp16' (GPU); inputs must be cast to match
+    """
+    from .registry import get_model_registry
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r} (expected one of {', '.join(BACKENDS)})")
+    if backend == 'eager':
+        return get_model_registry().get('wav2lip', checkpoint_path, device, precision=precision, optimize=optimize)
+    if precision != 'fp32':
+        raise ValueError(f"The {backend} backend runs in its own precision; {precision} needs the eager backend")
+    if backend == 'int8':
+        from .quantization import QuantizedWav2Lip
+        return get_model_registry().get('wav2lip-int8', checkpoint_path, device, loader=QuantizedWav2Lip)
+    return get_model_registry().get(f"wav2lip-{backend}", checkpoint_path, device,
+                                    loader=lambda path, dev: load_exported(path, dev, backend))
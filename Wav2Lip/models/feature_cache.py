@@ -0,0 +1,116 @@
+from collections import OrderedDict
+
+import torch
+
+
+class FaceFeatureCache(object):
+    """LRU cache of per-frame Wav2Lip face-encoder features.
+
+    The face encoder only sees the (masked + reference) face crop, so frames
+    that come back (a static image, looped frames, the same video rendered
+    against several audio tracks) can skip it and only run the audio encoder
+    and the decoder. Entries stay on the model's device and are evicted
+    least-recently-used first once they use more than max_bytes.
+
+    Frames of a looped video come back in the same order, and strict LRU
+    evicts every one of them before its turn comes if they do not all fit.
+    Given ``num_keys``, the number of distinct frames of the job, the cache
+    turns itself off as soon as it knows the size of an entry and they do
+    not fit: the face encoder then runs on every batch, without the copies.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, num_keys=None):
+        self.max_bytes = max_bytes
+        self.num_keys = num_keys
+        self.bypassed = False
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_bytes(feats):
+        return sum(f.numel() * f.element_size() for f in feats)
+
+    def _put(self, key, feats):
+        size = self._entry_bytes(feats)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= self._entry_bytes(self.entries.pop(key))
+        self.entries[key] = feats
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= self._entry_bytes(evicted)
+            self.evictions += 1
+
+    def encode(self, model, keys, face_sequences):
+        """Face features of a batch, running the face encoder on the missing frames only.
+
+        Args:
+            model: Wav2Lip model
+            keys: One hashable key per row of face_sequences (e.g. the frame index);
+                rows with the same key must hold the same face crop
+            face_sequences (torch.Tensor): (B, 6, 96, 96) face batch
+
+        Returns:
+            list: Skip-connection features, as returned by model.encode_face
+        """
+        if self.bypassed:
+            self.misses += len(keys)
+            return model.encode_face(face_sequences)
+
+        # Hits are held here: inserting the missing frames below may evict them from the cache
+        cached, missing = {}, []
+        for key in keys:
+            if key in cached or key in missing:
+                continue
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                cached[key] = self.entries[key]
+            else:
+                missing.append(key)
+
+        first_row = {}
+        for row, key in enumerate(keys):
+            first_row.setdefault(key, row)
+
+        computed = {}
+        if missing:
+            rows = torch.tensor([first_row[key] for key in missing], device=face_sequences.device)
+            feats = model.encode_face(face_sequences.index_select(0, rows))
+            for i, key in enumerate(missing):
+                computed[key] = [f[i:i + 1].clone() for f in feats]
+            if self.num_keys and self._entry_bytes(computed[missing[0]]) * self.num_keys > self.max_bytes:
+                # Every entry would be evicted before it is reused: stop caching
+                self.bypassed = True
+                self.clear()
+            else:
+                for key in missing:
+                    self._put(key, computed[key])
+
+        # Per row: a frame missing from the cache is a miss on every row it appears in
+        hit_rows = sum(1 for key in keys if key in cached)
+        self.hits += hit_rows
+        self.misses += len(keys) - hit_rows
+
+        per_row = [cached[key] if key in cached else computed[key] for key in keys]
+        return [torch.cat([entry[level] for entry in per_row], dim=0) for level in range(len(per_row[0]))]
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'bypassed': self.bypassed,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+        }
@@ -0,0 +1,133 @@
+import copy
+
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+from .conv import Conv2d, Conv2dTranspose, nonorm_Conv2d
+
+# s3fd: L2Norm layer -> the convolutions reading its output (see face_detection/detection/sfd/net_s3fd.py)
+S3FD_NORM_HEADS = {
+    'conv3_3_norm': ('conv3_3_norm_mbox_conf', 'conv3_3_norm_mbox_loc'),
+    'conv4_3_norm': ('conv4_3_norm_mbox_conf', 'conv4_3_norm_mbox_loc'),
+    'conv5_3_norm': ('conv5_3_norm_mbox_conf', 'conv5_3_norm_mbox_loc'),
+}
+
+
+def fold_batchnorm(conv, bn):
+    """A copy of ``conv`` (Conv2d or ConvTranspose2d) computing bn(conv(x)) with eval-mode statistics."""
+    fused = copy.deepcopy(conv)
+    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias.detach() if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    with torch.no_grad():
+        if isinstance(conv, nn.ConvTranspose2d):
+            # (in, out / groups, kh, kw): output channels are the second dimension
+            weight = fused.weight.view(conv.groups, conv.in_channels // conv.groups, -1, *conv.kernel_size)
+            weight.mul_(scale.view(conv.groups, 1, -1, 1, 1))
+        else:
+            fused.weight.mul_(scale.view(-1, 1, 1, 1))
+        fused.bias = nn.Parameter((bias - bn.running_mean) * scale + bn.bias.detach())
+    return fused
+
+
+class FusedConv(nn.Module):
+    """Inference form of the conv.py blocks: one convolution (BatchNorm folded in),
+    then the residual add and the activation applied in place on its output."""
+
+    def __init__(self, conv, residual=False, negative_slope=None):
+        super().__init__()
+        self.conv = conv
+        self.residual = residual
+        # None: ReLU, else LeakyReLU with this slope
+        self.negative_slope = negative_slope
+
+    def forward(self, x):
+        out = self.conv(x)
+        if self.residual:
+            out += x
+        if self.negative_slope is None:
+            return F.relu_(out)
+        return F.leaky_relu_(out, self.negative_slope)
+
+
+class L2NormNoScale(nn.Module):
+    """s3fd L2Norm once its per-channel scale is folded into the following convolutions."""
+
+    def __init__(self, eps):
+        super().__init__()
+        self.eps = eps
+
+    def forward(self, x):
+        return x / (x.float().pow(2).sum(dim=1, keepdim=True).sqrt() + self.eps).to(x.dtype)
+
+
+def _fuse_block(module):
+    if isinstance(module, (Conv2d, Conv2dTranspose)):
+        conv, bn = module.conv_block
+        return FusedConv(fold_batchnorm(conv, bn), residual=getattr(module, 'residual', False))
+    if isinstance(module, nonorm_Conv2d):
+        return FusedConv(copy.deepcopy(module.conv_block[0]), negative_slope=module.act.negative_slope)
+    return None
+
+
+def _fuse_children(module):
+    count = 0
+    for name, child in module.named_children():
+        fused = _fuse_block(child)
+        if fused is not None:
+            setattr(module, name, fused)
+            count += 1
+        else:
+            count += _fuse_children(child)
+    return count
+
+
+def _fold_l2norm_scales(model):
+    count = 0
+    for norm_name, conv_names in S3FD_NORM_HEADS.items():
+        norm = getattr(model, norm_name, None)
+        # Matched by name: face_detection is imported both as a top-level package and as Wav2Lip.face_detection
+        if type(norm).__name__ != 'L2Norm':
+            continue
+        with torch.no_grad():
+            for conv_name in conv_names:
+                conv = getattr(model, conv_name)
+                conv.weight.mul_(norm.weight.detach().view(1, -1, 1, 1))
+        setattr(model, norm_name, L2NormNoScale(norm.eps))
+        count += 1
+    return count
+
+
+def optimize_for_inference(model, channels_last=True, inplace=False):
+    """Inference-only version of a Wav2Lip or s3fd model.
+
+    - Every conv.py Conv2d / Conv2dTranspose block becomes one convolution with
+      its BatchNorm folded in; the residual add and the ReLU run in place on
+      the convolution output (nonorm_Conv2d: the LeakyReLU).
+    - The per-channel scales of the s3fd L2Norm layers are folded into the
+      detection-head convolutions that read them.
+    - Weights are converted to channels_last, which makes the convolutions
+      pick channels_last kernels (oneDNN on CPU, cuDNN on GPU) and keeps
+      activations in that layout end to end.
+
+    The result is numerically equivalent to the eval-mode model (up to float
+    rounding, see benchmarks/fusion_benchmark.py) and cannot be trained.
+
+    Args:
+        model (nn.Module): Wav2Lip, Wav2Lip_disc_qual or s3fd
+        channels_last (bool): Convert the weights to channels_last
+        inplace (bool): Modify ``model`` instead of a copy. Models from the
+            registry are shared, so leave this off for them
+
+    Returns:
+        nn.Module: The optimized model, in eval mode
+    """
+    if not inplace:
+        model = copy.deepcopy(model)
+    model.eval()
+    fused = _fuse_children(model)
+    folded = _fold_l2norm_scales(model)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    model.fused_blocks = fused + folded
+    return model
@@ -0,0 +1,229 @@
+import copy
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from .backends import TorchScriptWav2Lip, export_torchscript
+from .conv import Conv2d
+
+METADATA_FILE = 'quantization.json'
+
+
+def quantized_engine():
+    """Best int8 CPU kernel library of this PyTorch build."""
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in torch.backends.quantized.supported_engines:
+            return engine
+    raise RuntimeError("This PyTorch build has no int8 CPU kernels")
+
+
+class CalibrationRecorder(object):
+    """Samples the Wav2Lip inputs (mel windows and face crops) of real jobs, for int8 calibration.
+
+    Every ``sample_every``-th batch is kept whole, so its frames stay
+    consecutive (the sync report of quantize.py needs 5-frame windows), up to
+    ``max_frames`` per job. ``flush`` writes them to
+    ``<directory>/calibration_<time>_<pid>.npz``, one file per job.
+    """
+
+    def __init__(self, directory, sample_every=8, max_frames=512):
+        self.directory = directory
+        self.sample_every = max(1, int(sample_every))
+        self.max_frames = max_frames
+        self._reset()
+
+    def _reset(self):
+        self.mels = []
+        self.faces = []
+        self.frames = 0
+        self.batches_seen = 0
+
+    def record(self, mel_batch, face_batch):
+        """
+        Args:
+            mel_batch (torch.Tensor): (B, 1, 80, 16) mel windows
+            face_batch (torch.Tensor): (B, 6, 96, 96) masked + reference faces in [0, 1]
+        """
+        self.batches_seen += 1
+        if (self.batches_seen - 1) % self.sample_every or self.frames >= self.max_frames:
+            return
+        take = min(len(mel_batch), self.max_frames - self.frames)
+        self.mels.append(mel_batch[:take].detach().float().cpu().numpy())
+        # The crops are uint8 images scaled to [0, 1]: stored back as uint8, losslessly
+        faces = face_batch[:take].detach().float().cpu().numpy()
+        self.faces.append(np.round(faces * 255.).astype(np.uint8))
+        self.frames += take
+
+    def flush(self):
+        """Write the samples of the current job, if any, and start over. Returns the file written."""
+        if not self.mels:
+            self._reset()
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"calibration_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.npz")
+        np.savez_compressed(path, mel=np.concatenate(self.mels), faces=np.concatenate(self.faces),
+                            lengths=np.array([len(m) for m in self.mels]))
+        print(f"Saved {self.frames} calibration frames to {path}")
+        self._reset()
+        return path
+
+
+def load_calibration(paths):
+    """Recorded calibration segments (runs of consecutive frames) from .npz files or directories of them.
+
+    Returns:
+        list: (mel (N, 1, 80, 16), faces (N, 6, 96, 96)) float tensors, one pair per segment
+    """
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, '*.npz'))) if os.path.isdir(path) else [path])
+    segments = []
+    for path in files:
+        data = np.load(path)
+        mel, faces = torch.from_numpy(data['mel']), torch.from_numpy(data['faces']).float() / 255.
+        start = 0
+        for length in data['lengths']:
+            segments.append((mel[start:start + length], faces[start:start + length]))
+            start += length
+    return segments
+
+
+class _QuantizableConv2d(nn.Module):
+    """conv.Conv2d with an out-of-place residual add, which FX quantization
+    turns into a quantized add + ReLU (``out += x`` would stay in float)."""
+
+    def __init__(self, block):
+        super().__init__()
+        self.conv_block = block.conv_block
+        self.act = block.act
+        self.residual = block.residual
+
+    def forward(self, x):
+        out = self.conv_block(x)
+        if self.residual:
+            out = out + x
+        return self.act(out)
+
+
+def _make_quantizable(module):
+    for name, child in module.named_children():
+        if isinstance(child, Conv2d):
+            setattr(module, name, _QuantizableConv2d(child))
+        else:
+            _make_quantizable(child)
+
+
+def _blocks(model):
+    # Sequential blocks quantized one by one: the torch.cat skip connections of
+    # decode() between them, and its Python control flow, stay in float
+    yield model, 'audio_encoder'
+    for blocks in (model.face_encoder_blocks, model.face_decoder_blocks):
+        for i in range(len(blocks)):
+            yield blocks, str(i)
+    yield model, 'output_block'
+
+
+def _block_inputs(model, blocks, mel, faces):
+    inputs = [None] * len(blocks)
+
+    def hook(i):
+        def capture(module, args):
+            inputs[i] = tuple(a.detach() for a in args)
+        return capture
+
+    handles = [getattr(parent, name).register_forward_pre_hook(hook(i)) for i, (parent, name) in enumerate(blocks)]
+    with torch.no_grad():
+        model.decode(model.encode_audio(mel), model.encode_face(faces))
+    for handle in handles:
+        handle.remove()
+    return inputs
+
+
+def quantize_wav2lip(model, segments, batch_size=64, engine=None):
+    """Static int8 post-training quantization of a Wav2Lip generator.
+
+    Every Sequential block of the audio encoder, face encoder, decoder and
+    output block is quantized with FX graph mode (BatchNorm folded, per-channel
+    int8 weights, uint8 activations), with activation ranges observed over the
+    calibration segments.
+
+    Args:
+        model (nn.Module): Float Wav2Lip in eval mode, on the CPU (left unchanged)
+        segments (list): (mel, faces) calibration batches, see ``load_calibration``
+        batch_size (int): Frames per calibration forward pass
+        engine (str, optional): Quantized kernel library (default: ``quantized_engine()``)
+
+    Returns:
+        nn.Module: The quantized Wav2Lip (CPU only)
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = engine or quantized_engine()
+    torch.backends.quantized.engine = engine
+    qconfig_mapping = get_default_qconfig_mapping(engine)
+
+    model = copy.deepcopy(model).cpu().eval()
+    _make_quantizable(model)
+    blocks = list(_blocks(model))
+    mel, faces = segments[0]
+    examples = _block_inputs(model, blocks, mel[:1], faces[:1])
+    for (parent, name), example in zip(blocks, examples):
+        setattr(parent, name, prepare_fx(getattr(parent, name), qconfig_mapping, example))
+
+    with torch.no_grad():
+        for mel, faces in segments:
+            for i in range(0, len(mel), batch_size):
+                model.decode(model.encode_audio(mel[i:i + batch_size]), model.encode_face(faces[i:i + batch_size]))
+
+    for parent, name in blocks:
+        setattr(parent, name, convert_fx(getattr(parent, name)))
+    return model.eval()
+
+
+def save_quantized(model, path, metadata):
+    """Save a quantized Wav2Lip as a TorchScript checkpoint (the ``int8`` backend).
+
+    Args:
+        model (nn.Module): Output of ``quantize_wav2lip``
+        path (str): Output file
+        metadata (dict): Stored alongside the graph (source checkpoint, engine, calibration...)
+    """
+    export_torchscript(model, path, extra_files={METADATA_FILE: json.dumps(metadata)})
+
+
+class QuantizedWav2Lip(TorchScriptWav2Lip):
+    """An int8 checkpoint written by ``save_quantized``. The quantized kernels
+    are CPU only: on other devices inputs and outputs are copied over."""
+
+    backend = 'int8'
+
+    def _load(self, path):
+        extra_files = {METADATA_FILE: ''}
+        try:
+            module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        except RuntimeError as e:
+            raise ValueError(f"{path} is not an int8 Wav2Lip checkpoint (see Wav2Lip/quantize.py)") from e
+        if not extra_files[METADATA_FILE]:
+            raise ValueError(f"{path} is not an int8 Wav2Lip checkpoint (see Wav2Lip/quantize.py)")
+        self.metadata = json.loads(extra_files[METADATA_FILE])
+        engine = self.metadata.get('engine')
+        torch.backends.quantized.engine = engine if engine in torch.backends.quantized.supported_engines \
+            else quantized_engine()
+        if self.device.type != 'cpu':
+            print("The int8 Wav2Lip runs on the CPU; tensors are copied to and from the device")
+        return module
+
+    def encode_audio(self, audio_sequences):
+        return super().encode_audio(audio_sequences.cpu()).to(self.device)
+
+    def encode_face(self, face_sequences):
+        return [f.to(self.device) for f in super().encode_face(face_sequences.cpu())]
+
+    def decode(self, audio_embedding, feats):
+        return super().decode(audio_embedding.cpu(), [f.cpu() for f in feats]).to(self.device)
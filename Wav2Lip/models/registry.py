@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+
+# Precision name -> dtype the weights are cast to after loading
+PRECISIONS = {
+    'fp32': torch.float32,
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16,
+}
+
+
+def load_wav2lip(checkpoint_path, device):
+    """Wav2Lip generator from a training checkpoint (or a bare state dict), in eval mode."""
+    from .wav2lip import Wav2Lip
+
+    checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+    state_dict = checkpoint['state_dict'] if 'state_dict' in checkpoint else checkpoint
+    # Checkpoints saved from nn.DataParallel prefix every key with 'module.'
+    state_dict = {k.replace('module.', ''): v for k, v in state_dict.items()}
+    model = Wav2Lip()
+    model.load_state_dict(state_dict)
+    return model.to(device).eval()
+
+
+class ModelRegistry(object):
+    """Process-wide cache of loaded models, shared by every caller.
+
+    A model is loaded once per (kind, checkpoint, device, precision,
+    optimized) and handed to every later caller as the same instance, so
+    callers must not modify it. Models are evicted least-recently-used first once their
+    parameters and buffers use more than max_bytes; an evicted model is
+    freed when its last user drops it, and loaded again on the next ``get``.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.loaders = {'wav2lip': load_wav2lip}
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def register_loader(self, kind, loader):
+        """Make ``get(kind, ...)`` work without a loader argument.
+
+        Args:
+            kind (str): Model kind, e.g. 'wav2lip' or 's3fd'
+            loader (callable): loader(checkpoint_path, device) -> nn.Module in eval mode
+        """
+        self.loaders[kind] = loader
+
+    @staticmethod
+    def key(kind, checkpoint_path, device, precision='fp32', optimize=False):
+        checkpoint_path = os.path.abspath(checkpoint_path) if checkpoint_path else None
+        return (kind, checkpoint_path, str(torch.device(device)), precision, bool(optimize))
+
+    @staticmethod
+    def model_bytes(model):
+        if not isinstance(model, torch.nn.Module):
+            # Exported models (see backends.py) report their own size
+            return getattr(model, 'nbytes', 0)
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def get(self, kind, checkpoint_path, device, precision='fp32', loader=None, optimize=False):
+        """The model of a checkpoint, loaded on first use.
+
+        Args:
+            kind (str): Model kind, e.g. 'wav2lip' or 's3fd'
+            checkpoint_path (str): Weights file
+            device: Torch device (or its name) the model runs on
+            precision (str): 'fp32', 'fp16' or 'bf16'
+            loader (callable, optional): loader(checkpoint_path, device) -> nn.Module
+                (or an exported model, see ``backends.load_backend``), for kinds
+                without a registered loader
+            optimize (bool): Fold BatchNorm and switch to channels_last (see
+                ``fusion.optimize_for_inference``)
+
+        Returns:
+            torch.nn.Module: The shared model, in eval mode
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r} (expected one of {', '.join(PRECISIONS)})")
+        key = self.key(kind, checkpoint_path, device, precision, optimize)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry['hits'] += 1
+                self.hits += 1
+                return entry['model']
+
+            loader = loader or self.loaders.get(kind)
+            if loader is None:
+                raise KeyError(f"No loader registered for model kind {kind!r}")
+            start = time.perf_counter()
+            model = loader(checkpoint_path, torch.device(device))
+            if optimize:
+                from .fusion import optimize_for_inference
+                model = optimize_for_inference(model, inplace=True)
+            if precision != 'fp32':
+                model = model.to(PRECISIONS[precision])
+            entry = {
+                'model': model,
+                'bytes': self.model_bytes(model),
+                'load_seconds': time.perf_counter() - start,
+                'hits': 0,
+            }
+            self.misses += 1
+            variant = precision + (', optimized' if optimize else '')
+            print(f"Loaded {kind} from {checkpoint_path} on {key[2]} ({variant}) in {entry['load_seconds']:.2f}s, "
+                  f"{entry['bytes'] / 2 ** 20:.1f} MB")
+
+            self.entries[key] = entry
+            self.bytes += entry['bytes']
+            self._evict(keep=key)
+            return model
+
+    def _evict(self, keep=None):
+        evicted_cuda = False
+        while self.max_bytes is not None and self.bytes > self.max_bytes:
+            key = next((k for k in self.entries if k != keep), None)
+            if key is None:
+                break
+            entry = self.entries.pop(key)
+            self.bytes -= entry['bytes']
+            self.evictions += 1
+            evicted_cuda = evicted_cuda or key[2].startswith('cuda')
+            print(f"Evicted {key[0]} ({key[1]}, {key[2]}) from the model registry")
+        if evicted_cuda:
+            torch.cuda.empty_cache()
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Per model: kind, checkpoint, device, precision, optimized, load time, size and hits (LRU first)."""
+        with self._lock:
+            models = [{
+                'kind': kind,
+                'checkpoint': checkpoint_path,
+                'device': device,
+                'precision': precision,
+                'optimized': optimized,
+                'load_seconds': entry['load_seconds'],
+                'bytes': entry['bytes'],
+                'hits': entry['hits'],
+            } for (kind, checkpoint_path, device, precision, optimized), entry in self.entries.items()]
+            return {
+                'models': models,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Model registry: {len(stats['models'])} model(s), {stats['bytes'] / 2 ** 20:.1f} MB, "
+              f"{stats['hits']} hits, {stats['misses']} loads, {stats['evictions']} evictions")
+        for model in stats['models']:
+            name = os.path.basename(model['checkpoint']) if model['checkpoint'] else '-'
+            precision = model['precision'] + ('+opt' if model['optimized'] else '')
+            print(f"  {model['kind']:<19} {name:<24} {model['device']:<8} {precision:<9} "
+                  f"{model['bytes'] / 2 ** 20:>8.1f} MB  loaded in {model['load_seconds']:.2f}s, {model['hits']} hits")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """The registry shared by the whole process."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -84,36 +84,52 @@ class Wav2Lip(nn.Module):
             nn.Conv2d(32, 3, kernel_size=1, stride=1, padding=0),
             nn.Sigmoid()) 
 
-    def forward(self, audio_sequences, face_sequences):
-        # audio_sequences = (B, T, 1, 80, 16)
-        B = audio_sequences.size(0)
-
-        input_dim_size = len(face_sequences.size())
-        if input_dim_size > 4:
-            audio_sequences = torch.cat([audio_sequences[:, i] for i in range(audio_sequences.size(1))], dim=0)
-            face_sequences = torch.cat([face_sequences[:, :, i] for i in range(face_sequences.size(2))], dim=0)
-
-        audio_embedding = self.audio_encoder(audio_sequences) # B, 512, 1, 1
-
+    def encode_face(self, face_sequences):
+        """Skip-connection features of a (N, 6, 96, 96) face batch; they do not depend on the audio."""
         feats = []
         x = face_sequences
         for f in self.face_encoder_blocks:
             x = f(x)
             feats.append(x)
+        return feats
+
+    def encode_audio(self, audio_sequences):
+        """Embedding (N, 512, 1, 1) of a (N, 1, 80, 16) batch of mel windows."""
+        return self.audio_encoder(audio_sequences)
+
+    def encode_audio_chunks(self, audio_sequences, batch_size=512):
+        """Embed every mel window of a clip at once, in batches of batch_size."""
+        return torch.cat([self.encode_audio(audio_sequences[i:i + batch_size])
+                          for i in range(0, len(audio_sequences), batch_size)], dim=0)
 
+    def decode(self, audio_embedding, feats):
+        """Generate faces from audio embeddings and the matching encode_face features."""
         x = audio_embedding
-        for f in self.face_decoder_blocks:
+        for i, f in enumerate(self.face_decoder_blocks):
             x = f(x)
+            skip = feats[len(feats) - 1 - i]
             try:
-                x = torch.cat((x, feats[-1]), dim=1)
+                x = torch.cat((x, skip), dim=1)
             except Exception as e:
                 print(x.size())
-                print(feats[-1].size())
+                print(skip.size())
                 raise e
-            
-            feats.pop()
 
-        x = self.output_block(x)
+        return self.output_block(x)
+
+    def forward(self, audio_sequences, face_sequences):
+        # audio_sequences = (B, T, 1, 80, 16)
+        B = audio_sequences.size(0)
+
+        input_dim_size = len(face_sequences.size())
+        if input_dim_size > 4:
+            audio_sequences = torch.cat([audio_sequences[:, i] for i in range(audio_sequences.size(1))], dim=0)
+            face_sequences = torch.cat([face_sequences[:, :, i] for i in range(face_sequences.size(2))], dim=0)
+
+        audio_embedding = self.encode_audio(audio_sequences) # B, 512, 1, 1
+        feats = self.encode_face(face_sequences)
+
+        x = self.decode(audio_embedding, feats)
 
         if input_dim_size > 4:
             x = torch.split(x, B, dim=0) # [(B, C, H, W)]
@@ -4,6 +4,8 @@ if sys.version_info[0] < 3 and sys.version_info[1] < 2:
 	raise Exception("Must be using >= Python 3.2")
 
 from os import listdir, path
+# The face detector loads its weights through Wav2Lip.models.registry
+sys.path.append(path.abspath(path.join(path.dirname(__file__), "..")))
 
 if not path.isfile('face_detection/detection/sfd/s3fd.pth'):
 	raise FileNotFoundError('Save the s3fd model to face_detection/detection/sfd/s3fd.pth \
@@ -24,13 +26,17 @@ parser = argparse.ArgumentParser()
 
 parser.add_argument('--ngpu', help='Number of GPUs across which to run in parallel', default=1, type=int)
 parser.add_argument('--batch_size', help='Single GPU Face detection batch size', default=32, type=int)
+parser.add_argument('--cpu_workers', help='Detect faces on the CPU in this many processes instead of on GPUs',
+					default=0, type=int)
+parser.add_argument('--cpu_threads', help='Torch threads of each CPU worker (default: cores / cpu_workers)',
+					default=None, type=int)
 parser.add_argument("--data_root", help="Root folder of the LRS2 dataset", required=True)
 parser.add_argument("--preprocessed_root", help="Root folder of the preprocessed dataset", required=True)
 
 args = parser.parse_args()
 
-fa = [face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False, 
-									device='cuda:{}'.format(id)) for id in range(args.ngpu)]
+# Built in main(): the CPU workers are spawned processes, which import this module again
+fa = []
 
 template = 'ffmpeg -loglevel panic -y -i {} -strict -2 {}'
 # template2 = 'ffmpeg -hide_banner -loglevel panic -threads 1 -y -i {} -async 1 -ac 1 -vn -acodec pcm_s16le -ar 16000 {}'
@@ -89,7 +95,19 @@ def mp_handler(job):
 		traceback.print_exc()
 		
 def main(args):
-	print('Started processing for {} with {} GPUs'.format(args.data_root, args.ngpu))
+	if args.cpu_workers > 0:
+		from face_detection.detection.pool import DetectionPool
+		pool = DetectionPool(num_workers=args.cpu_workers, threads_per_worker=args.cpu_threads)
+		pool.start()
+		fa.append(face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False,
+												device='cpu', face_detector=pool))
+		# One video at a time; its batches are split across the workers
+		args.ngpu = 1
+		print('Started processing for {} with {} CPU workers'.format(args.data_root, args.cpu_workers))
+	else:
+		fa.extend(face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False,
+												device='cuda:{}'.format(id)) for id in range(args.ngpu))
+		print('Started processing for {} with {} GPUs'.format(args.data_root, args.ngpu))
 
 	filelist = glob(path.join(args.data_root, '*/*.mp4'))
 
@@ -97,6 +115,8 @@ def main(args):
 	p = ThreadPoolExecutor(args.ngpu)
 	futures = [p.submit(mp_handler, j) for j in jobs]
 	_ = [r.result() for r in tqdm(as_completed(futures), total=len(futures))]
+	if args.cpu_workers > 0:
+		fa[0].face_detector.close()
 
 	print('Dumping audios...')
 
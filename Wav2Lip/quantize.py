@@ -0,0 +1,164 @@
+"""Int8 post-training quantization of a Wav2Lip checkpoint, for CPU inference.
+
+1. Record calibration samples from real jobs:
+       python inference.py ... --record_calibration calibration/
+   (or LipSyncEngine(calibration_dir='calibration/')), which keeps a sample
+   of the face crops and mel windows each job feeds to the model.
+2. Quantize:
+       python quantize.py --checkpoint_path checkpoints/wav2lip_gan.pth --calibration calibration/ \
+           --syncnet_checkpoint checkpoints/lipsync_expert.pth
+3. Run the int8 checkpoint:
+       python inference.py --checkpoint_path checkpoints/wav2lip_gan.int8.pt --backend int8 ...
+
+Part of the recorded segments is held out of calibration and used for the
+report: CPU speed of the float and int8 models, how far the int8 faces are
+from the float ones (PSNR), and, with --syncnet_checkpoint, LSE-D / LSE-C
+style sync scores of both (distance between the SyncNet embeddings of the
+generated mouths and of the audio, at the best audio offset, and its margin
+over the median offset). The report is printed and saved next to the output.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import json
+import time
+import numpy as np
+import torch
+
+from Wav2Lip.models.backends import checkpoint_hash
+from Wav2Lip.models.fusion import optimize_for_inference
+from Wav2Lip.models.quantization import (QuantizedWav2Lip, load_calibration, quantize_wav2lip, quantized_engine,
+											save_quantized)
+from Wav2Lip.models.registry import load_wav2lip
+from Wav2Lip.models.syncnet import SyncNet_color
+
+parser = argparse.ArgumentParser(description='Static int8 quantization of a Wav2Lip checkpoint')
+parser.add_argument('--checkpoint_path', type=str, required=True, help='Float Wav2Lip checkpoint')
+parser.add_argument('--calibration', nargs='+', required=True,
+					help='Calibration .npz files, or directories of them (see --record_calibration in inference.py)')
+parser.add_argument('--outfile', type=str, default=None,
+					help='Int8 checkpoint to write (default: <checkpoint>.int8.pt next to the checkpoint)')
+parser.add_argument('--syncnet_checkpoint', type=str, default=None,
+					help='Lip-sync expert (lipsync_expert.pth) for the LSE-D / LSE-C report')
+parser.add_argument('--holdout', type=float, default=0.2,
+					help='Fraction of the recorded segments kept out of calibration for the report')
+parser.add_argument('--batch_size', type=int, default=64)
+parser.add_argument('--max_offset', type=int, default=5, help='Audio offsets (frames) searched by the sync score')
+parser.add_argument('--threads', type=int, default=None)
+args = parser.parse_args()
+
+
+def load_syncnet(path):
+	checkpoint = torch.load(path, map_location=lambda storage, loc: storage)
+	state_dict = checkpoint['state_dict'] if 'state_dict' in checkpoint else checkpoint
+	model = SyncNet_color()
+	model.load_state_dict({k.replace('module.', ''): v for k, v in state_dict.items()})
+	return model.eval()
+
+def generate(model, mel, faces):
+	"""Generated faces of a segment, and the seconds it took."""
+	start = time.perf_counter()
+	preds = [model(mel[i:i + args.batch_size], faces[i:i + args.batch_size])
+				for i in range(0, len(mel), args.batch_size)]
+	return torch.cat(preds), time.perf_counter() - start
+
+def sync_scores(syncnet, preds, mel):
+	"""(LSE-D, LSE-C) of consecutive generated faces (T, 3, 96, 96) against their mel windows (T, 1, 80, 16)."""
+	k = args.max_offset
+	lower = preds[:, :, preds.size(2) // 2:]
+	# 5-frame windows of the lower half, stacked on the channels as in color_syncnet_train.py
+	windows = torch.cat([lower[i:len(preds) - 4 + i] for i in range(5)], dim=1)
+	n = len(windows)
+	if n <= 2 * k:
+		return None
+	audio_embedding, face_embedding = syncnet(mel[:n], windows)
+	dists = [(face_embedding[k:n - k] - audio_embedding[k + offset:n - k + offset]).norm(dim=1).mean().item()
+				for offset in range(-k, k + 1)]
+	return min(dists), float(np.median(dists)) - min(dists)
+
+def psnr(a, b):
+	mse = ((a - b) ** 2).mean().item()
+	return float('inf') if mse == 0 else 10 * np.log10(1. / mse)
+
+def main():
+	if args.threads:
+		torch.set_num_threads(args.threads)
+	torch.set_grad_enabled(False)
+	outfile = args.outfile or os.path.splitext(args.checkpoint_path)[0] + '.int8.pt'
+
+	segments = load_calibration(args.calibration)
+	if not segments:
+		raise ValueError('No calibration samples found in {}'.format(', '.join(args.calibration)))
+	held_out = int(round(len(segments) * args.holdout)) if len(segments) > 1 else 0
+	held_out = min(max(held_out, 1 if len(segments) > 1 else 0), len(segments) - 1)
+	calibration, report_segments = segments[:len(segments) - held_out], segments[len(segments) - held_out:]
+	if not report_segments:
+		print('Only one recorded segment: the report runs on the calibration data')
+		report_segments = calibration
+	calibration_frames = sum(len(mel) for mel, _ in calibration)
+	print('Calibrating on {} frames ({} segments), {} held out'.format(calibration_frames, len(calibration),
+																		len(segments) - len(calibration)))
+
+	engine = quantized_engine()
+	model = load_wav2lip(args.checkpoint_path, torch.device('cpu'))
+	start = time.perf_counter()
+	quantized = quantize_wav2lip(model, calibration, batch_size=args.batch_size, engine=engine)
+	print('Quantized in {:.1f}s ({} kernels)'.format(time.perf_counter() - start, engine))
+	metadata = {
+		'checkpoint': os.path.basename(args.checkpoint_path),
+		'checkpoint_sha256': checkpoint_hash(args.checkpoint_path),
+		'engine': engine,
+		'calibration_frames': calibration_frames,
+		'torch': torch.__version__,
+	}
+	save_quantized(quantized, outfile, metadata)
+	print('Saved the int8 checkpoint to {}'.format(outfile))
+
+	# Compared as deployed: the optimized eager model against the frozen int8 checkpoint
+	float_model, int8_model = optimize_for_inference(model), QuantizedWav2Lip(outfile, 'cpu')
+	syncnet = load_syncnet(args.syncnet_checkpoint) if args.syncnet_checkpoint else None
+	generate(float_model, *report_segments[0])  # warm-up
+	generate(int8_model, *report_segments[0])
+	frames, seconds, scores, similarity = 0, {'fp32': 0., 'int8': 0.}, {'fp32': [], 'int8': []}, []
+	for mel, faces in report_segments:
+		preds = {}
+		for name, m in (('fp32', float_model), ('int8', int8_model)):
+			preds[name], elapsed = generate(m, mel, faces)
+			seconds[name] += elapsed
+			if syncnet is not None:
+				score = sync_scores(syncnet, preds[name], mel)
+				if score is not None:
+					scores[name].append(score)
+		frames += len(mel)
+		similarity.append(psnr(preds['fp32'], preds['int8']))
+
+	report = {
+		'frames': frames,
+		'threads': torch.get_num_threads(),
+		'batch_size': args.batch_size,
+		'fp32_frames_per_second': frames / seconds['fp32'],
+		'int8_frames_per_second': frames / seconds['int8'],
+		'speedup': seconds['fp32'] / seconds['int8'],
+		'psnr_vs_fp32': float(np.mean(similarity)),
+	}
+	for name in ('fp32', 'int8'):
+		if scores[name]:
+			report[name + '_lse_d'] = float(np.mean([d for d, _ in scores[name]]))
+			report[name + '_lse_c'] = float(np.mean([c for _, c in scores[name]]))
+
+	print('\n{} held-out frames, {} threads, batch size {}'.format(frames, report['threads'], args.batch_size))
+	print('{:>6} {:>9} {:>8} {:>8} {:>10}'.format('', 'frames/s', 'LSE-D', 'LSE-C', 'PSNR (dB)'))
+	for name in ('fp32', 'int8'):
+		lse_d = '{:8.3f}'.format(report[name + '_lse_d']) if name + '_lse_d' in report else '{:>8}'.format('-')
+		lse_c = '{:8.3f}'.format(report[name + '_lse_c']) if name + '_lse_c' in report else '{:>8}'.format('-')
+		quality = '{:10.1f}'.format(report['psnr_vs_fp32']) if name == 'int8' else '{:>10}'.format('-')
+		print('{:>6} {:9.1f} {} {} {}'.format(name, report[name + '_frames_per_second'], lse_d, lse_c, quality))
+	print('int8 speed-up: {:.2f}x (lower LSE-D and higher LSE-C are better)'.format(report['speedup']))
+
+	report_path = os.path.splitext(outfile)[0] + '.report.json'
+	with open(report_path, 'w') as f:
+		json.dump(dict(metadata, **report), f, indent=2)
+	print('Report saved to {}'.format(report_path))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,157 @@
+"""Int8 post-training quantization of the S3FD face detector, for CPU detection.
+
+Calibrates on frames with faces sampled from the given videos and writes
+face_detection/detection/sfd/s3fd.int8.pt, which the 'sfd_int8' detector
+backend runs:
+
+    python quantize_s3fd.py --videos talking_head.mp4 interview.mp4
+    python inference.py ... --face_detector sfd_int8
+    FaceAlignment(LandmarksType._2D, device='cpu', face_detector='sfd_int8')
+
+Every --holdout_every-th sampled frame is kept out of calibration for the
+report: per-frame CPU latency of the float and int8 detectors, and how well
+their boxes agree (recall and precision of the int8 boxes against the float
+ones at IoU 0.5, both cut at the 0.5 score threshold of detect_from_batch;
+mean IoU and score difference of the matched boxes). The boxes are compared
+again with each --min_face_sizes, for which both networks skip the same
+fine detection heads. The report is printed and saved next to the output.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+import torch
+
+from Wav2Lip.face_detection.detection.sfd.detect import first_head_for
+from Wav2Lip.face_detection.detection.sfd.quantized import (INT8_PATH, QuantizedSFDDetector, box_agreement,
+																quantize_s3fd, save_quantized_s3fd)
+from Wav2Lip.face_detection.detection.sfd.sfd_detector import SFDDetector, load_s3fd
+from Wav2Lip.models.backends import checkpoint_hash
+from Wav2Lip.models.quantization import quantized_engine
+
+parser = argparse.ArgumentParser(description='Static int8 quantization of the S3FD face detector')
+parser.add_argument('--videos', nargs='+', required=True, help='Videos with faces to calibrate on')
+parser.add_argument('--frames_per_video', type=int, default=64, help='Frames sampled evenly from each video')
+parser.add_argument('--max_height', type=int, default=480,
+					help='Frames are downscaled to this height, as the detection pipeline does')
+parser.add_argument('--holdout_every', type=int, default=4,
+					help='Keep every Nth sampled frame out of calibration, for the report')
+parser.add_argument('--s3fd_checkpoint', type=str,
+					default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'face_detection', 'detection',
+										'sfd', 's3fd.pth'))
+parser.add_argument('--min_face_sizes', nargs='*', type=int, default=[100, 300],
+					help='Also compare the boxes with these min_face_size settings (pixels)')
+parser.add_argument('--outfile', type=str, default=INT8_PATH)
+parser.add_argument('--threads', type=int, default=None)
+args = parser.parse_args()
+
+
+def sample_frames(path):
+	"""Evenly spaced frames of a video, downscaled to max_height, as detect_from_batch gets them (RGB)."""
+	video = cv2.VideoCapture(path)
+	total = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+	step = max(1, total // args.frames_per_video) if total > 0 else 1
+	frames, index = [], 0
+	while len(frames) < args.frames_per_video:
+		still_reading, frame = video.read()
+		if not still_reading:
+			break
+		if index % step == 0:
+			if frame.shape[0] > args.max_height:
+				scale = args.max_height / float(frame.shape[0])
+				frame = cv2.resize(frame, (int(round(frame.shape[1] * scale)), args.max_height),
+									interpolation=cv2.INTER_AREA)
+			frames.append(np.ascontiguousarray(frame[..., ::-1]))
+		index += 1
+	video.release()
+	return frames
+
+def detect_each(detector, frames):
+	"""Detections of every frame, one frame per call, and the seconds each took."""
+	detections, seconds = [], []
+	for frame in frames:
+		start = time.perf_counter()
+		detections.append(detector.detect_from_batch(frame[None])[0])
+		seconds.append(time.perf_counter() - start)
+	return detections, seconds
+
+def main():
+	if args.threads:
+		torch.set_num_threads(args.threads)
+	torch.set_grad_enabled(False)
+	cpu = torch.device('cpu')
+
+	frames = []
+	for path in args.videos:
+		frames.extend(sample_frames(path))
+	if not frames:
+		raise ValueError('No frames could be read from {}'.format(', '.join(args.videos)))
+	held_out = frames[::args.holdout_every]
+	calibration = [frame for i, frame in enumerate(frames) if i % args.holdout_every]
+
+	# Calibrate on frames with faces only: activation ranges follow the inputs that matter
+	float_detector = SFDDetector(cpu, path_to_detector=args.s3fd_checkpoint)
+	calibration = [frame for frame in calibration if len(float_detector.detect_from_batch(frame[None])[0])]
+	if not calibration:
+		raise ValueError('S3FD found no face in the calibration frames')
+	print('Calibrating on {} frames with faces, {} frames held out'.format(len(calibration), len(held_out)))
+
+	engine = quantized_engine()
+	start = time.perf_counter()
+	net = quantize_s3fd(load_s3fd(args.s3fd_checkpoint, cpu), calibration, engine=engine)
+	print('Quantized in {:.1f}s ({} kernels)'.format(time.perf_counter() - start, engine))
+	metadata = {
+		'checkpoint': os.path.basename(args.s3fd_checkpoint),
+		'checkpoint_sha256': checkpoint_hash(args.s3fd_checkpoint) if os.path.isfile(args.s3fd_checkpoint) else None,
+		'engine': engine,
+		'calibration_frames': len(calibration),
+		'torch': torch.__version__,
+	}
+	save_quantized_s3fd(net, args.outfile, metadata, calibration[0])
+	print('Saved the int8 S3FD to {}'.format(args.outfile))
+
+	int8_detector = QuantizedSFDDetector(cpu, path_to_detector=args.outfile)
+	for detector in (float_detector, int8_detector):
+		detector.detect_from_batch(held_out[0][None])  # warm-up
+	reference, float_seconds = detect_each(float_detector, held_out)
+	detections, int8_seconds = detect_each(int8_detector, held_out)
+	report = box_agreement(reference, detections, iou_threshold=0.5)
+	report.update({
+		'threads': torch.get_num_threads(),
+		'frame_size': list(held_out[0].shape[:2]),
+		'fp32_ms_per_frame': 1000 * float(np.median(float_seconds)),
+		'int8_ms_per_frame': 1000 * float(np.median(int8_seconds)),
+	})
+	report['speedup'] = report['fp32_ms_per_frame'] / report['int8_ms_per_frame']
+
+	report['min_face_size'] = {}
+	for min_face_size in args.min_face_sizes:
+		float_detector.min_face_size = int8_detector.min_face_size = min_face_size
+		agreement = box_agreement(detect_each(float_detector, held_out)[0], detect_each(int8_detector, held_out)[0],
+									iou_threshold=0.5)
+		agreement['first_head'] = first_head_for(min_face_size)
+		report['min_face_size'][str(min_face_size)] = agreement
+
+	print('\n{} held-out frames ({}x{}), {} faces, {} threads'.format(
+		report['frames'], held_out[0].shape[1], held_out[0].shape[0], report['faces'], report['threads']))
+	print('Latency per frame: fp32 {:.1f} ms, int8 {:.1f} ms ({:.2f}x)'.format(
+		report['fp32_ms_per_frame'], report['int8_ms_per_frame'], report['speedup']))
+	print('Boxes vs fp32 at IoU 0.5 / score 0.5: recall {:.1%}, precision {:.1%}, mean IoU {:.3f}, '
+		'mean score difference {:.3f}, same face count on {:.1%} of frames'.format(
+		report['recall'], report['precision'], report['mean_iou'], report['mean_score_diff'],
+		report['same_face_count']))
+	for min_face_size, agreement in report['min_face_size'].items():
+		print('  min_face_size {} (heads from {}): recall {:.1%}, precision {:.1%}, mean IoU {:.3f}'.format(
+			min_face_size, agreement['first_head'], agreement['recall'], agreement['precision'],
+			agreement['mean_iou']))
+
+	report_path = os.path.splitext(args.outfile)[0] + '.report.json'
+	with open(report_path, 'w') as f:
+		json.dump(dict(metadata, **report), f, indent=2)
+	print('Report saved to {}'.format(report_path))
+
+if __name__ == '__main__':
+	main()
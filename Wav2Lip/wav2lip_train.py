@@ -1,3 +1,5 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from os.path import dirname, join, basename, isfile
 from tqdm import tqdm
 
@@ -16,6 +18,7 @@ from glob import glob
 
 import os, random, cv2, argparse
 from hparams import hparams, get_image_list
+from app.core.cache import MelCache
 
 parser = argparse.ArgumentParser(description='Code to train the Wav2Lip model without the visual quality discriminator')
 
@@ -26,6 +29,8 @@ parser.add_argument('--syncnet_checkpoint_path', help='Load the pre-trained Expe
 
 parser.add_argument('--checkpoint_path', help='Resume from this checkpoint', default=None, type=str)
 
+parser.add_argument('--mel_cache_gb', help='Disk budget of the mel spectrogram cache, in GB', default=8., type=float)
+
 args = parser.parse_args()
 
 
@@ -37,6 +42,8 @@ print('use_cuda: {}'.format(use_cuda))
 syncnet_T = 5
 syncnet_mel_step_size = 16
 
+mel_cache = MelCache(max_bytes=int(args.mel_cache_gb * 2**30))
+
 class Dataset(object):
     def __init__(self, split):
         self.all_videos = get_image_list(args.data_root, split)
@@ -136,9 +143,8 @@ class Dataset(object):
 
             try:
                 wavpath = join(vidname, "audio.wav")
-                wav = audio.load_wav(wavpath, hparams.sample_rate)
-
-                orig_mel = audio.melspectrogram(wav).T
+                # Memory-mapped from the mel cache after the first epoch
+                orig_mel = mel_cache.melspectrogram(wavpath, hparams.sample_rate, audio_module=audio).T
             except Exception as e:
                 continue
 
@@ -1,21 +1,31 @@
-import Wav2Lip
+from Wav2Lip import audio
+from app.core.cache import MelCache
 
 class AudioProcessor:
+    # Shared by every instance: the same audio is never processed twice
+    mel_cache = MelCache()
+
     def __init__(self, audio):
         self.audio = audio
-        self.video.metadata = {}
+        self.metadata = {}
         
-    def process_audio(self, audio_path):
+    @classmethod
+    def process_audio(cls, audio_path, sr=16000):
         """
         Process the input audio file to create mel spectrogram.
 
+        Results are cached on disk by audio content and mel hparams, so
+        re-rendering the same audio against another video (or re-opening
+        a project) does no audio work.
+
         Args:
             audio_path (str): Path to the input audio file
+            sr (int): Sample rate the audio is resampled to
 
         Returns:
             numpy.ndarray: Mel spectrogram of the audio
         """
-        audio = Wav2Lip.audio
-        wav = audio.load_wav(audio_path, sr=16000)
-        mel = audio.melspectrogram(wav)
-        return mel
\ No newline at end of file
+        if cls.mel_cache is None:
+            wav = audio.load_wav(audio_path, sr=sr)
+            return audio.melspectrogram(wav)
+        return cls.mel_cache.melspectrogram(audio_path, sr, audio_module=audio)
\ No newline at end of file
@@ -0,0 +1,393 @@
+"""On-disk caches of expensive per-file results (face tracks, mel spectrograms).
+
+    python -m app.core.cache stats
+    python -m app.core.cache invalidate video.mp4 voice.wav
+    python -m app.core.cache clear
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+
+# Shared root of the on-disk caches
+DEFAULT_CACHE_DIR = os.environ.get('LIPSYNC_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'lip-sync-program'))
+
+# Bump when the layout of the cached arrays changes
+CACHE_VERSION = 1
+
+# hparams that change the output of Wav2Lip.audio.melspectrogram
+MEL_HPARAMS = ['num_mels', 'n_fft', 'hop_size', 'win_size', 'frame_shift_ms', 'sample_rate', 'fmin', 'fmax',
+               'preemphasize', 'preemphasis', 'signal_normalization', 'allow_clipping_in_normalization',
+               'symmetric_mels', 'max_abs_value', 'min_level_db', 'ref_level_db', 'use_lws']
+
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """
+    Hash the content of a file.
+
+    The result is memoized per (path, size, mtime), so a file is only read
+    once per process as long as it is not modified.
+
+    Args:
+        path (str): Path to the file
+        chunk_size (int): Read size in bytes
+
+    Returns:
+        str: Hex digest of the file content
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    with _hash_lock:
+        _hash_memo[memo_key] = content_hash
+    return content_hash
+
+
+class DiskArrayCache:
+    def __init__(self, namespace, cache_dir=None, max_bytes=512 * 1024 * 1024):
+        """
+        Content-addressed cache of numpy arrays on disk.
+
+        Entries are keyed by the hash of an input file plus the parameters
+        that produced them, stored as ``.npy`` files with a small JSON
+        sidecar, and evicted least-recently-used first once the directory
+        grows past ``max_bytes``.
+
+        Args:
+            namespace (str): Sub-directory of the cache root (e.g. 'face_tracks')
+            cache_dir (str, optional): Cache root (defaults to DEFAULT_CACHE_DIR)
+            max_bytes (int): Disk budget of this namespace
+        """
+        self.directory = os.path.join(cache_dir or DEFAULT_CACHE_DIR, namespace)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._approx_bytes = None  # Size estimate, so stores do not rescan the directory every time
+
+    def key(self, content_path, **params):
+        """
+        Build the cache key of a file processed with the given parameters.
+
+        Args:
+            content_path (str): Input file; its content (not its name) is hashed
+            **params: Every parameter that changes the cached result
+
+        Returns:
+            str: Cache key
+        """
+        params = dict(params, version=CACHE_VERSION)
+        params_hash = hashlib.blake2b(json.dumps(params, sort_keys=True, default=str).encode(),
+                                      digest_size=8).hexdigest()
+        return f"{file_content_hash(content_path)}-{params_hash}"
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.npy', base + '.json'
+
+    def load(self, key, mmap_mode=None):
+        """
+        Look an entry up.
+
+        Args:
+            key (str): Key from ``key``
+            mmap_mode (str, optional): Memory-map the array instead of reading it (e.g. 'r')
+
+        Returns:
+            tuple: (array, metadata), or None on a miss
+        """
+        array_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            array = np.load(array_path, mmap_mode=mmap_mode)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Mark as recently used
+        now = time.time()
+        for path in (array_path, meta_path):
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        with self._lock:
+            self.hits += 1
+        return array, meta
+
+    def record_miss(self):
+        """Count a lookup whose entry exists but cannot be used."""
+        with self._lock:
+            self.hits -= 1
+            self.misses += 1
+
+    def store(self, key, array, **meta):
+        """
+        Store an entry, then evict old entries if the cache is over budget.
+
+        Args:
+            key (str): Key from ``key``
+            array (numpy.ndarray): Data to store
+            **meta: JSON-serializable metadata returned by ``load``
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        array_path, meta_path = self._paths(key)
+
+        # Write under temporary names and rename, so readers never see a partial entry
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(array_path + suffix, 'wb') as f:
+            np.save(f, array)
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(dict(meta, created=time.time()), f, default=str)
+        os.replace(array_path + suffix, array_path)
+        os.replace(meta_path + suffix, meta_path)
+
+        with self._lock:
+            self.stores += 1
+            if self._approx_bytes is not None:
+                self._approx_bytes += os.path.getsize(array_path) + os.path.getsize(meta_path)
+        if self._approx_bytes is None or self._approx_bytes > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """
+        List the entries of the cache.
+
+        Returns:
+            list: (key, size_in_bytes, last_used) tuples, least recently used first
+        """
+        entries = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        for name in names:
+            key, ext = os.path.splitext(name)
+            if ext not in ('.npy', '.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            size, last_used = entries.get(key, (0, 0.0))
+            entries[key] = (size + stat.st_size, max(last_used, stat.st_mtime))
+        return sorted(((key, size, last_used) for key, (size, last_used) in entries.items()),
+                      key=lambda entry: entry[2])
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in ``max_bytes``."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+        self._approx_bytes = total
+
+    def invalidate(self, content_path=None, key=None):
+        """
+        Remove entries from the cache.
+
+        Args:
+            content_path (str, optional): Remove every entry computed from this file
+            key (str, optional): Remove a single entry
+
+        Returns:
+            int: Number of removed entries
+        """
+        if key is not None:
+            keys = [key]
+        elif content_path is not None:
+            prefix = file_content_hash(content_path) + '-'
+            keys = [k for k, _, _ in self.entries() if k.startswith(prefix)]
+        else:
+            keys = [k for k, _, _ in self.entries()]
+        for k in keys:
+            self._remove(k)
+        self._approx_bytes = None
+        return len(keys)
+
+    def clear(self):
+        return self.invalidate()
+
+    def stats(self):
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"{os.path.basename(self.directory)} cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['entries']} entries ({stats['bytes'] / 2**20:.1f}/{stats['max_bytes'] / 2**20:.0f} MB), "
+              f"{stats['evictions']} evicted")
+
+
+class FaceTrackCache(DiskArrayCache):
+    def __init__(self, cache_dir=None, max_bytes=256 * 1024 * 1024):
+        """
+        Per-frame face boxes of already processed videos.
+
+        Each entry is a float32 array with one (x1, y1, x2, y2, confidence)
+        row per frame, NaN for frames without a face. Entries may cover only
+        the first frames of a video (e.g. when detection stopped at the audio
+        length); ``complete`` tells whether they cover the whole video.
+        """
+        super().__init__('face_tracks', cache_dir, max_bytes)
+
+    def load_tracks(self, key, num_frames=None):
+        """
+        Get the cached boxes of the first ``num_frames`` frames.
+
+        Args:
+            key (str): Key from ``key``
+            num_frames (int, optional): Frames needed (None = the whole video)
+
+        Returns:
+            numpy.ndarray: (frames, 5) array, or None on a miss
+        """
+        entry = self.load(key)
+        if entry is None:
+            return None
+        tracks, meta = entry
+        if meta.get('complete'):
+            return tracks[:num_frames] if num_frames is not None else tracks
+        if num_frames is not None and len(tracks) >= num_frames:
+            return tracks[:num_frames]
+        # Only a prefix of the video is cached and more frames are needed
+        self.record_miss()
+        return None
+
+    def store_tracks(self, key, tracks, complete=True, **meta):
+        """
+        Store the boxes of a video.
+
+        Args:
+            key (str): Key from ``key``
+            tracks (array-like): (frames, 5) boxes and confidences, NaN rows for missing faces
+            complete (bool): Whether every frame of the video is covered
+        """
+        tracks = np.asarray(tracks, dtype=np.float32).reshape(-1, 5)
+        self.store(key, tracks, complete=complete, frames=len(tracks), **meta)
+
+    def load_regions(self, key, num_frames=None):
+        """
+        Cached boxes as a list of [x1, y1, x2, y2, confidence] (None = no face),
+        the format of ``VideoAnalyser.detect_faces``.
+        """
+        tracks = self.load_tracks(key, num_frames)
+        if tracks is None:
+            return None
+        return [None if np.isnan(row[0]) else row for row in tracks]
+
+    def store_regions(self, key, regions, complete=True, **meta):
+        tracks = np.full((len(regions), 5), np.nan, dtype=np.float32)
+        for i, region in enumerate(regions):
+            if region is not None:
+                region = np.asarray(region, dtype=np.float32)[:5]
+                tracks[i, :len(region)] = region
+        self.store_tracks(key, tracks, complete=complete, **meta)
+
+
+
+class MelCache(DiskArrayCache):
+    def __init__(self, cache_dir=None, max_bytes=1024 * 1024 * 1024):
+        """
+        Mel spectrograms of already processed audio files.
+
+        Entries are float32 ``.npy`` files returned memory-mapped, so a hit
+        costs neither the audio decode and STFT nor a full read of the array.
+        """
+        super().__init__('mels', cache_dir, max_bytes)
+
+    def mel_key(self, audio_path, sr, audio_module):
+        """Cache key of an audio file and every hparam that changes its spectrogram."""
+        params = {name: getattr(audio_module.hp, name, None) for name in MEL_HPARAMS}
+        return self.key(audio_path, sr=sr, **params)
+
+    def melspectrogram(self, audio_path, sr=16000, audio_module=None):
+        """
+        Mel spectrogram of an audio file, computed on the first call only.
+
+        Args:
+            audio_path (str): Path to the audio file (any format ``load_wav`` reads)
+            sr (int): Sample rate the audio is resampled to
+            audio_module (module, optional): Wav2Lip ``audio`` module to compute with;
+                its hparams are part of the key (defaults to ``Wav2Lip.audio``)
+
+        Returns:
+            numpy.ndarray: (num_mels, frames) float32 spectrogram (read-only on a hit)
+        """
+        if audio_module is None:
+            from Wav2Lip import audio as audio_module
+        key = self.mel_key(audio_path, sr, audio_module)
+
+        entry = self.load(key, mmap_mode='r')
+        if entry is not None:
+            return entry[0]
+
+        wav = audio_module.load_wav(audio_path, sr)
+        mel = audio_module.melspectrogram(wav).astype(np.float32)
+        self.store(key, mel, audio=os.path.abspath(audio_path))
+        return mel
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or clear the lip-sync caches')
+    parser.add_argument('command', choices=['stats', 'invalidate', 'clear'])
+    parser.add_argument('paths', nargs='*', help='Input files whose entries to invalidate')
+    parser.add_argument('--cache_dir', default=None)
+    args = parser.parse_args()
+
+    for cache in [FaceTrackCache(args.cache_dir), MelCache(args.cache_dir)]:
+        if args.command == 'invalidate':
+            removed = sum(cache.invalidate(path) for path in args.paths)
+            print(f"{os.path.basename(cache.directory)}: removed {removed} entries")
+        elif args.command == 'clear':
+            print(f"{os.path.basename(cache.directory)}: removed {cache.clear()} entries")
+        else:
+            cache.print_stats()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import subprocess
+import cv2
+import numpy as np
+from app.core.video_writer import find_ffmpeg
+
+
+def probe_video(video_path):
+    """
+    Read the basic properties of a video without decoding it.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Returns:
+        tuple: (fps, (width, height), frame_count)
+    """
+    video = cv2.VideoCapture(video_path)
+    fps = video.get(cv2.CAP_PROP_FPS)
+    width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    return fps, (width, height), frame_count
+
+
+class FFmpegFrameDecoder:
+    def __init__(self, video_path, size=None, crop=None, rotate=False, frame_step=1, start=None, end=None,
+                 ffmpeg_path=None, threads=0):
+        """
+        Decode a video through an ffmpeg rawvideo pipe.
+
+        Scaling, rotation, cropping and frame decimation run inside ffmpeg,
+        so Python only receives the final frames. The output has the same
+        shapes as the cv2.VideoCapture + cv2.resize/cv2.rotate/slicing path.
+
+        Args:
+            video_path (str): Path to the input video file
+            size (tuple, optional): (width, height) to scale every frame to
+            crop (tuple, optional): (top, bottom, left, right) applied after scaling and
+                rotation, with the same semantics as ``Wav2Lip/inference.py --crop``
+                (-1 = up to the frame border)
+            rotate (bool): Rotate frames 90 degrees clockwise
+            frame_step (int): Keep every Nth frame (like ``frame_skip``)
+            start (float, optional): Start of the [start, end) range to decode, in seconds
+            end (float, optional): End of the range to decode, in seconds
+            ffmpeg_path (str, optional): ffmpeg executable (auto-detected if None)
+            threads (int): Number of decoder threads (0 = auto)
+        """
+        self.video_path = video_path
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        if self.ffmpeg_path is None:
+            raise RuntimeError("ffmpeg not found")
+
+        self.fps, self.source_size, self.source_frame_count = probe_video(video_path)
+        self.size = (int(size[0]), int(size[1])) if size else None
+        self.rotate = rotate
+        self.frame_step = max(1, int(frame_step))
+        self.start = start
+        self.end = end
+        self.threads = threads
+
+        # Resolve the crop against the scaled/rotated frame, like numpy slicing would
+        width, height = self.size or self.source_size
+        if rotate:
+            width, height = height, width
+        if crop:
+            top, bottom, left, right = crop
+            if bottom == -1: bottom = height
+            if right == -1: right = width
+            y1, y2, _ = slice(top, bottom).indices(height)
+            x1, x2, _ = slice(left, right).indices(width)
+            self.crop = (x1, y1, max(0, x2 - x1), max(0, y2 - y1))
+            width, height = self.crop[2], self.crop[3]
+        else:
+            self.crop = None
+
+        self.frame_size = (width, height)
+        self._process = None
+
+    @property
+    def output_fps(self):
+        return self.fps / self.frame_step
+
+    def _filters(self):
+        filters = []
+        if self.frame_step > 1:
+            # Frames still have to be decoded, but the skipped ones are never scaled or piped
+            filters.append(f"select='not(mod(n\\,{self.frame_step}))'")
+        if self.size and self.size != self.source_size:
+            filters.append(f"scale={self.size[0]}:{self.size[1]}:flags=bilinear")
+        if self.rotate:
+            filters.append("transpose=clock")
+        if self.crop:
+            x, y, w, h = self.crop
+            filters.append(f"crop={w}:{h}:{x}:{y}")
+        return filters
+
+    def command(self):
+        command = [self.ffmpeg_path, '-loglevel', 'error', '-nostdin', '-threads', str(self.threads)]
+        if self.start:
+            # Input seeking: jumps to the nearest keyframe instead of decoding from the start
+            command += ['-ss', str(self.start)]
+        command += ['-i', self.video_path]
+        if self.end is not None:
+            command += ['-t', str(self.end - (self.start or 0))]
+        filters = self._filters()
+        if filters:
+            command += ['-vf', ','.join(filters)]
+        command += ['-vsync', '0', '-an', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+        return command
+
+    def __iter__(self):
+        width, height = self.frame_size
+        frame_bytes = width * height * 3
+        if frame_bytes == 0:
+            return
+
+        self._process = subprocess.Popen(self.command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                         bufsize=frame_bytes)
+        try:
+            while True:
+                # Read straight into a fresh (writable) frame buffer
+                frame = np.empty((height, width, 3), dtype=np.uint8)
+                view = memoryview(frame).cast('B')
+                filled = 0
+                while filled < frame_bytes:
+                    n = self._process.stdout.readinto(view[filled:])
+                    if not n:
+                        break
+                    filled += n
+                if filled < frame_bytes:
+                    break
+                yield frame
+        finally:
+            self.close()
+
+    def close(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.stdout.close()
+            self._process.wait()
+            self._process = None
+
+
+def ffmpeg_decoder_available():
+    return find_ffmpeg() is not None
@@ -0,0 +1,427 @@
+"""Long-lived lip-sync worker.
+
+The worker loads the Wav2Lip checkpoint and the S3FD face detector once and
+then serves jobs over a local socket, streaming progress lines back to the
+client. Later jobs skip the Python/torch start-up and the model loads.
+The worker only accepts clients that present the random key in
+AUTHKEY_PATH, which only the user running it can read.
+
+    python -m app.core.inference_worker serve
+    python -m app.core.inference_worker submit --video in.mp4 --audio voice.wav --outfile out.mp4
+    python -m app.core.inference_worker submit --video in.mp4 --audio en.wav es.wav
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+import traceback
+import contextlib
+import secrets
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+from app.core.cache import DEFAULT_CACHE_DIR
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('LIPSYNC_WORKER_PORT', 47321))
+# Random per-user secret of the worker, readable by its owner only (LIPSYNC_WORKER_AUTHKEY overrides it)
+AUTHKEY_PATH = os.path.join(DEFAULT_CACHE_DIR, 'worker.authkey')
+# Face box padding (top, bottom, left, right) of Wav2Lip/inference.py, which GUI jobs used to run
+INFERENCE_PADS = (0, 10, 0, 0)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_authkey(path=AUTHKEY_PATH):
+    """
+    Shared secret of the worker and its clients, created on first use.
+
+    The connection unpickles whatever it receives, so the key must not be
+    guessable by other local users: it is random and stored with mode 0600.
+
+    Args:
+        path (str): Key file
+
+    Returns:
+        bytes: The authkey
+    """
+    override = os.environ.get('LIPSYNC_WORKER_AUTHKEY')
+    if override:
+        return override.encode()
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Created earlier, or just now by the worker or another client
+        for _ in range(50):
+            with open(path, 'rb') as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError(f"Inference worker key file {path} is empty; delete it to create a new key")
+    key = secrets.token_hex(32).encode()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+class _ProgressStream:
+    """File-like object forwarding every printed line to the client connection."""
+
+    def __init__(self, conn, echo=None):
+        self.conn = conn
+        self.echo = echo
+        self._buffer = ''
+
+    def write(self, text):
+        if self.echo is not None:
+            self.echo.write(text)
+        self._buffer += text
+        while '\n' in self._buffer:
+            line, self._buffer = self._buffer.split('\n', 1)
+            if line.strip():
+                try:
+                    self.conn.send({'type': 'progress', 'message': line})
+                except (OSError, EOFError):
+                    pass  # Client went away; keep working so the output is still produced
+        return len(text)
+
+    def flush(self):
+        if self.echo is not None:
+            self.echo.flush()
+
+
+class InferenceWorker:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, authkey=None,
+                 model_path='wav2lip_gan.pth', low_memory_mode=False, backend='eager'):
+        """
+        Serve lip-sync jobs from a single warm LipSyncEngine.
+
+        Args:
+            host (str): Interface to listen on (local only by default)
+            port (int): Port to listen on
+            authkey (bytes): Shared secret clients must present (default: load_authkey())
+            model_path (str): Wav2Lip checkpoint, relative to app/core
+            low_memory_mode (bool): Enable optimizations for low memory systems
+            backend (str): Default Wav2Lip backend: 'eager', 'torchscript' or 'onnx'
+        """
+        self.address = (host, port)
+        self.authkey = authkey or load_authkey()
+        self.model_path = model_path
+        self.low_memory_mode = low_memory_mode
+        self.backend = backend
+        self.engine = None
+        self.load_seconds = 0.0
+
+    def load(self):
+        from app.core.sync_engine import LipSyncEngine
+
+        start = time.perf_counter()
+        self.engine = LipSyncEngine(model_path=self.model_path, low_memory_mode=self.low_memory_mode,
+                                    backend=self.backend)
+        # Load S3FD now rather than on the first job
+        self.engine.video_analyser.get_detector()
+        self.load_seconds = time.perf_counter() - start
+        print(f"Worker ready (models loaded in {self.load_seconds:.1f}s)")
+
+    def handle(self, conn, job):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(_ProgressStream(conn, echo=sys.__stdout__)):
+            # Each checkpoint is loaded (and exported) once per worker and backend, see
+            # Wav2Lip.models.registry; jobs that do not pick one run on the worker's defaults
+            self.engine.load_model(job.get('model_path') or self.model_path, job.get('backend') or self.backend)
+            # Same output as Wav2Lip/inference.py: source resolution, padded and smoothed face boxes
+            pads = tuple(job.get('pads') or INFERENCE_PADS)
+            smooth = job.get('smooth', True)
+            if job['type'] == 'multi_job':
+                # One decode/detect pass shared by every audio track
+                output_path = self.engine.generate_multi_lip_sync(
+                    job['video_path'], job['audio_paths'], job.get('output_paths'),
+                    cartoon_mode=job.get('cartoon_mode', False),
+                    shot_index_path=job.get('shot_index_path'),
+                    face_detector=job.get('face_detector'),
+                    pads=pads,
+                    smooth=smooth,
+                )
+            else:
+                output_path = self.engine.generate_lip_sync(
+                    job['video_path'], job['audio_path'], job.get('output_path'),
+                    cartoon_mode=job.get('cartoon_mode', False),
+                    streaming=job.get('streaming', False),
+                    face_detector=job.get('face_detector'),
+                    source_resolution=True,
+                    pads=pads,
+                    smooth=smooth,
+                )
+        from Wav2Lip.models.registry import get_model_registry
+        return {
+            'type': 'done',
+            'output_path': output_path,
+            'seconds': time.perf_counter() - start,
+            'stats': self.engine.last_run_stats,
+            # Load time and size of every model the worker holds
+            'models': get_model_registry().stats(),
+        }
+
+    def serve_forever(self):
+        # Bind before loading the models, so a second worker on the same port gives up immediately
+        try:
+            listener = Listener(self.address, authkey=self.authkey)
+        except OSError as e:
+            print(f"Cannot listen on {self.address[0]}:{self.address[1]} ({e}); is another worker running?")
+            return
+
+        with listener:
+            if self.engine is None:
+                self.load()
+            print(f"Worker listening on {self.address[0]}:{self.address[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Rejected connection: {e}")
+                    continue
+
+                with conn:
+                    try:
+                        job = conn.recv()
+                    except (EOFError, OSError):
+                        continue
+
+                    if job.get('type') == 'ping':
+                        conn.send({'type': 'pong', 'load_seconds': self.load_seconds})
+                        continue
+                    if job.get('type') == 'shutdown':
+                        conn.send({'type': 'bye'})
+                        return
+
+                    # Jobs run one at a time: they all share the same model and device
+                    try:
+                        reply = self.handle(conn, job)
+                    except Exception as e:
+                        traceback.print_exc()
+                        reply = {'type': 'error', 'error': f"{type(e).__name__}: {e}"}
+                    try:
+                        conn.send(reply)
+                    except (OSError, EOFError):
+                        print("Client disconnected before the job finished")
+
+
+def _serve(host, port, authkey, model_path, low_memory_mode, backend='eager'):
+    InferenceWorker(host, port, authkey, model_path, low_memory_mode, backend).serve_forever()
+
+
+def supervise(host=DEFAULT_HOST, port=DEFAULT_PORT, authkey=None, model_path='wav2lip_gan.pth',
+              low_memory_mode=False, restart_delay=2.0, backend='eager'):
+    """
+    Run the worker in a child process and restart it whenever it crashes.
+
+    A clean shutdown (exit code 0) stops the supervisor.
+    """
+    while True:
+        process = multiprocessing.Process(target=_serve, args=(host, port, authkey, model_path, low_memory_mode, backend),
+                                          name='lipsync-worker')
+        process.start()
+        process.join()
+        if process.exitcode == 0:
+            return
+        print(f"Worker exited with code {process.exitcode}, restarting in {restart_delay:.0f}s...")
+        time.sleep(restart_delay)
+
+
+class WorkerClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, authkey=None, autostart=True,
+                 startup_timeout=300.0):
+        """
+        Submit jobs to the inference worker, starting it when needed.
+
+        Args:
+            host (str): Worker address
+            port (int): Worker port
+            authkey (bytes): Shared secret of the worker (default: load_authkey())
+            autostart (bool): Spawn a supervised worker if none is running
+            startup_timeout (float): Seconds to wait for a spawned worker to load its models
+        """
+        self.address = (host, port)
+        self.authkey = authkey or load_authkey()
+        self.autostart = autostart
+        self.startup_timeout = startup_timeout
+
+    def _connect(self):
+        return Client(self.address, authkey=self.authkey)
+
+    def is_running(self):
+        try:
+            with self._connect() as conn:
+                conn.send({'type': 'ping'})
+                return conn.recv().get('type') == 'pong'
+        except (OSError, EOFError):
+            return False
+
+    def start_worker(self):
+        """Spawn a detached, supervised worker and wait until it accepts jobs."""
+        command = [sys.executable, '-m', 'app.core.inference_worker', 'serve',
+                   '--host', self.address[0], '--port', str(self.address[1])]
+        print(f"Starting inference worker: {' '.join(command)}")
+        subprocess.Popen(command, cwd=ROOT_DIR, stdin=subprocess.DEVNULL,
+                         start_new_session=(os.name != 'nt'))
+
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.is_running():
+                return
+            time.sleep(0.5)
+        raise TimeoutError(f"Inference worker did not start within {self.startup_timeout:.0f}s")
+
+    def ensure_running(self):
+        if not self.is_running():
+            if not self.autostart:
+                raise ConnectionError(f"No inference worker at {self.address[0]}:{self.address[1]}")
+            self.start_worker()
+
+    def submit(self, video_path, audio_path, output_path=None, cartoon_mode=False, streaming=False,
+               on_progress=print, retries=1, face_detector=None, model_path=None, backend=None, pads=None,
+               smooth=True):
+        """
+        Run a lip-sync job on the worker and wait for it to finish.
+
+        Progress lines are passed to ``on_progress`` as they arrive. If the
+        worker dies mid-job it is restarted (by its supervisor, or spawned
+        again) and the job is resubmitted up to ``retries`` times.
+        ``face_detector``, ``model_path`` and ``backend`` pick the detector
+        backend, the Wav2Lip checkpoint and how Wav2Lip runs ('eager',
+        'torchscript' or 'onnx') for this job (default: the worker's).
+        Outputs keep the source resolution; ``pads`` and ``smooth`` act as
+        ``--pads`` and ``--nosmooth`` of Wav2Lip/inference.py (default: its defaults).
+
+        Returns:
+            dict: The worker's 'done' reply (output_path, seconds, stats)
+        """
+        job = {
+            'type': 'job',
+            'video_path': os.path.abspath(video_path),
+            'audio_path': os.path.abspath(audio_path),
+            'output_path': os.path.abspath(str(output_path)) if output_path else None,
+            'cartoon_mode': cartoon_mode,
+            'streaming': streaming,
+            'face_detector': face_detector,
+            'model_path': os.path.abspath(model_path) if model_path else None,
+            'backend': backend,
+            'pads': list(pads) if pads else None,
+            'smooth': smooth,
+        }
+        return self._run_job(job, on_progress, retries)
+
+    def submit_multi(self, video_path, audio_paths, output_paths=None, cartoon_mode=False, on_progress=print,
+                     retries=1, shot_index_path=None, face_detector=None, model_path=None, backend=None,
+                     pads=None, smooth=True):
+        """
+        Lip-sync one video against several audio tracks in a single job.
+
+        The worker decodes the video and detects faces once for all tracks
+        (see ``LipSyncEngine.generate_multi_lip_sync``).
+
+        Returns:
+            dict: The worker's 'done' reply, with one output path per audio track
+        """
+        job = {
+            'type': 'multi_job',
+            'video_path': os.path.abspath(video_path),
+            'audio_paths': [os.path.abspath(audio_path) for audio_path in audio_paths],
+            'output_paths': [os.path.abspath(str(p)) for p in output_paths] if output_paths else None,
+            'cartoon_mode': cartoon_mode,
+            'shot_index_path': os.path.abspath(shot_index_path) if shot_index_path else None,
+            'face_detector': face_detector,
+            'model_path': os.path.abspath(model_path) if model_path else None,
+            'backend': backend,
+            'pads': list(pads) if pads else None,
+            'smooth': smooth,
+        }
+        return self._run_job(job, on_progress, retries)
+
+    def _run_job(self, job, on_progress, retries):
+        for attempt in range(retries + 1):
+            self.ensure_running()
+            try:
+                with self._connect() as conn:
+                    conn.send(job)
+                    while True:
+                        reply = conn.recv()
+                        if reply['type'] == 'progress':
+                            if on_progress:
+                                on_progress(reply['message'])
+                        elif reply['type'] == 'error':
+                            raise RuntimeError(f"Lip-sync job failed: {reply['error']}")
+                        else:
+                            return reply
+            except (OSError, EOFError) as e:
+                if attempt == retries:
+                    raise
+                print(f"Lost connection to the inference worker ({e}), retrying...")
+                # Give the supervisor a moment to bring the worker back
+                time.sleep(3.0)
+
+    def shutdown(self):
+        try:
+            with self._connect() as conn:
+                conn.send({'type': 'shutdown'})
+                conn.recv()
+        except (OSError, EOFError):
+            pass
+
+
+def main():
+    from Wav2Lip.models.backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description='Warm lip-sync inference worker')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help='Run the worker (restarted automatically if it crashes)')
+    serve.add_argument('--host', default=DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--model_path', default='wav2lip_gan.pth', help='Wav2Lip checkpoint, relative to app/core')
+    serve.add_argument('--low_memory', action='store_true')
+    serve.add_argument('--backend', default='eager', choices=BACKENDS, help='Default Wav2Lip backend')
+
+    submit = subparsers.add_parser('submit', help='Submit a job to the worker and wait for the result')
+    submit.add_argument('--host', default=DEFAULT_HOST)
+    submit.add_argument('--port', type=int, default=DEFAULT_PORT)
+    submit.add_argument('--video', required=True)
+    submit.add_argument('--audio', required=True, nargs='+', help='One or more audio tracks')
+    submit.add_argument('--outfile', default=None, nargs='+', help='One output per audio track')
+    submit.add_argument('--cartoon', action='store_true')
+    submit.add_argument('--stream', action='store_true')
+    submit.add_argument('--face_detector', default=None, help='Face detector backend (default: sfd)')
+    submit.add_argument('--model_path', default=None, help="Wav2Lip checkpoint of this job (default: the worker's)")
+    submit.add_argument('--backend', default=None, choices=BACKENDS,
+                        help="Wav2Lip backend of this job (default: the worker's)")
+
+    stop = subparsers.add_parser('stop', help='Shut the worker down')
+    stop.add_argument('--host', default=DEFAULT_HOST)
+    stop.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        supervise(args.host, args.port, None, args.model_path, args.low_memory, backend=args.backend)
+    elif args.command == 'submit':
+        client = WorkerClient(args.host, args.port)
+        if len(args.audio) > 1:
+            result = client.submit_multi(args.video, args.audio, args.outfile, cartoon_mode=args.cartoon,
+                                         face_detector=args.face_detector, model_path=args.model_path,
+                                         backend=args.backend)
+            outputs = ', '.join(result['output_path'])
+        else:
+            outfile = args.outfile[0] if args.outfile else None
+            result = client.submit(args.video, args.audio[0], outfile, cartoon_mode=args.cartoon,
+                                   streaming=args.stream, face_detector=args.face_detector,
+                                   model_path=args.model_path, backend=args.backend)
+            outputs = result['output_path']
+        print(f"Done in {result['seconds']:.1f}s: {outputs}")
+    else:
+        WorkerClient(args.host, args.port, autostart=False).shutdown()
+
+
+if __name__ == '__main__':
+    main()
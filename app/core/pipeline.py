@@ -0,0 +1,234 @@
+import queue
+import threading
+import time
+import traceback
+
+# Marks the end of the stream in the stage queues
+_END = object()
+
+
+class PipelineCancelled(Exception):
+    """Raised when a StagedPipeline is cancelled before it finished."""
+
+
+class Stage:
+    def __init__(self, name, fn):
+        """
+        A single step of a StagedPipeline, run on its own worker thread.
+
+        Args:
+            name (str): Name of the stage, used in the stats report
+            fn (callable): Function applied to every item; returning None drops the item
+        """
+        self.name = name
+        self.fn = fn
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.items = 0
+        self.busy_seconds = 0.0     # Time spent inside fn
+        self.idle_seconds = 0.0     # Time spent waiting for input
+        self.blocked_seconds = 0.0  # Time spent waiting for room in the next queue
+        self.queue_depth_sum = 0
+        self.queue_depth_max = 0
+        self.queue_samples = 0
+
+    def record_queue_depth(self, depth):
+        self.queue_depth_sum += depth
+        self.queue_depth_max = max(self.queue_depth_max, depth)
+        self.queue_samples += 1
+
+    def stats(self):
+        return {
+            'items': self.items,
+            'busy_seconds': self.busy_seconds,
+            'idle_seconds': self.idle_seconds,
+            'blocked_seconds': self.blocked_seconds,
+            'avg_queue_depth': self.queue_depth_sum / self.queue_samples if self.queue_samples else 0.0,
+            'max_queue_depth': self.queue_depth_max,
+        }
+
+
+class StagedPipeline:
+    def __init__(self, stages, queue_size=4, source_name='decode'):
+        """
+        Run a chain of stages concurrently, one worker thread per stage.
+
+        Stages are connected by bounded queues, so a slow stage applies
+        backpressure to the ones before it instead of letting items pile up
+        in memory. Decoding and encoding are mostly native code that releases
+        the GIL, so they overlap with model inference.
+
+        Args:
+            stages (list): Stage objects, or (name, fn) tuples, in processing order
+            queue_size (int): Maximum number of items waiting between two stages
+            source_name (str): Name reported for the thread consuming the source iterable
+        """
+        self.stages = [stage if isinstance(stage, Stage) else Stage(*stage) for stage in stages]
+        self.source = Stage(source_name, None)
+        self.queue_size = max(1, int(queue_size))
+        self._cancel_event = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def cancel(self):
+        """Ask every stage to stop as soon as possible."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def _fail(self, stage, exc):
+        with self._error_lock:
+            if self._error is None:
+                print(f"Pipeline stage '{stage.name}' failed: {exc}")
+                traceback.print_exc()
+                self._error = exc
+        self.cancel()
+
+    def _put(self, q, item, stage):
+        start = time.perf_counter()
+        while not self._cancel_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                stage.blocked_seconds += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, stage):
+        start = time.perf_counter()
+        while not self._cancel_event.is_set():
+            try:
+                stage.record_queue_depth(q.qsize())
+                item = q.get(timeout=0.1)
+                stage.idle_seconds += time.perf_counter() - start
+                return item
+            except queue.Empty:
+                continue
+        return _END
+
+    def _run_source(self, source, out_q):
+        stage = self.source
+        try:
+            iterator = iter(source)
+            while not self._cancel_event.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                stage.busy_seconds += time.perf_counter() - start
+                stage.items += 1
+                if not self._put(out_q, item, stage):
+                    return
+            self._put(out_q, _END, stage)
+        except Exception as e:
+            self._fail(stage, e)
+        finally:
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+
+    def _run_stage(self, stage, in_q, out_q):
+        try:
+            while True:
+                item = self._get(in_q, stage)
+                if item is _END:
+                    break
+
+                start = time.perf_counter()
+                result = stage.fn(item)
+                stage.busy_seconds += time.perf_counter() - start
+                stage.items += 1
+
+                if result is not None and not self._put(out_q, result, stage):
+                    return
+            self._put(out_q, _END, stage)
+        except Exception as e:
+            self._fail(stage, e)
+
+    def iterate(self, source):
+        """
+        Feed a source iterable through the stages and yield the final results.
+
+        The caller consumes the output of the last stage (e.g. to encode it).
+        Any exception raised by a stage cancels the pipeline and is re-raised
+        here; a cancelled pipeline raises PipelineCancelled.
+
+        Args:
+            source (iterable): Items to process (e.g. a frame generator)
+
+        Yields:
+            Results of the last stage, in source order
+        """
+        self._cancel_event.clear()
+        self._error = None
+        self.source.reset_stats()
+        for stage in self.stages:
+            stage.reset_stats()
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        workers = [threading.Thread(target=self._run_source, args=(source, queues[0]),
+                                    name=f"pipeline-{self.source.name}", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            workers.append(threading.Thread(target=self._run_stage, args=(stage, queues[i], queues[i + 1]),
+                                            name=f"pipeline-{stage.name}", daemon=True))
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                try:
+                    item = queues[-1].get(timeout=0.1)
+                except queue.Empty:
+                    if self._cancel_event.is_set():
+                        break
+                    continue
+                if item is _END:
+                    break
+                yield item
+        except GeneratorExit:
+            self.cancel()
+            raise
+        finally:
+            if self._error is not None or self._cancel_event.is_set():
+                self.cancel()
+            for worker in workers:
+                worker.join()
+
+        if self._error is not None:
+            raise self._error
+        if self._cancel_event.is_set():
+            raise PipelineCancelled("Pipeline was cancelled")
+
+    def run(self, source):
+        """
+        Run the whole pipeline, discarding the output of the last stage.
+
+        Args:
+            source (iterable): Items to process
+
+        Returns:
+            dict: Per-stage stats (see ``stats``)
+        """
+        for _ in self.iterate(source):
+            pass
+        return self.stats()
+
+    def stats(self):
+        """
+        Per-stage counters: processed items, busy/idle/blocked time and input queue depth.
+
+        The stage with the least idle time and the fullest input queue is the bottleneck.
+        """
+        return {stage.name: stage.stats() for stage in [self.source] + self.stages}
+
+    def print_stats(self):
+        print("Pipeline stage stats:")
+        for name, stats in self.stats().items():
+            print(f"  {name:>10}: {stats['items']} items, busy {stats['busy_seconds']:.2f}s, "
+                  f"idle {stats['idle_seconds']:.2f}s, blocked {stats['blocked_seconds']:.2f}s, "
+                  f"queue avg {stats['avg_queue_depth']:.1f} / max {stats['max_queue_depth']}")
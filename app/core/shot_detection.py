@@ -0,0 +1,361 @@
+"""
+Shot-boundary detection.
+
+Cuts are found on heavily downscaled frames (64x36 by default, scaled inside
+the ffmpeg decoder when it is available) by comparing consecutive frames:
+the distance between their colour histograms plus their mean absolute pixel
+difference. A frame starts a new shot when its score is both above a fixed
+threshold and well above the scores around it, so fast motion inside a shot
+is not taken for a cut.
+
+The resulting ``ShotIndex`` is saved as JSON (next to the project file, or in
+the cache directory) and reused as long as the video content is unchanged.
+It is used to reset face detection and box smoothing at every cut and to
+split long renders on shot boundaries.
+
+Usage:
+    python -m app.core.shot_detection video.mp4
+"""
+import json
+import os
+import time
+import cv2
+import numpy as np
+from app.core.cache import DEFAULT_CACHE_DIR, file_content_hash
+from app.core.frame_decoder import FFmpegFrameDecoder, ffmpeg_decoder_available, probe_video
+
+SHOT_INDEX_VERSION = 1
+
+
+def shot_index_path(video_path, project_file_path=None):
+    """
+    Where the shot index of a video is stored.
+
+    Args:
+        video_path (str): Path to the video file
+        project_file_path (str, optional): Project (.vsa) file the video belongs to;
+            the index is then stored next to it
+
+    Returns:
+        str: Path of the JSON index
+    """
+    if project_file_path:
+        return os.path.splitext(project_file_path)[0] + '.shots.json'
+    return os.path.join(DEFAULT_CACHE_DIR, 'shots', file_content_hash(video_path) + '.json')
+
+
+class ShotIndex:
+    def __init__(self, shots, fps, content_hash=None, settings=None):
+        """
+        Shot ranges of a video, in source frames.
+
+        Args:
+            shots (list): [start, end) frame range of every shot, in order
+            fps (float): Frame rate of the video
+            content_hash (str, optional): Hash of the video content the index was built from
+            settings (dict, optional): Detector settings the index was built with
+        """
+        self.shots = [(int(start), int(end)) for start, end in shots]
+        self.fps = fps
+        self.content_hash = content_hash
+        self.settings = dict(settings or {})
+
+    @property
+    def frame_count(self):
+        return self.shots[-1][1] if self.shots else 0
+
+    @property
+    def boundaries(self):
+        """First frame of every shot but the first one."""
+        return [start for start, _ in self.shots[1:]]
+
+    def ranges(self, frame_skip=1):
+        """
+        Shot ranges in the frames of a decode that keeps every ``frame_skip``-th frame.
+
+        Returns:
+            list: [start, end) range of every (non-empty) shot
+        """
+        if frame_skip == 1:
+            return list(self.shots)
+        # Source frame f is kept as frame f / frame_skip when f is a multiple of frame_skip
+        ranges = [(-(-start // frame_skip), -(-end // frame_skip)) for start, end in self.shots]
+        return [(start, end) for start, end in ranges if end > start]
+
+    def render_segments(self, max_frames, frame_skip=1):
+        """
+        Split the video into segments of at most ``max_frames`` frames, cutting on shot boundaries.
+
+        Consecutive shots are grouped while they fit; a single shot longer
+        than ``max_frames`` is split in equal parts.
+
+        Returns:
+            list: [start, end) frame range of every segment
+        """
+        max_frames = max(1, int(max_frames))
+        segments = []
+        for start, end in self.ranges(frame_skip):
+            if segments and end - segments[-1][0] <= max_frames:
+                segments[-1] = (segments[-1][0], end)
+                continue
+            parts = -(-(end - start) // max_frames)
+            bounds = np.linspace(start, end, parts + 1).round().astype(int)
+            segments.extend(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        return segments
+
+    def render_segment_times(self, max_seconds, frame_skip=1):
+        """
+        ``render_segments`` as [start, end) times in seconds (e.g. for ``VideoAnalyser.iter_frames``).
+        """
+        fps = self.fps / frame_skip
+        return [(start / fps, end / fps)
+                for start, end in self.render_segments(max(1, int(max_seconds * fps)), frame_skip)]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        data = {
+            'version': SHOT_INDEX_VERSION,
+            'content_hash': self.content_hash,
+            'fps': self.fps,
+            'settings': self.settings,
+            'shots': self.shots,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, video_path=None, settings=None):
+        """
+        Read a saved index.
+
+        Args:
+            path (str): Path of the JSON index
+            video_path (str, optional): Only accept the index if it was built from this video's content
+            settings (dict, optional): Only accept the index if it was built with these settings
+
+        Returns:
+            ShotIndex: The index, or None if it is missing or stale
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != SHOT_INDEX_VERSION:
+            return None
+        if video_path is not None and data.get('content_hash') != file_content_hash(video_path):
+            return None
+        if settings is not None and data.get('settings') != settings:
+            return None
+        return cls(data['shots'], data['fps'], data['content_hash'], data['settings'])
+
+
+class ShotBoundaryDetector:
+    def __init__(self, analysis_size=(64, 36), bins=16, threshold=0.3, contrast=3.0, window=8,
+                 min_shot_length=8, chunk_size=256):
+        """
+        Find cuts in a video from histogram and frame differences.
+
+        Args:
+            analysis_size (tuple): (width, height) frames are scored at
+            bins (int): Histogram bins per colour channel (a power of two, at most 256)
+            threshold (float): Minimum score (0-1) of a cut
+            contrast (float): A cut must also score this many times the median of the
+                ``window`` frames on each side of it
+            window (int): Frames on each side used for the local median
+            min_shot_length (int): Cuts closer than this to the previous one are ignored
+            chunk_size (int): Frames scored per NumPy pass
+        """
+        self.analysis_size = tuple(analysis_size)
+        self.bins = bins
+        self.threshold = threshold
+        self.contrast = contrast
+        self.window = window
+        self.min_shot_length = min_shot_length
+        self.chunk_size = chunk_size
+
+    @property
+    def settings(self):
+        return {
+            'analysis_size': list(self.analysis_size),
+            'bins': self.bins,
+            'threshold': self.threshold,
+            'contrast': self.contrast,
+            'window': self.window,
+            'min_shot_length': self.min_shot_length,
+        }
+
+    def _histograms(self, frames):
+        """Normalized per-channel colour histograms of a (N, H, W, 3) uint8 array, as (N, 3 * bins)."""
+        n = len(frames)
+        shift = 8 - int(np.log2(self.bins))
+        # Bin index of every pixel and channel, offset so all frames and channels share one bincount
+        bins = (frames >> shift).reshape(n, -1, 3).astype(np.int32)
+        bins += np.arange(3, dtype=np.int32) * self.bins
+        bins += (np.arange(n, dtype=np.int32) * 3 * self.bins)[:, None, None]
+        counts = np.bincount(bins.ravel(), minlength=n * 3 * self.bins).reshape(n, 3 * self.bins)
+        return counts.astype(np.float32) / (frames.shape[1] * frames.shape[2])
+
+    def scores(self, frames):
+        """
+        Cut score of every frame against the previous one (0 for the first frame).
+
+        Args:
+            frames (iterable): Frames already downscaled to ``analysis_size``, as a
+                list or a stream; only ``chunk_size`` are held at a time
+
+        Returns:
+            numpy.ndarray: (N,) float32 scores in [0, 1]
+        """
+        scores = []
+        previous, previous_hist = None, None
+        chunk = []
+        frame_iter = iter(frames)
+        while True:
+            frame = next(frame_iter, None)
+            if frame is not None:
+                chunk.append(frame)
+                if len(chunk) < self.chunk_size:
+                    continue
+            if not chunk:
+                break
+
+            batch = np.stack(chunk)
+            hists = self._histograms(batch)
+            gray = batch.mean(axis=3, dtype=np.float32)
+            if previous is None:
+                previous, previous_hist = gray[:1], hists[:1]
+            gray_prev = np.concatenate([previous, gray[:-1]])
+            hist_prev = np.concatenate([previous_hist, hists[:-1]])
+
+            hist_distance = 0.5 * np.abs(hists - hist_prev).sum(axis=1) / 3
+            pixel_distance = np.abs(gray - gray_prev).mean(axis=(1, 2)) / 255
+            scores.append(0.5 * (hist_distance + pixel_distance))
+
+            previous, previous_hist = gray[-1:], hists[-1:]
+            chunk = []
+            if frame is None:
+                break
+
+        return np.concatenate(scores).astype(np.float32) if scores else np.zeros(0, dtype=np.float32)
+
+    def boundaries(self, scores):
+        """
+        Frames that start a new shot.
+
+        Args:
+            scores (numpy.ndarray): Output of ``scores``
+
+        Returns:
+            list: Frame indices of the cuts, in order (frame 0 excluded)
+        """
+        n = len(scores)
+        if n < 2:
+            return []
+        w = self.window
+        padded = np.pad(scores, w, mode='edge')
+        windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * w + 1)
+        # Median of the neighbours, without the frame itself
+        neighbours = np.delete(windows, w, axis=1)
+        local = np.median(neighbours, axis=1)
+
+        candidates = np.flatnonzero((scores > self.threshold) & (scores > self.contrast * local))
+        cuts = []
+        for frame in candidates[candidates > 0].tolist():
+            if frame - (cuts[-1] if cuts else 0) >= self.min_shot_length:
+                cuts.append(frame)
+        return cuts
+
+    def detect(self, frames):
+        """
+        Shot ranges of a stream of downscaled frames.
+
+        Returns:
+            list: [start, end) frame range of every shot
+        """
+        scores = self.scores(frames)
+        starts = [0] + self.boundaries(scores)
+        return [(start, end) for start, end in zip(starts, starts[1:] + [len(scores)]) if end > start]
+
+    def iter_analysis_frames(self, video_path, decoder='auto'):
+        """
+        Decode a video straight at ``analysis_size``.
+
+        With ffmpeg the scaling happens inside the decoder, so only tiny
+        frames cross the pipe.
+        """
+        if decoder == 'auto':
+            decoder = 'ffmpeg' if ffmpeg_decoder_available() else 'opencv'
+        if decoder == 'ffmpeg':
+            yield from FFmpegFrameDecoder(video_path, size=self.analysis_size)
+            return
+
+        video = cv2.VideoCapture(video_path)
+        try:
+            while True:
+                ret, frame = video.read()
+                if not ret:
+                    break
+                yield cv2.resize(frame, self.analysis_size, interpolation=cv2.INTER_AREA)
+        finally:
+            video.release()
+
+    def detect_video(self, video_path, index_path=None, decoder='auto'):
+        """
+        Shot index of a video, reusing the saved one when it is still valid.
+
+        Args:
+            video_path (str): Path to the video file
+            index_path (str, optional): Where the index is saved (default: ``shot_index_path``)
+            decoder (str): 'ffmpeg', 'opencv' or 'auto'
+
+        Returns:
+            ShotIndex: Shot ranges of the video, in source frames
+        """
+        index_path = index_path or shot_index_path(video_path)
+        index = ShotIndex.load(index_path, video_path, self.settings)
+        if index is not None:
+            print(f"Using saved shot index ({len(index.shots)} shots): {index_path}")
+            return index
+
+        fps = probe_video(video_path)[0]
+        start = time.perf_counter()
+        shots = self.detect(self.iter_analysis_frames(video_path, decoder))
+        elapsed = time.perf_counter() - start
+        frames = shots[-1][1] if shots else 0
+        print(f"Detected {len(shots)} shots in {frames} frames "
+              f"({frames / elapsed if elapsed else 0:.0f} frames/s)")
+
+        index = ShotIndex(shots, fps, file_content_hash(video_path), self.settings)
+        try:
+            index.save(index_path)
+        except OSError as e:
+            print(f"Could not save the shot index to {index_path}: {e}")
+        return index
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Detect the shots of a video')
+    parser.add_argument('video')
+    parser.add_argument('--index', default=None, help='Where to save the index (default: cache directory)')
+    parser.add_argument('--decoder', default='auto', choices=['auto', 'ffmpeg', 'opencv'])
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--max_segment_seconds', type=float, default=None,
+                        help='Also print render segments of at most this length')
+    args = parser.parse_args()
+
+    detector = ShotBoundaryDetector(threshold=args.threshold)
+    index = detector.detect_video(args.video, args.index, args.decoder)
+    for i, (start, end) in enumerate(index.shots):
+        print(f"shot {i}: frames {start}-{end - 1} ({start / index.fps:.2f}s - {end / index.fps:.2f}s)")
+    if args.max_segment_seconds:
+        for start, end in index.render_segment_times(args.max_segment_seconds):
+            print(f"segment: {start:.2f}s - {end:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,75 +1,429 @@
 import os
+import itertools
 import cv2
 import numpy as np
 import torch
 from PyQt5.QtWidgets import QFileDialog, QApplication, QMessageBox
 import sys
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from app.core.audio_processor import AudioProcessor
+from app.core.pipeline import StagedPipeline
+from app.core.video_writer import open_video_writer
 from app.core.video_analyzer import VideoAnalyser
 
 # Import necessary modules for Wav2Lip
 from Wav2Lip.models.wav2lip import Wav2Lip as Wav2LipModel
+from Wav2Lip.models.backends import load_backend
+from Wav2Lip.models.quantization import CalibrationRecorder
+from Wav2Lip.models.registry import PRECISIONS, get_model_registry
+
+# Wav2Lip input geometry (see Wav2Lip/inference.py)
+IMG_SIZE = 96
+MEL_STEP_SIZE = 16
+MEL_FRAMES_PER_SECOND = 80.
 
 class LipSyncEngine:
-    def __init__(self, model_path='wav2lip_gan.pth', low_memory_mode=False):
+    def __init__(self, model_path='wav2lip_gan.pth', low_memory_mode=False, inference_batch_size=None,
+                 encoder_settings=None, detection_keyframe_interval=1, shot_detection=True,
+                 face_detector='sfd', detection_workers=0, cpu_threads=None, model_cache_mb=None,
+                 optimize_models=True, backend='eager', calibration_dir=None, precision='fp32'):
         """
         Initialize the Lip Sync Engine with Wav2Lip model.
         
         Args:
             model_path (str): Path to the pre-trained Wav2Lip model
             low_memory_mode (bool): Enable optimizations for low memory systems
+            inference_batch_size (int, optional): Number of frames per forward pass
+                of the model (1 = per-frame inference)
+            encoder_settings (dict, optional): codec, preset, crf and threads of the
+                ffmpeg output writer
+            detection_keyframe_interval (int): Run face detection every N frames and
+                track the face in between (1 = detect on every frame)
+            shot_detection (bool): Find the cuts of the video first and restart face
+                detection at each of them
+            face_detector (str): Default face detector backend (see
+                ``Wav2Lip.face_detection.available_detectors``)
+            detection_workers (int): On CPU, run face detection in this many worker
+                processes (0 = in this process)
+            cpu_threads (int, optional): Torch threads of this process (default:
+                torch's, i.e. one per core; 4 in low memory mode)
+            model_cache_mb (float, optional): Memory cap of the process-wide model
+                registry; least recently used models are evicted past it
+            optimize_models (bool): Fold BatchNorm into the convolutions of Wav2Lip
+                (and the L2Norm scales of S3FD) and run them channels_last
+            backend (str): How Wav2Lip runs: 'eager', 'torchscript', 'onnx' (ONNX
+                Runtime, CPU) or 'int8' (a checkpoint from Wav2Lip/quantize.py);
+                see ``Wav2Lip.models.backends``
+            calibration_dir (str, optional): Save a sample of the model inputs of
+                every job there, for int8 calibration (see Wav2Lip/quantize.py)
+            precision (str): Weight precision of Wav2Lip (eager backend) and S3FD:
+                'fp32', or 'bf16' on CPUs with native bfloat16 (AVX512-BF16 / AMX)
         """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.low_memory_mode = low_memory_mode
+        if inference_batch_size is None:
+            inference_batch_size = 16 if low_memory_mode else 64
+        self.inference_batch_size = max(1, int(inference_batch_size))
+        self.pipeline_queue_size = 2 if low_memory_mode else 4
+        self.encoder_settings = dict(encoder_settings or {})
+        self.shot_detection = shot_detection
+        self.last_run_stats = {}
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r} (expected one of {', '.join(PRECISIONS)})")
+        self.precision = precision
+        # Type the model inputs are cast to: that of the weights (set by load_model)
+        self.dtype = torch.float32
         print(f"Using device: {self.device}")
         print(f"Low memory mode: {'Enabled' if low_memory_mode else 'Disabled'}")
+        print(f"Inference batch size: {self.inference_batch_size}")
 
         # Set torch memory optimization if using CPU or low memory mode
+        if cpu_threads is None and low_memory_mode:
+            cpu_threads = 4
+        if cpu_threads:
+            torch.set_num_threads(cpu_threads)  # Limit number of threads
         if self.device.type == 'cpu' or low_memory_mode:
             print("Optimizing for low memory usage")
-            # Lower precision for CPU calculation
-            torch.set_num_threads(4)  # Limit number of threads
             torch.set_grad_enabled(False)  # Make sure gradients are disabled
 
-        self.video_analyser = VideoAnalyser(device=self.device, low_memory_mode=self.low_memory_mode)
+        self.video_analyser = VideoAnalyser(device=self.device, low_memory_mode=self.low_memory_mode,
+                                            detection_keyframe_interval=detection_keyframe_interval,
+                                            face_detector=face_detector, detection_workers=detection_workers,
+                                            optimize_models=optimize_models, precision=precision)
+        if model_cache_mb is not None:
+            get_model_registry().set_max_bytes(int(model_cache_mb * 2 ** 20))
+        self.optimize_models = optimize_models
+        self.calibration_recorder = CalibrationRecorder(calibration_dir) if calibration_dir else None
+        self.model_path = None
+        self.backend = None
+        self.load_model(model_path, backend)
+
+    def load_model(self, model_path, backend=None):
+        """
+        Switch to a Wav2Lip checkpoint (e.g. wav2lip.pth vs wav2lip_gan.pth).
+
+        Checkpoints come from the process-wide model registry, so switching back
+        and forth only loads each of them once (and exports them once per backend).
+
+        Args:
+            model_path (str): Checkpoint path, absolute or relative to app/core
+            backend (str, optional): 'eager', 'torchscript', 'onnx' or 'int8' (default: the current one)
+        """
         base_path = os.path.dirname(os.path.abspath(__file__))
         model_path = os.path.join(base_path, model_path)
+        backend = backend or self.backend or 'eager'
+        if model_path == self.model_path and backend == self.backend:
+            return
         print(f"Looking for model at: {model_path}")
 
         # Load Wav2lip model
         try:
-            # Import here to avoid issues if the module is not found
-            self.model = Wav2LipModel()
-            
             if os.path.exists(model_path):
                 print(f"Found model file at {model_path}")
-                checkpoint = torch.load(model_path, map_location=self.device)
-                
-                # Print checkpoint keys for debugging
-                print(f"Checkpoint keys: {checkpoint.keys()}")
-                
-                # Check if the checkpoint contains a state_dict key
-                if 'state_dict' in checkpoint:
-                    self.model.load_state_dict(checkpoint['state_dict'])
-                else:
-                    # Try loading directly (in case it's just the state_dict)
-                    self.model.load_state_dict(checkpoint)
-                    
-                self.model.to(self.device)
-                self.model.eval()
-                print("Model loaded successfully!")
+                precision = self.precision if backend == 'eager' else 'fp32'
+                self.model = load_backend(model_path, self.device, backend, optimize=self.optimize_models,
+                                          precision=precision)
+                self.dtype = PRECISIONS[precision]
+                print(f"Model loaded successfully! ({backend} backend)")
             else:
+                self.model = Wav2LipModel().to(self.device).eval()
+                self.dtype = torch.float32
                 print(f"WARNING: Model file not found at {model_path}")
                 print(f"You will need to place the Wav2Lip model at this location")
+            self.model_path = model_path
+            self.backend = backend
         except Exception as e:
             print(f"Error loading Wav2Lip model: {e}")
             import traceback
             traceback.print_exc()
             raise
-    
-    def generate_lip_sync(self, video_path, audio_path, output_path=None, cartoon_mode=False, batch_process=True):
+
+    def _shot_ranges(self, video_path, frame_skip, shot_index_path=None):
+        """
+        Shot ranges of a video in processed frames, or None when shot detection is off or fails.
+        """
+        if not self.shot_detection:
+            return None
+        try:
+            return self.video_analyser.detect_shots(video_path, shot_index_path).ranges(frame_skip)
+        except Exception as e:
+            print(f"Shot detection failed ({e}), detecting faces over the whole clip")
+            return None
+
+    def _mel_window(self, mel_spectrogram, frame_idx, fps):
+        """
+        Get the mel spectrogram window aligned with a video frame.
+
+        Args:
+            mel_spectrogram (numpy.ndarray): Mel spectrogram (num_mels, T)
+            frame_idx (int): Index of the frame in the processed video
+            fps (float): Frame rate of the processed video
+
+        Returns:
+            numpy.ndarray: Mel window of shape (num_mels, MEL_STEP_SIZE)
+        """
+        start_idx = int(frame_idx * MEL_FRAMES_PER_SECOND / fps)
+        start_idx = max(0, min(start_idx, mel_spectrogram.shape[1] - MEL_STEP_SIZE))
+        mel_window = mel_spectrogram[:, start_idx:start_idx + MEL_STEP_SIZE]
+        if mel_window.shape[1] < MEL_STEP_SIZE:  # Handle audio shorter than one window
+            mel_window = np.pad(mel_window, ((0, 0), (0, MEL_STEP_SIZE - mel_window.shape[1])), 'edge')
+        return mel_window
+
+    def _cartoon_forward(self, cartoon_mode):
+        """Whether cartoon mode runs the model's own smoothed forward (which ignores face features)."""
+        return cartoon_mode and 'smooth' in self.model.forward.__code__.co_varnames
+
+    def _forward(self, mel_batch, face_batch, cartoon_mode=False, face_feats=None):
+        """
+        Run a single forward pass of the Wav2Lip model over a batch.
+
+        Args:
+            mel_batch (torch.Tensor): Mel windows (B, 1, num_mels, MEL_STEP_SIZE)
+            face_batch (torch.Tensor): Masked + reference faces (B, 6, IMG_SIZE, IMG_SIZE)
+            cartoon_mode (bool): Whether to use cartoon-specific processing
+            face_feats (list, optional): ``encode_face`` features of ``face_batch``;
+                when given only the audio encoder and the decoder run
+
+        Returns:
+            numpy.ndarray: Generated faces (B, IMG_SIZE, IMG_SIZE, 3) as uint8
+        """
+        with torch.no_grad():
+            # For cartoon characters, we can adjust model parameters (if available)
+            if self._cartoon_forward(cartoon_mode):
+                pred = self.model(mel_batch, face_batch, smooth=True)
+            elif face_feats is not None:
+                pred = self.model.decode(self.model.encode_audio(mel_batch), face_feats)
+            else:
+                pred = self.model(mel_batch, face_batch)
+
+        pred = pred.float().cpu().numpy().transpose(0, 2, 3, 1) * 255.  # (B,C,H,W) -> (B,H,W,C)
+        return pred.astype(np.uint8)
+
+    def _prepare_face_batch(self, frames, face_regions):
+        """
+        Crop, resize and stack the faces of a batch of frames into a model input.
+
+        The result only depends on the video, so it is computed once per batch
+        and shared by every audio track rendered against the same frames.
+
+        Args:
+            frames (list): Video frames of this batch
+            face_regions (list): Face region per frame of this batch (or None)
+
+        Returns:
+            tuple: (slots, face_tensor, boxes) where ``slots`` are the positions in
+                ``frames`` that have a face, or None if no frame has one
+        """
+        batch_slots, faces, boxes = [], [], []
+        for slot, (frame, face_region) in enumerate(zip(frames, face_regions)):
+            if face_region is None:
+                # If no face detected, use original frame
+                continue
+
+            # Detections are (x1, y1, x2, y2, confidence)
+            x1, y1, x2, y2 = [int(b) for b in face_region[:4]]
+            face_img = frame[y1:y2, x1:x2]
+            if face_img.size == 0:
+                continue
+
+            batch_slots.append(slot)
+            faces.append(cv2.resize(face_img, (IMG_SIZE, IMG_SIZE)))
+            boxes.append((x1, y1, x2, y2))
+
+        if not faces:
+            return None
+
+        # Same input layout as Wav2Lip/inference.py: masked lower half + reference face
+        face_batch = np.asarray(faces)
+        face_masked = face_batch.copy()
+        face_masked[:, IMG_SIZE // 2:] = 0
+        face_batch = np.concatenate((face_masked, face_batch), axis=3).astype(np.float32) / 255.
+
+        face_tensor = torch.from_numpy(np.transpose(face_batch, (0, 3, 1, 2))).to(self.device, self.dtype)
+        return batch_slots, face_tensor, boxes
+
+    @staticmethod
+    def _source_regions(face_regions, scale, source_size, pads=None, smooth=False, shots=None):
+        """
+        Map the face regions of the analysis frames onto the source frames.
+
+        Boxes are scaled to source pixels, then padded and clipped as in
+        Wav2Lip/inference.py (``--pads``). With ``smooth`` they are averaged
+        over 5 frames, its default box smoothing, without any window spanning
+        a cut or a frame without a face.
+
+        Args:
+            face_regions (list): Per analysis frame, (x1, y1, x2, y2[, score]) or None
+            scale (tuple): (x, y) factors from analysis to source pixels
+            source_size (tuple): (width, height) of the source frames
+            pads (tuple, optional): (top, bottom, left, right) padding, in source pixels
+            smooth (bool): Smooth the boxes over a 5-frame window
+            shots (list, optional): [start, end) frame range of every shot
+
+        Returns:
+            list: Per frame, an (x1, y1, x2, y2) box of the source frame, or None
+        """
+        from Wav2Lip.face_detection.tracking import smooth_boxes
+
+        (scale_x, scale_y), (width, height) = scale, source_size
+        pady1, pady2, padx1, padx2 = pads or (0, 0, 0, 0)
+        has_face = np.array([region is not None for region in face_regions], dtype=bool)
+        boxes = np.zeros((len(face_regions), 4), dtype=np.int64)
+        for i, region in enumerate(face_regions):
+            if region is not None:
+                x1, y1, x2, y2 = [float(b) for b in region[:4]]
+                boxes[i] = (max(0, int(x1 * scale_x) - padx1), max(0, int(y1 * scale_y) - pady1),
+                            min(width, int(x2 * scale_x) + padx2), min(height, int(y2 * scale_y) + pady2))
+
+        if smooth and len(boxes):
+            # Every cut and every start or end of a run of frames with a face splits the smoothing
+            cuts = {0, len(boxes)} | {start for start, _ in shots or []}
+            cuts |= {int(i) for i in np.flatnonzero(np.diff(has_face)) + 1}
+            cuts = sorted(cut for cut in cuts if 0 <= cut <= len(boxes))
+            boxes = smooth_boxes(boxes, T=5, shots=list(zip(cuts[:-1], cuts[1:])))
+
+        return [tuple(int(b) for b in box) if face else None for box, face in zip(boxes, has_face)]
+
+    def _infer_batch(self, frames, face_regions, indices, mel_spectrogram, fps, cartoon_mode=False, prepared=None,
+                     face_feats=None):
+        """
+        Lip-sync a batch of frames with one forward pass of the model.
+
+        Face crops and mel windows of every frame with a face region are stacked
+        into a single batch; the generated faces are then pasted back into their
+        own frames.
+
+        Args:
+            frames (list): Video frames of this batch
+            face_regions (list): Face region per frame of this batch (or None)
+            indices (list): Index of each frame in the processed video
+            mel_spectrogram (numpy.ndarray): Mel spectrogram of the audio
+            fps (float): Frame rate of the processed video
+            cartoon_mode (bool): Whether to use cartoon-specific processing
+            prepared (tuple, optional): Output of ``_prepare_face_batch`` for these frames
+            face_feats (list, optional): Face-encoder features of ``prepared``, shared between tracks
+
+        Returns:
+            list: Result frames, in the same order as ``frames``
+        """
+        results = list(frames)
+
+        if prepared is None:
+            prepared = self._prepare_face_batch(frames, face_regions)
+        if prepared is None:
+            return results
+        batch_slots, face_tensor, boxes = prepared
+
+        mel_batch = np.asarray([self._mel_window(mel_spectrogram, indices[slot], fps) for slot in batch_slots])
+        mel_tensor = torch.from_numpy(mel_batch[:, np.newaxis].astype(np.float32)).to(self.device, self.dtype)
+        if self.calibration_recorder is not None:
+            self.calibration_recorder.record(mel_tensor, face_tensor)
+
+        try:
+            synced_faces = self._forward(mel_tensor, face_tensor, cartoon_mode, face_feats=face_feats)
+        except Exception as e:
+            print(f"Error generating lip-sync for frames {indices[0]}-{indices[-1]}: {e}")
+            return results
+
+        for slot, synced_face, (x1, y1, x2, y2) in zip(batch_slots, synced_faces, boxes):
+            frame = results[slot]
+
+            # Resize back to original face size
+            synced_face = cv2.resize(synced_face, (x2-x1, y2-y1))
+
+            # For cartoon mode, use special blending function
+            if cartoon_mode:
+                result_frame = self.video_analyser.blend_cartoon_face(frame, synced_face, x1, y1, x2, y2)
+            else:
+                # Regular blending for non-cartoon faces
+                result_frame = frame.copy()
+                result_frame[y1:y2, x1:x2] = synced_face
+
+            results[slot] = result_frame
+
+        return results
+
+    def _run_inference_pipeline(self, batches, num_frames, mel_spectrograms, fps, write_frames, cartoon_mode=False):
+        """
+        Run inference over batches of frames with decode, inference and encode overlapped.
+
+        Each stage runs on its own thread with bounded queues in between
+        (see app.core.pipeline), so decoding the next batch and writing the
+        previous one happen while the model is busy. Every batch is decoded
+        and cropped once, then rendered against each audio track.
+
+        Args:
+            batches (iterable): (indices, frames, face_regions) tuples, in frame order
+            num_frames (int): Total number of frames, for progress reporting
+            mel_spectrograms (list): Mel spectrogram of each audio track
+            fps (float): Frame rate of the processed video
+            write_frames (list): Per track, a callable receiving every result frame in order
+            cartoon_mode (bool): Whether to use cartoon-specific processing
+
+        Returns:
+            dict: Run statistics (also stored in ``last_run_stats``)
+        """
+        batch_size = self.inference_batch_size
+        written = [0]
+
+        def prepare(batch):
+            indices, batch_frames, batch_regions = batch
+            return indices, batch_frames, batch_regions, self._prepare_face_batch(batch_frames, batch_regions)
+
+        def infer(batch):
+            indices, batch_frames, batch_regions, prepared = batch
+            face_feats = None
+            if prepared is not None and len(mel_spectrograms) > 1 and not self._cartoon_forward(cartoon_mode):
+                # The face encoder does not depend on the audio: run it once for every track
+                try:
+                    with torch.no_grad():
+                        face_feats = self.model.encode_face(prepared[1])
+                except Exception as e:
+                    # Each track then runs the full forward, which skips this batch if it fails too
+                    print(f"Error encoding faces for frames {indices[0]}-{indices[-1]}: {e}")
+            return [self._infer_batch(batch_frames, batch_regions, indices, mel_spectrogram, fps,
+                                      cartoon_mode=cartoon_mode, prepared=prepared, face_feats=face_feats)
+                    for mel_spectrogram in mel_spectrograms]
+
+        def encode(track_results):
+            for write_frame, result_frames in zip(write_frames, track_results):
+                for result_frame in result_frames:
+                    write_frame(result_frame)
+            count = len(track_results[0])
+            written[0] += count
+            if written[0] % 100 < count or written[0] == num_frames:
+                print(f"Processed {written[0]}/{num_frames} frames ({len(track_results)} track(s))")
+
+        pipeline = StagedPipeline([('prepare', prepare), ('infer', infer), ('encode', encode)],
+                                  queue_size=self.pipeline_queue_size)
+
+        start_time = time.perf_counter()
+        pipeline.run(batches)
+        elapsed = time.perf_counter() - start_time
+        if self.calibration_recorder is not None:
+            self.calibration_recorder.flush()
+
+        generated = written[0] * len(mel_spectrograms)
+        self.last_run_stats = {
+            'frames': written[0],
+            'tracks': len(mel_spectrograms),
+            'batch_size': batch_size,
+            'inference_seconds': elapsed,
+            'frames_per_second': generated / elapsed if elapsed > 0 else float('inf'),
+            'pipeline': pipeline.stats(),
+            # Detection scale, detection time and time saved vs full resolution (see VideoAnalyser.detect_faces)
+            'face_detection': dict(self.video_analyser.last_detection_report),
+        }
+        print(f"Lip sync inference: {generated} frames in {elapsed:.2f}s "
+              f"({self.last_run_stats['frames_per_second']:.1f} frames/sec, batch size {batch_size})")
+        pipeline.print_stats()
+        return self.last_run_stats
+
+    def generate_lip_sync(self, video_path, audio_path, output_path=None, cartoon_mode=False, batch_process=True,
+                          streaming=False, face_detector=None, source_resolution=False, pads=None, smooth=False):
         """
         Generate lip-synced video by combining video frames with audio.
 
@@ -78,7 +432,17 @@ class LipSyncEngine:
             audio_path (str): Path to the input audio file
             output_path (str, optional): Path to save the output video
             cartoon_mode (bool): Whether to use cartoon-specific processing
-            batch_process (bool): Whether to process in batches for memory efficiency
+            batch_process (bool): Whether to write long videos to disk batch by batch
+            streaming (bool): Decode the video twice (detection pass, then inference
+                pass at the source resolution) instead of keeping every frame in memory
+            face_detector (str, optional): Face detector backend for this video
+                (default: the engine's)
+            source_resolution (bool): Render at the source size, as ``streaming``
+                does, rather than at the analysis resolution
+            pads (tuple, optional): Streaming / source resolution only: (top, bottom,
+                left, right) padding of the face boxes, as ``--pads`` of Wav2Lip/inference.py
+            smooth (bool): Streaming / source resolution only: smooth the face boxes
+                over 5 frames, as Wav2Lip/inference.py does by default
 
         Returns:
             str: Path to the generated video
@@ -87,6 +451,10 @@ class LipSyncEngine:
             base_name = os.path.splitext(video_path)[0]
             output_path = f"{base_name}_lip_synced.mp4"
 
+        if streaming or source_resolution:
+            return self._generate_lip_sync_streaming(video_path, audio_path, output_path, cartoon_mode,
+                                                     face_detector=face_detector, pads=pads, smooth=smooth)
+
         try:
             # Determine processing parameters based on system capabilities
             max_resolution = 256 if self.low_memory_mode else 320
@@ -98,7 +466,7 @@ class LipSyncEngine:
                 video_path, 
                 max_resolution=max_resolution,
                 frame_skip=frame_skip,
-                low_memory_code=self.low_memory_mode
+                low_memory_mode=self.low_memory_mode
             )
             
             # Adjust fps if frames were skipped
@@ -110,17 +478,23 @@ class LipSyncEngine:
             
             # Step 3: Detect faces in frames
             print("Detecting faces...")
+            shots = self._shot_ranges(video_path, frame_skip)
+            cache_key = self.video_analyser.face_track_key(video_path, max_resolution, frame_skip, cartoon_mode,
+                                                           shots=shots, face_detector=face_detector)
             if cartoon_mode:
                 print("Using cartoon mode for face detection...")
-                # Preprocess frames for better cartoon face detection
-                preprocessed_frames = [self.video_analyser.preprocess_cartoon_frame(frame) for frame in frames]
-                face_regions = self.video_analyser.detect_faces(preprocessed_frames, cartoon_mode=True, device=self.device)
+                # Preprocess frames for better cartoon face detection (only if there is no cached track)
+                preprocessed_frames = (self.video_analyser.preprocess_cartoon_frame(frame) for frame in frames)
+                face_regions = self.video_analyser.detect_faces(preprocessed_frames, cartoon_mode=True,
+                                                                cache_key=cache_key, shots=shots,
+                                                                face_detector=face_detector)
                 # Clean up preprocessed frames to save memory
                 del preprocessed_frames
                 import gc
                 gc.collect()
             else:
-                face_regions = self.video_analyser.detect_faces(frames)
+                face_regions = self.video_analyser.detect_faces(frames, cache_key=cache_key, shots=shots,
+                                                                face_detector=face_detector)
             
             # Check if any faces were detected
             if all(region is None for region in face_regions):
@@ -133,204 +507,47 @@ class LipSyncEngine:
                 face_regions = [default_region] * len(frames)
                 print(f"Using manual face region: {default_region}")
             
-            # Step 4: Apply lip sync to each frame
-            print("Applying lip sync...")
-
-            # Process in batches and write directly for better memory management
-            if batch_process:
-                # Threshold is lower for low memory mode
-                batch_threshold = 200 if self.low_memory_mode else 500
-                if len(frames) > batch_threshold:
-                    print(f"Processing in batches (threshold: {batch_threshold} frames)")
-                    
-                    # Create temporary output without audio for direct writing
-                    temp_video_path = output_path + "_temp.mp4"
-                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                    
-                    # Use the processing resolution, not the original resolution
-                    process_h, process_w = frames[0].shape[:2]
-                    out = cv2.VideoWriter(temp_video_path, fourcc, effective_fps, (process_w, process_h))
-                    
-                    # Process in batches
-                    # Smaller batch size for low memory mode
-                    batch_size = 50 if self.low_memory_mode else 100
-                    
-                    for i in range(0, len(frames), batch_size):
-                        print(f"Processing batch {i//batch_size + 1}/{(len(frames) + batch_size - 1)//batch_size}")
-                        
-                        batch_frames = frames[i:i+batch_size]
-                        batch_regions = face_regions[i:i+batch_size]
-                        
-                        for j, (frame, face_region) in enumerate(zip(batch_frames, batch_regions)):
-                            global_idx = i + j  # Global frame index for mel spectrogram lookup
-                            
-                            if face_region is None:
-                                # If no face detected, use original frame
-                                out.write(frame)
-                                continue
-                            
-                            # Extract face ROI
-                            x1, y1, x2, y2 = [int(b) for b in face_region]
-                            face_img = frame[y1:y2, x1:x2]
-                            
-                            # Resize to model input size
-                            face_img = cv2.resize(face_img, (96, 96))
-                            
-                            # Convert to tensor
-                            face_tensor = torch.FloatTensor(np.transpose(face_img, (2, 0, 1))).unsqueeze(0).to(self.device)
-                            
-                            # Get corresponding mel segment
-                            mel_idx = int(global_idx / len(frames) * len(mel_spectrogram))
-                            mel_window = mel_spectrogram[max(0, mel_idx-5):mel_idx+5]
-                            if len(mel_window) < 10:  # Handle edge case
-                                mel_window = np.pad(mel_window, ((0, 10 - len(mel_window)), (0, 0)), 'edge')
-                            mel_tensor = torch.FloatTensor(mel_window).unsqueeze(0).to(self.device)
-                            
-                            # Generate lip-synced face
-                            with torch.no_grad():
-                                try:
-                                    if cartoon_mode and 'smooth' in self.model.forward.__code__.co_varnames:
-                                        synced_face = self.model(face_tensor, mel_tensor, smooth=True)
-                                    else:
-                                        synced_face = self.model(face_tensor, mel_tensor)
-                                    
-                                    synced_face = synced_face.cpu().numpy().transpose(0, 2, 3, 1)[0]
-                                except Exception as e:
-                                    print(f"Error generating lip-sync for frame {global_idx}: {e}")
-                                    out.write(frame)
-                                    continue
-                                
-                            # Resize back to original face size
-                            synced_face = cv2.resize(synced_face, (x2-x1, y2-y1))
-                            
-                            # For cartoon mode, use special blending function
-                            if cartoon_mode:
-                                result_frame = self.video_analyser.blend_cartoon_face(frame, synced_face, x1, y1, x2, y2)
-                            else:
-                                # Regular blending for non-cartoon faces
-                                result_frame = frame.copy()
-                                result_frame[y1:y2, x1:x2] = synced_face
-                            
-                            # Write frame directly to video
-                            out.write(result_frame)
-                            
-                            if global_idx % 100 == 0:
-                                print(f"Processed {global_idx}/{len(frames)} frames")
-                        
-                        # Clear memory after each batch
-                        del batch_frames
-                        del batch_regions
-                        import gc
-                        gc.collect()
-                        
-                    out.release()
-                    
-                    # Step 5: Add audio to the video
-                    print("Adding audio to video...")
-                    final_output = self.video_analyser.add_audio_to_video(temp_video_path, audio_path, output_path)
-                    
-                    # Remove temp file
-                    try:
-                        os.remove(temp_video_path)
-                    except:
-                        print(f"Could not remove temporary file {temp_video_path}")
-                    
-                    print(f"Lip-sync completed! Output saved to: {final_output}")
-                    return final_output
-                    
-            # Original non-batched processing (for shorter videos)
-            synced_frames = []
-            
-            for i, (frame, face_region) in enumerate(zip(frames, face_regions)):
-                if face_region is None:
-                    # If no face detected, use original frame
-                    synced_frames.append(frame)
-                    continue
-                
-                # Extract face ROI
-                x1, y1, x2, y2 = [int(b) for b in face_region]
-                face_img = frame[y1:y2, x1:x2]
-                
-                # Resize to model input size
-                face_img = cv2.resize(face_img, (96, 96))
-                
-                # Convert to tensor
-                face_tensor = torch.FloatTensor(np.transpose(face_img, (2, 0, 1))).unsqueeze(0).to(self.device)
-                
-                # Get corresponding mel segment
-                mel_idx = int(i / len(frames) * len(mel_spectrogram))
-                mel_window = mel_spectrogram[max(0, mel_idx-5):mel_idx+5]
-                if len(mel_window) < 10:  # Handle edge case
-                    mel_window = np.pad(mel_window, ((0, 10 - len(mel_window)), (0, 0)), 'edge')
-                mel_tensor = torch.FloatTensor(mel_window).unsqueeze(0).to(self.device)
-                
-                # Generate lip-synced face
-                with torch.no_grad():
-                    # For cartoon characters, we can adjust model parameters (if available)
-                    try:
-                        if cartoon_mode:
-                            # If the model accepts a smooth parameter, use it
-                            if 'smooth' in self.model.forward.__code__.co_varnames:
-                                synced_face = self.model(face_tensor, mel_tensor, smooth=True)
-                            else:
-                                synced_face = self.model(face_tensor, mel_tensor)
-                        else:
-                            synced_face = self.model(face_tensor, mel_tensor)
-                        
-                        synced_face = synced_face.cpu().numpy().transpose(0, 2, 3, 1)[0]  # (C,H,W) -> (H,W,C)
-                    except Exception as e:
-                        print(f"Error generating lip-sync for frame {i}: {e}")
-                        synced_frames.append(frame)
-                        continue
-                    
-                # Resize back to original face size
-                synced_face = cv2.resize(synced_face, (x2-x1, y2-y1))
-                
-                # For cartoon mode, use special blending function
-                if cartoon_mode:
-                    result_frame = self.video_analyser.blend_cartoon_face(frame, synced_face, x1, y1, x2, y2)
-                else:
-                    # Regular blending for non-cartoon faces
-                    result_frame = frame.copy()
-                    result_frame[y1:y2, x1:x2] = synced_face
-                
-                synced_frames.append(result_frame)
-                
-                if i % 100 == 0:
-                    print(f"Processed {i}/{len(frames)} frames")
-
-                # For very low memory, periodically write frames and clear memory
-                if self.low_memory_mode and len(synced_frames) > 500:
-                    if i == 500:  # First batch - create the writer
-                        temp_video_path = output_path + "_temp.mp4"
-                        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                        process_h, process_w = synced_frames[0].shape[:2]
-                        out = cv2.VideoWriter(temp_video_path, fourcc, effective_fps, (process_w, process_h))
-                    
-                    # Write frames in batches
-                    for frame in synced_frames:
-                        out.write(frame)
-                    
-                    # Clear memory
-                    synced_frames = []
-                    import gc
-                    gc.collect()
-
-            # If using incremental writing in low memory mode, finalize video
-            if self.low_memory_mode and not synced_frames:
-                out.release()
-                final_output = self.video_analyser.add_audio_to_video(temp_video_path, audio_path, output_path)
-                try:
-                    os.remove(temp_video_path)
-                except:
-                    print(f"Could not remove temporary file {temp_video_path}")
-                
+            # Step 4: Apply lip sync, one forward pass per inference batch
+            batch_size = self.inference_batch_size
+            print(f"Applying lip sync (inference batch size: {batch_size})...")
+
+            # Long videos are written to disk batch by batch for better memory management
+            # Threshold is lower for low memory mode
+            batch_threshold = 200 if self.low_memory_mode else 500
+            write_directly = batch_process and len(frames) > batch_threshold
+
+            if write_directly:
+                print(f"Writing frames directly to disk (threshold: {batch_threshold} frames)")
+
+                # Use the processing resolution, not the original resolution
+                process_h, process_w = frames[0].shape[:2]
+                out = open_video_writer(output_path, effective_fps, (process_w, process_h),
+                                        audio_path=audio_path, **self.encoder_settings)
+            else:
+                synced_frames = []
+
+            write_frame = out.write if write_directly else synced_frames.append
+            batches = ((list(range(i, min(i + batch_size, len(frames)))),
+                        frames[i:i + batch_size], face_regions[i:i + batch_size])
+                       for i in range(0, len(frames), batch_size))
+            try:
+                self._run_inference_pipeline(batches, len(frames), [mel_spectrogram], effective_fps,
+                                             [write_frame], cartoon_mode=cartoon_mode)
+            except Exception:
+                if write_directly:
+                    out.abort()
+                raise
+
+            if write_directly:
+                # Frames and audio are encoded in a single pass
+                final_output = out.release()
                 print(f"Lip-sync completed! Output saved to: {final_output}")
                 return final_output
-            
+
             # Otherwise, save all frames at once
             print("Saving video...")
-            self.video_analyser.save_video(output_path, synced_frames, effective_fps, (original_w, original_h), audio_path)
+            self.video_analyser.save_video(output_path, synced_frames, effective_fps, (original_w, original_h), audio_path,
+                                           **self.encoder_settings)
             
             print(f"Lip-sync completed! Output saved to: {output_path}")
             return output_path
@@ -340,6 +557,159 @@ class LipSyncEngine:
             traceback.print_exc()
             raise
 
+    def _generate_lip_sync_streaming(self, video_path, audio_path, output_path, cartoon_mode=False,
+                                     face_detector=None, pads=None, smooth=False):
+        """
+        Generate a lip-synced video in two streaming passes over the input.
+
+        Args:
+            video_path (str): Path to the input video file
+            audio_path (str): Path to the input audio file
+            output_path (str): Path to save the output video
+            cartoon_mode (bool): Whether to use cartoon-specific processing
+            face_detector (str, optional): Face detector backend (default: the engine's)
+            pads (tuple, optional): (top, bottom, left, right) padding of the face boxes
+            smooth (bool): Smooth the face boxes over 5 frames
+
+        Returns:
+            str: Path to the generated video
+        """
+        return self.generate_multi_lip_sync(video_path, [audio_path], [output_path], cartoon_mode=cartoon_mode,
+                                            face_detector=face_detector, pads=pads, smooth=smooth)[0]
+
+    def generate_multi_lip_sync(self, video_path, audio_paths, output_paths=None, cartoon_mode=False,
+                                shot_index_path=None, face_detector=None, pads=None, smooth=False):
+        """
+        Lip-sync one video against several audio tracks (e.g. one per language).
+
+        The video is decoded and face-detected once; the mel spectrograms of
+        all tracks are computed in parallel. Inference then runs in two
+        streaming passes: the first keeps only the face regions, the second
+        decodes each batch once, crops its faces once and renders it against
+        every track, writing N outputs side by side. Peak memory is bounded by
+        the inference batch size instead of the clip length.
+
+        Faces are detected on frames downscaled to the analysis resolution,
+        but the second pass decodes the source frames: the generated faces
+        are pasted into them and the outputs keep the source size, as
+        Wav2Lip/inference.py writes them.
+
+        Args:
+            video_path (str): Path to the input video file
+            audio_paths (list): Paths to the audio tracks
+            output_paths (list, optional): Output video per track
+            cartoon_mode (bool): Whether to use cartoon-specific processing
+            shot_index_path (str, optional): Where the shot index is saved (e.g. next
+                to the project file; default: cache directory)
+            face_detector (str, optional): Face detector backend for this video
+                (default: the engine's)
+            pads (tuple, optional): (top, bottom, left, right) padding of the face
+                boxes in source pixels, as ``--pads`` of Wav2Lip/inference.py
+            smooth (bool): Smooth the face boxes over 5 frames, as Wav2Lip/inference.py
+                does unless ``--nosmooth``
+
+        Returns:
+            list: Paths to the generated videos, in the order of ``audio_paths``
+        """
+        audio_paths = list(audio_paths)
+        if output_paths is None:
+            base_name = os.path.splitext(video_path)[0]
+            output_paths = [f"{base_name}_{Path(audio_path).stem}_lip_synced.mp4" for audio_path in audio_paths]
+        output_paths = [str(output_path) for output_path in output_paths]
+        if len(output_paths) != len(audio_paths):
+            raise ValueError("Expected one output path per audio track")
+
+        writers = []
+        try:
+            max_resolution = 256 if self.low_memory_mode else 320
+            frame_skip = 2 if self.device.type == 'cpu' and self.low_memory_mode else 1
+
+            def frame_stream(resolution=max_resolution):
+                return self.video_analyser.iter_frames(video_path, max_resolution=resolution,
+                                                       frame_skip=frame_skip,
+                                                       low_memory_mode=self.low_memory_mode)
+
+            fps, (source_w, source_h), (process_w, process_h), _ = self.video_analyser.get_video_info(
+                video_path, max_resolution)
+            effective_fps = fps / frame_skip
+            batch_size = self.inference_batch_size
+
+            # Audio work runs in the background while the video is decoded and scanned
+            print(f"Processing {len(audio_paths)} audio track(s)...")
+            with ThreadPoolExecutor(max_workers=max(1, min(len(audio_paths), os.cpu_count() or 1))) as executor:
+                mel_futures = [executor.submit(AudioProcessor.process_audio, audio_path)
+                               for audio_path in audio_paths]
+
+                # Pass 1: decode + detect, keeping only the face regions
+                print("Detecting faces (streaming pass 1/2)...")
+                # Decode (and cartoon preprocessing) run on background threads while the detector runs
+                stages = [('preprocess', self.video_analyser.preprocess_cartoon_frame)] if cartoon_mode else []
+                prefetch = StagedPipeline(stages, queue_size=self.pipeline_queue_size * batch_size)
+                if cartoon_mode:
+                    print("Using cartoon mode for face detection...")
+                shots = self._shot_ranges(video_path, frame_skip, shot_index_path)
+                cache_key = self.video_analyser.face_track_key(video_path, max_resolution, frame_skip,
+                                                               cartoon_mode, shots=shots, face_detector=face_detector)
+                face_regions = self.video_analyser.detect_faces(prefetch.iterate(frame_stream()),
+                                                                cartoon_mode=cartoon_mode, cache_key=cache_key,
+                                                                shots=shots, face_detector=face_detector)
+                prefetch.print_stats()
+
+                mel_spectrograms = [future.result() for future in mel_futures]
+
+            if not face_regions:
+                raise ValueError(f"No frames could be extracted from {video_path}")
+
+            if all(region is None for region in face_regions):
+                print("No faces detected in any frame. Attempting with manual face region...")
+                x1, y1 = int(process_w*0.2), int(process_h*0.2)
+                x2, y2 = int(process_w*0.8), int(process_h*0.8)
+                default_region = [x1, y1, x2, y2]
+                face_regions = [default_region] * len(face_regions)
+                print(f"Using manual face region: {default_region}")
+
+            # Pass 2 renders on the source frames: boxes move from analysis to source pixels
+            face_regions = self._source_regions(face_regions, (source_w / process_w, source_h / process_h),
+                                                (source_w, source_h), pads=pads, smooth=smooth, shots=shots)
+
+            # Pass 2: decode again at the source size, infer every track and write batch by batch
+            num_frames = len(face_regions)
+            print(f"Applying lip sync (streaming pass 2/2, {len(audio_paths)} track(s), "
+                  f"inference batch size: {batch_size})...")
+
+            for audio_path, output_path in zip(audio_paths, output_paths):
+                writers.append(open_video_writer(output_path, effective_fps, (source_w, source_h),
+                                                 audio_path=audio_path, **self.encoder_settings))
+
+            def batches():
+                frame_iter = frame_stream(source_h)
+                i = 0
+                while i < num_frames:
+                    batch_frames = list(itertools.islice(frame_iter, min(batch_size, num_frames - i)))
+                    if not batch_frames:
+                        break
+                    yield list(range(i, i + len(batch_frames))), batch_frames, face_regions[i:i + len(batch_frames)]
+                    i += len(batch_frames)
+
+            self._run_inference_pipeline(batches(), num_frames, mel_spectrograms, effective_fps,
+                                         [writer.write for writer in writers], cartoon_mode=cartoon_mode)
+
+            # Frames and audio are encoded in a single pass
+            final_outputs = []
+            while writers:
+                final_outputs.append(writers.pop(0).release())
+
+            for final_output in final_outputs:
+                print(f"Lip-sync completed! Output saved to: {final_output}")
+            return final_outputs
+
+        except Exception as e:
+            for writer in writers:
+                writer.abort()
+            print(f"Error during lip-sync: {e}")
+            traceback.print_exc()
+            raise
+
 def main():
     # Create PyQt application
     app = QApplication(sys.argv)
@@ -1,78 +1,194 @@
 import os
+import itertools
 import cv2
 import ffmpeg
 import numpy as np
 from moviepy.video import VideoFileClip
 import Wav2Lip
-from app.core.sync_engine import LipSyncEngine
+from app.core.cache import FaceTrackCache
+from app.core.frame_decoder import FFmpegFrameDecoder, ffmpeg_decoder_available, probe_video
+from app.core.video_writer import open_video_writer
 from moviepy.video.io.VideoFileClip import VideoFileClip
 
 class VideoAnalyser:
-    def __init__(self, device, low_memory_mode=False):
+    def __init__(self, device, low_memory_mode=False, decoder='auto', face_track_cache=True,
+                 detection_batch_size=None, detection_keyframe_interval=1, detection_scale='auto',
+                 face_detector='sfd', detection_workers=0, detection_threads=None, optimize_models=True,
+                 precision='fp32'):
+        """
+        Args:
+            device: Torch device used for face detection
+            low_memory_mode (bool): Enable optimizations for low memory systems
+            decoder (str): Frame decoder backend: 'ffmpeg', 'opencv' or 'auto'
+                (ffmpeg when available, otherwise opencv)
+            face_track_cache (bool or FaceTrackCache): Reuse the face detections of
+                already processed videos (True = default on-disk cache)
+            detection_batch_size (int, optional): Frames per S3FD forward pass
+                (default: 8 in low memory mode, else 16)
+            detection_keyframe_interval (int): Run S3FD every N frames and track the
+                face in between (1 = detect on every frame)
+            detection_scale (float or str): Scale frames are resized by for face
+                detection; 'auto' probes the first frames and scales the face to
+                about 160 px (never upscaling)
+            face_detector (str): Face detector backend (see
+                ``Wav2Lip.face_detection.available_detectors``), e.g. 'cascade+sfd'
+                to run S3FD only where the OpenCV cascade is unsure
+            detection_workers (int): On CPU, run face detection in this many worker
+                processes, each with its own detector (0 = in this process)
+            detection_threads (int, optional): Torch threads of each detection worker
+                (default: CPU cores / detection_workers)
+            optimize_models (bool): Run S3FD with its L2Norm scales folded into the
+                heads and channels_last weights (see Wav2Lip.models.fusion)
+            precision (str): S3FD weight precision, 'fp32' or 'bf16'
+        """
         self.device = device
         self.low_memory_mode = low_memory_mode
+        if decoder == 'auto':
+            decoder = 'ffmpeg' if ffmpeg_decoder_available() else 'opencv'
+        self.decoder = decoder
+        self.face_detector = face_detector
+        self.detection_workers = detection_workers
+        self.detection_threads = detection_threads
+        self.optimize_models = optimize_models
+        self.precision = precision
+        self._detectors = {}
+        if face_track_cache is True:
+            face_track_cache = FaceTrackCache()
+        self.face_track_cache = face_track_cache or None
+        self.detection_batch_size = detection_batch_size
+        self.detection_keyframe_interval = detection_keyframe_interval
+        self.detection_scale = detection_scale
+        self.last_detection_report = {}
 
-    def extract_frames(self, video_path, max_resolution=320, frame_skip=1, low_memory_mode=False):
+    def get_detector(self, face_detector=None):
         """
-        Extract frames from a video file.
+        Get a face detector, loading it on first use.
+
+        Args:
+            face_detector (str, optional): Detector backend (default: the analyser's)
+
+        Returns:
+            FaceAlignment: Detector shared by every detect_faces call using that backend
+        """
+        name = face_detector or self.face_detector
+        if name not in self._detectors:
+            from Wav2Lip import face_detection as face_dec
+            detector = name
+            if self.detection_workers > 0 and self.device.type == 'cpu':
+                from Wav2Lip.face_detection.detection.pool import DetectionPool
+                detector = DetectionPool(num_workers=self.detection_workers, face_detector=name,
+                                         threads_per_worker=self.detection_threads, optimize=self.optimize_models,
+                                         precision=self.precision)
+            self._detectors[name] = face_dec.FaceAlignment(face_dec.LandmarksType._2D, flip_input=False,
+                                                           device=self.device, face_detector=detector,
+                                                           optimize=self.optimize_models,
+                                                           precision=self.precision)
+        return self._detectors[name]
+
+    def get_video_info(self, video_path, max_resolution=320):
+        """
+        Read the properties of a video file without decoding any frame.
 
         Args:
             video_path (str): Path to the input video file
             max_resolution (int): Maximum height for processing
-            frame_skip (int): Process every Nth frame (1=all frames, 2=every other frame)
 
         Returns:
-            tuple: (frames, fps, original_dimensions)
+            tuple: (fps, original_dimensions, processing_dimensions, total_frames)
         """
-        video = cv2.VideoCapture(video_path)
-        fps = video.get(cv2.CAP_PROP_FPS)
-        
-        original_w = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-        original_h = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps, (original_w, original_h), total_frames = probe_video(video_path)
 
-        scale = 1.0
         if original_h > max_resolution:
             scale = max_resolution / original_h
-            new_w = int(original_w * scale)
-            new_h = max_resolution
-            print(f"Downscaling video from {original_w}x{original_h} to {new_w}x{new_h} for processing")
+            new_w, new_h = int(original_w * scale), max_resolution
         else:
             new_w, new_h = original_w, original_h
 
-        frames = []
+        return fps, (original_w, original_h), (new_w, new_h), total_frames
+
+    def iter_frames(self, video_path, max_resolution=320, frame_skip=1, low_memory_mode=False, start=None, end=None):
+        """
+        Decode a video file frame by frame.
+
+        Only the current frame is held in memory, so the video can be read
+        as many times as needed without loading the whole clip.
+
+        Args:
+            video_path (str): Path to the input video file
+            max_resolution (int): Maximum height for processing
+            frame_skip (int): Process every Nth frame (1=all frames, 2=every other frame)
+            start (float, optional): Start of the [start, end) range to decode, in seconds
+            end (float, optional): End of the range to decode, in seconds
+
+        Yields:
+            numpy.ndarray: Decoded (and downscaled) frame
+        """
+        fps, (original_w, original_h), (new_w, new_h), _ = self.get_video_info(video_path, max_resolution)
+        resize = (new_w, new_h) != (original_w, original_h)
+
+        if self.decoder == 'ffmpeg':
+            # Scaling and frame skipping happen inside ffmpeg
+            decoder = FFmpegFrameDecoder(video_path, size=(new_w, new_h) if resize else None,
+                                         frame_step=frame_skip, start=start, end=end)
+            yield from decoder
+            return
+
+        video = cv2.VideoCapture(video_path)
+        first_frame = int(round(start * fps)) if start else 0
+        last_frame = int(round(end * fps)) if end is not None else None
+        if first_frame:
+            video.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
         frame_count = 0
-        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-        
+        try:
+            while last_frame is None or first_frame + frame_count < last_frame:
+                ret, frame = video.read()
+                if not ret:
+                    break
+
+                # Only process every Nth frame if skipping
+                if frame_count % frame_skip == 0:
+                    # Resize if needed
+                    if resize:
+                        frame = cv2.resize(frame, (new_w, new_h))
+                    yield frame
+
+                frame_count += 1
+
+                # For low memory, periodically clear unnecessary variables
+                if low_memory_mode and frame_count % 1000 == 0:
+                    import gc
+                    gc.collect()
+        finally:
+            video.release()
+
+    def extract_frames(self, video_path, max_resolution=320, frame_skip=1, low_memory_mode=False):
+        """
+        Extract frames from a video file.
+
+        Args:
+            video_path (str): Path to the input video file
+            max_resolution (int): Maximum height for processing
+            frame_skip (int): Process every Nth frame (1=all frames, 2=every other frame)
+
+        Returns:
+            tuple: (frames, fps, original_dimensions)
+        """
+        fps, (original_w, original_h), (new_w, new_h), total_frames = self.get_video_info(video_path, max_resolution)
+        if (new_w, new_h) != (original_w, original_h):
+            print(f"Downscaling video from {original_w}x{original_h} to {new_w}x{new_h} for processing")
+
         # Apply frame_skip (can be adjusted for low-end systems)
         effective_fps = fps / frame_skip
         print(f"Processing at effective {effective_fps:.1f} FPS (skipping every {frame_skip} frames)")
-        
-        while True:
-            ret, frame = video.read()
-            if not ret:
-                break
-            
-            # Only process every Nth frame if skipping
-            if frame_count % frame_skip == 0:
-                # Resize if needed
-                if scale < 1.0:
-                    frame = cv2.resize(frame, (new_w, new_h))
-                
-                frames.append(frame)
-                
-                # Show progress
-                if len(frames) % 100 == 0:
-                    print(f"Extracted {len(frames)} frames out of {total_frames//frame_skip} (estimated)")
-            
-            frame_count += 1
-            
-            # For low memory, periodically clear unnecessary variables
-            if low_memory_mode and frame_count % 1000 == 0:
-                import gc
-                gc.collect()
-        
-        video.release()
-        
+
+        frames = []
+        for frame in self.iter_frames(video_path, max_resolution, frame_skip, low_memory_mode):
+            frames.append(frame)
+
+            # Show progress
+            if len(frames) % 100 == 0:
+                print(f"Extracted {len(frames)} frames out of {total_frames//frame_skip} (estimated)")
+
         if not frames:
             raise ValueError(f"No frames could be extracted from {video_path}")
         
@@ -105,20 +221,67 @@ class VideoAnalyser:
 
         return enhanced
     
-    def detect_faces(self, frames, cartoon_mode=True):
+    def detect_shots(self, video_path, index_path=None):
+        """
+        Shot index of a video (see ``app.core.shot_detection``).
+
+        Args:
+            video_path (str): Path to the input video file
+            index_path (str, optional): Where the index is saved, e.g. next to the
+                project file (default: cache directory)
+
+        Returns:
+            ShotIndex: Shot ranges of the video, in source frames
+        """
+        from app.core.shot_detection import ShotBoundaryDetector
+        return ShotBoundaryDetector().detect_video(video_path, index_path, decoder=self.decoder)
+
+    def face_track_key(self, video_path, max_resolution=320, frame_skip=1, cartoon_mode=False, shots=None,
+                       face_detector=None):
+        """
+        Face-track cache key of a video decoded with the given settings.
+
+        Returns:
+            str: Cache key, or None when the cache is disabled
+        """
+        if self.face_track_cache is None:
+            return None
+        from Wav2Lip.face_detection.detection.sfd.sfd_detector import SFDDetector
+        return self.face_track_cache.key(video_path, max_resolution=max_resolution, frame_skip=frame_skip,
+                                         cartoon_mode=cartoon_mode, decoder=self.decoder,
+                                         detector=face_detector or self.face_detector,
+                                         threshold=SFDDetector.score_threshold,
+                                         keyframe_interval=self.detection_keyframe_interval,
+                                         detection_scale=self.detection_scale, shots=shots,
+                                         # fp32 keys stay as they were before the precision option
+                                         **({'precision': self.precision} if self.precision != 'fp32' else {}))
+
+    def detect_faces(self, frames, cartoon_mode=True, cache_key=None, shots=None, face_detector=None):
         """
         Detect faces in all video frames.
 
         Args:
-            frames (list): List of video frames
+            frames (iterable): Video frames, either a list or a frame generator
+                (e.g. from ``iter_frames``); only one batch is held at a time
             cartoon_mode (bool): Use lower thresholds for cartoon faces
+            cache_key (str, optional): Key from ``face_track_key``. On a cache hit
+                ``frames`` is never iterated, so a lazy generator is not even decoded
+            shots (list, optional): [start, end) frame range of every shot (from
+                ``ShotIndex.ranges``); detection and tracking restart at every cut, so
+                no region is carried over from the previous shot
+            face_detector (str, optional): Detector backend for this call (default: the analyser's)
 
         Returns:
             list: List of detected face regions
         """
-        face_dec = Wav2Lip.face_detection
-        detector = face_dec.FaceAlignment(face_dec.LandmarksType._2D, 
-                                          flip_input=False, device=self.device)
+        if cache_key is not None:
+            face_regions = self.face_track_cache.load_regions(cache_key)
+            if face_regions is not None:
+                print(f"Using cached face detections ({len(face_regions)} frames)")
+                self.last_detection_report = {'cached': True}
+                return face_regions
+
+        detector = self.get_detector(face_detector)
         
         # Lower threshold for cartoon detection to catch more features
         if cartoon_mode and hasattr(detector.face_detector, 'det_thresh'):
@@ -127,52 +290,186 @@ class VideoAnalyser:
             print("Using lower detection threshold for cartoon faces")
 
         # Process in small batches to save memory
-        batch_size = 8 if self.low_memory_mode else 16
-        face_regions = []
+        batch_size = self.detection_batch_size or (8 if self.low_memory_mode else 16)
+        frame_iter = iter(frames)
 
-        for i in range(0, len(frames), batch_size):
-            print(f"Detecting faces in frames {i} to {min(i+batch_size, len(frames)-1)}")
-            batch_frames = frames[i:i+batch_size]
-            predictions = []
-            
-            for frame in batch_frames:
-                try:
-                    prediction = detector.face_detector.detect_from_image(frame)
-                    if len(prediction) == 0:
-                        # No face detected
-                        if face_regions:
-                            # Use previous face if available
-                            predictions.append(face_regions[-1])
-                        else:
-                            predictions.append(None)
-                    else:
-                        # Use the face with largest bounding box
-                        max_area = 0
-                        max_pred = None
-                        for pred in prediction:
-                            area = (pred[2] - pred[0]) * (pred[3] - pred[1])
-                            if area > max_area:
-                                max_area = area
-                                max_pred = pred
-                        predictions.append(max_pred)
-                except Exception as e:
-                    print(f"Error in face detection: {e}")
-                    predictions.append(None)
-            
-            face_regions.extend(predictions)
-            
-            # For low memory mode, clear memory periodically
-            if self.low_memory_mode:
-                del batch_frames
-                import gc
-                gc.collect()
+        # Probe the first frames for the face size and detect at the scale that brings it near the target
+        def detect_full_resolution(batch_frames):
+            return self._detect_batch(detector.face_detector, batch_frames)
+
+        head = list(itertools.islice(frame_iter, batch_size))
+        frame_iter = itertools.chain(head, frame_iter)
+        scale_policy = self._scale_policy()
+        # The probed frames' detections are reused by detect_batch rather than computed again
+        scale_policy.choose(detect_full_resolution, head)
+        detect_batch = scale_policy.wrap(detect_full_resolution)
+
+        tracker = self._face_tracker(detect_batch, batch_size) if self.detection_keyframe_interval > 1 else None
+        face_regions = []
+        # Without shots the clip is one shot; the last shot runs to the end of the stream
+        starts = [start for start, _ in shots] if shots else [0]
+        lengths = [end - start for start, end in shots[:-1]] + [None] if shots else [None]
+        for start, length in zip(starts, lengths):
+            shot_frames = itertools.islice(frame_iter, length)
+            if tracker is not None:
+                # None for every frame of a shot without any face
+                face_regions.extend(None if np.isnan(track[0]) else track for track in tracker.track(shot_frames))
+            else:
+                face_regions.extend(self._select_face_regions(
+                    self._detect_all(detect_batch, shot_frames, batch_size, first_index=start)))
+        if tracker is not None:
+            tracker.print_stats()
+        scale_policy.print_report()
+        self.last_detection_report = scale_policy.report()
+        self.last_detection_report['detector'] = face_detector or self.face_detector
+        if hasattr(detector.face_detector, 'stats'):
+            # Fast-then-verify backends: how many frames the accurate detector had to see
+            self.last_detection_report.update(detector.face_detector.stats())
 
         # Reset detector threshold
         if cartoon_mode and hasattr(detector.face_detector, 'det_thresh'):
             detector.face_detector.det_thresh = original_threshold
+
+        if cache_key is not None:
+            self.face_track_cache.store_regions(cache_key, face_regions)
+            self.face_track_cache.print_stats()
         
         return face_regions
     
+    def _detect_all(self, detect_batch, frames, batch_size, first_index=0):
+        """
+        Run S3FD over every frame, one batch at a time.
+
+        Returns:
+            list: Per frame, a (num_faces, 5) array of boxes and scores, or None on error
+        """
+        detections = []
+        frame_iter = iter(frames)
+        while True:
+            batch_frames = list(itertools.islice(frame_iter, batch_size))
+            if not batch_frames:
+                break
+
+            i = first_index + len(detections)
+            print(f"Detecting faces in frames {i} to {i + len(batch_frames) - 1}")
+            detections.extend(detect_batch(batch_frames))
+            
+            # For low memory mode, clear memory periodically
+            del batch_frames
+            if self.low_memory_mode:
+                import gc
+                gc.collect()
+        return detections
+
+    @staticmethod
+    def _detect_batch(face_detector, batch_frames):
+        """
+        Run S3FD over a batch of frames with one forward pass per frame size.
+
+        Frames of different sizes are bucketed by shape rather than letterboxed,
+        so every frame gets exactly the boxes it would get on its own.
+
+        Returns:
+            list: Per frame, a (num_faces, 5) array of boxes and scores, or None on error
+        """
+        results = [None] * len(batch_frames)
+        buckets = {}
+        for slot, frame in enumerate(batch_frames):
+            buckets.setdefault(frame.shape, []).append(slot)
+
+        for slots in buckets.values():
+            try:
+                batch = np.stack([batch_frames[slot] for slot in slots])
+                for slot, prediction in zip(slots, face_detector.detect_from_batch(batch)):
+                    results[slot] = np.asarray(prediction, dtype=np.float32).reshape(-1, 5)
+            except Exception as e:
+                print(f"Error in batched face detection ({e}), retrying frame by frame")
+                for slot in slots:
+                    try:
+                        prediction = face_detector.detect_from_image(batch_frames[slot])
+                        results[slot] = np.asarray(prediction, dtype=np.float32).reshape(-1, 5)
+                    except Exception as e:
+                        print(f"Error in face detection: {e}")
+        return results
+
+    def _scale_policy(self):
+        from Wav2Lip.face_detection.scaling import DetectionScalePolicy
+        return DetectionScalePolicy(scale=None if self.detection_scale == 'auto' else float(self.detection_scale))
+
+    def _largest_face_fn(self, detect_batch):
+        """
+        Turn a ``_detect_batch``-like function into one returning the largest face (or None) per frame.
+        """
+        def detect(batch_frames):
+            regions = self._largest_faces(detect_batch(batch_frames))
+            return [None if np.isnan(region[0]) else region for region in regions]
+        return detect
+
+    def _face_tracker(self, detect_batch, batch_size):
+        """
+        Tracker that runs S3FD on keyframes only and follows the largest face in between.
+
+        Frames where tracking is unsure go through the detector; frames where
+        no face is found are interpolated from their neighbours.
+        """
+        from Wav2Lip.face_detection.tracking import KeyframeFaceTracker
+        return KeyframeFaceTracker(self._largest_face_fn(detect_batch),
+                                   keyframe_interval=self.detection_keyframe_interval, batch_size=batch_size)
+
+    @staticmethod
+    def _largest_faces(detections):
+        """
+        Largest face of every frame.
+
+        Args:
+            detections (list): Per frame, a (num_faces, 5) array, or None on error
+
+        Returns:
+            numpy.ndarray: (num_frames, 5) regions, NaN rows where there is no face
+        """
+        n = len(detections)
+        regions = np.full((n, 5), np.nan, dtype=np.float32)
+        counts = np.array([len(d) if d is not None else 0 for d in detections], dtype=np.int64)
+        if counts.sum():
+            # Largest box per frame in one pass over all detections
+            boxes = np.concatenate([d for d in detections if d is not None and len(d)])
+            owner = np.repeat(np.arange(n), counts)
+            areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            # Sort by frame, then area (descending), then original position: the first row of
+            # every frame is the first largest face, like a strict '>' scan would pick
+            order = np.lexsort((np.arange(len(boxes)), -areas, owner))
+            first = order[np.r_[True, owner[order][1:] != owner[order][:-1]]]
+            positive = areas[first] > 0
+            regions[owner[first][positive]] = boxes[first][positive]
+        return regions
+
+    @staticmethod
+    def _select_face_regions(detections):
+        """
+        Keep the largest face of every frame and fill frames without a face.
+
+        A frame with no face reuses the region of the previous frame (None
+        before the first face); a failed detection gives None.
+
+        Args:
+            detections (list): Per frame, a (num_faces, 5) array, or None on error
+
+        Returns:
+            list: Per frame, an [x1, y1, x2, y2, score] array or None
+        """
+        n = len(detections)
+        regions = VideoAnalyser._largest_faces(detections)
+        missing = np.array([d is not None and len(d) == 0 for d in detections], dtype=bool)
+
+        # Frames without a face take the value of the last frame that had a result
+        source = np.where(missing, -1, np.arange(n))
+        source = np.maximum.accumulate(source) if n else source
+        filled = np.where(source >= 0, source, 0)
+        regions = regions[filled]
+        has_region = (source >= 0) & ~np.isnan(regions[:, 0])
+
+        return [regions[i] if has_region[i] else None for i in range(n)]
+
     def blend_cartoon_face(self, frame, synced_face, x1, y1, x2, y2):
         """
         Blend the synced face back into the cartoon frame with smooth transitions.
@@ -260,24 +557,25 @@ class VideoAnalyser:
             os.rename(video_path, output_path)
             return output_path
 
-    def save_video(self, output_path, frames, fps, dimensions=None, audio_path=None):
+    def save_video(self, output_path, frames, fps, dimensions=None, audio_path=None, **encoder_settings):
         """
         Save the generated lip-synced frames as a video with audio.
 
+        Frames are piped into a single ffmpeg process that also muxes the
+        audio (falls back to cv2.VideoWriter when ffmpeg is missing).
+
         Args:
             output_path (str): Path to save the video
             frames (list): List of processed frames
             fps (float): Frame rate of the video
             dimensions (tuple): Width and height of the output video
             audio_path (str): Path to the audio file to merge with video
+            **encoder_settings: codec, preset, crf and threads for the ffmpeg writer
         """
         if not frames:
             print("No frames to save!")
             return
             
-        # Create a temporary video file without audio
-        temp_video_path = output_path + "_temp.mp4"
-        
         # Get dimensions from first frame if not provided
         if dimensions is None:
             height, width = frames[0].shape[:2]
@@ -289,43 +587,26 @@ class VideoAnalyser:
                 print(f"Resizing output from {frames[0].shape[1]}x{frames[0].shape[0]} to {width}x{height}")
         
         # Create video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(temp_video_path, fourcc, fps, (width, height))
+        out = open_video_writer(output_path, fps, (width, height), audio_path=audio_path, **encoder_settings)
         
         # Write frames to video
-        for i, frame in enumerate(frames):
-            # Show progress for large videos
-            if i % 100 == 0 and len(frames) > 500:
-                print(f"Writing frame {i}/{len(frames)} to video")
-                
-            # Ensure frame is the right format
-            if frame.dtype != np.uint8:
-                frame = frame.astype(np.uint8)
-            
-            # Ensure frame has the right dimensions
-            if frame.shape[:2] != (height, width):
-                frame = cv2.resize(frame, (width, height))
-                
-            # Ensure frame has 3 channels (RGB)
-            if len(frame.shape) == 2:
-                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-                
-            out.write(frame)
+        try:
+            for i, frame in enumerate(frames):
+                # Show progress for large videos
+                if i % 100 == 0 and len(frames) > 500:
+                    print(f"Writing frame {i}/{len(frames)} to video")
+
+                # Ensure frame has 3 channels (RGB)
+                if len(frame.shape) == 2:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+                out.write(frame)
+        except Exception:
+            out.abort()
+            raise
         
         out.release()
-        print(f"Video saved to {temp_video_path}")
-        
-        # Combine video with audio
-        if audio_path:
-            self.add_audio_to_video(temp_video_path, audio_path, output_path)
-            
-            # Remove temporary file
-            try:
-                os.remove(temp_video_path)
-            except Exception as e:
-                print(f"Could not remove temporary file: {e}")
-        else:
-            os.rename(temp_video_path, output_path)
+        print(f"Video saved to {output_path}")
     
 if __name__ == "__main__":
     video_analyser = VideoAnalyser("videos/video.mp4")
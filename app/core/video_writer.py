@@ -0,0 +1,276 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import cv2
+import numpy as np
+
+# Default encoder settings for the ffmpeg writer
+DEFAULT_ENCODER_SETTINGS = {
+    'codec': 'libx264',
+    'preset': 'medium',
+    'crf': 18,
+    'threads': 0,  # 0 = let ffmpeg decide
+}
+
+
+def find_ffmpeg():
+    """
+    Locate an ffmpeg executable.
+
+    Returns:
+        str: Path to ffmpeg, or None if it is not available
+    """
+    ffmpeg_path = shutil.which('ffmpeg')
+    if ffmpeg_path:
+        return ffmpeg_path
+
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+class JobWorkspace:
+    def __init__(self, base_dir=None, prefix='lipsync_job_'):
+        """
+        Private working directory for a single job.
+
+        Every job gets its own directory, so parallel jobs never share temp
+        files such as ``temp/result.avi``.
+
+        Args:
+            base_dir (str, optional): Parent directory (defaults to the system temp dir)
+            prefix (str): Prefix of the directory name
+        """
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=base_dir)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+
+def _move(src, dst):
+    dst_dir = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(dst_dir, exist_ok=True)
+    shutil.move(src, dst)
+
+
+class FFmpegVideoWriter:
+    def __init__(self, output_path, fps, frame_size, audio_path=None, workspace=None, ffmpeg_path=None,
+                 codec=None, preset=None, crf=None, threads=None):
+        """
+        Stream raw BGR frames into a single ffmpeg process.
+
+        Frames are piped over stdin, encoded and muxed with the audio in the
+        same pass, so there is no intermediate video file to re-read.
+
+        Args:
+            output_path (str): Path of the final video
+            fps (float): Frame rate of the video
+            frame_size (tuple): (width, height) of the frames
+            audio_path (str, optional): Audio to mux into the output
+            workspace (JobWorkspace, optional): Per-job working directory
+            ffmpeg_path (str, optional): ffmpeg executable (auto-detected if None)
+            codec, preset, crf, threads: Encoder settings (see DEFAULT_ENCODER_SETTINGS)
+        """
+        self.output_path = output_path
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.workspace = workspace or JobWorkspace()
+        self._own_workspace = workspace is None
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        if self.ffmpeg_path is None:
+            raise RuntimeError("ffmpeg not found")
+
+        codec = codec or DEFAULT_ENCODER_SETTINGS['codec']
+        preset = preset or DEFAULT_ENCODER_SETTINGS['preset']
+        crf = DEFAULT_ENCODER_SETTINGS['crf'] if crf is None else crf
+        threads = DEFAULT_ENCODER_SETTINGS['threads'] if threads is None else threads
+
+        # Encode into the workspace and move at the end, so a failed job never leaves a partial output
+        self._temp_output = self.workspace.file('output' + (os.path.splitext(output_path)[1] or '.mp4'))
+        self._log_path = self.workspace.file('ffmpeg.log')
+
+        width, height = self.frame_size
+        command = [
+            self.ffmpeg_path, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps),
+            '-i', '-',
+        ]
+        if audio_path:
+            command += ['-i', audio_path]
+        command += ['-map', '0:v:0']
+        if audio_path:
+            command += ['-map', '1:a:0', '-c:a', 'aac', '-shortest']
+        command += [
+            '-c:v', codec, '-preset', str(preset), '-crf', str(crf), '-threads', str(threads),
+            # yuv420p needs even dimensions
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p',
+            self._temp_output,
+        ]
+
+        print(f"Running command: {' '.join(command)}")
+        self._log = open(self._log_path, 'wb')
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=self._log)
+        self.frames_written = 0
+
+    def _ffmpeg_error(self):
+        self._log.flush()
+        with open(self._log_path, 'rb') as f:
+            return f.read().decode('utf-8', errors='ignore').strip()
+
+    def write(self, frame):
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            frame = cv2.resize(frame, self.frame_size)
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).tobytes())
+        except (BrokenPipeError, OSError):
+            self._process.wait()
+            raise RuntimeError(f"ffmpeg exited while encoding: {self._ffmpeg_error()}")
+        self.frames_written += 1
+
+    def release(self):
+        """
+        Finish encoding and move the result to its final location.
+
+        Returns:
+            str: Path to the output video
+        """
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = self._process.wait()
+        self._log.close()
+
+        try:
+            if returncode != 0 or not os.path.exists(self._temp_output):
+                raise RuntimeError(f"ffmpeg failed with code {returncode}: {self._ffmpeg_error()}")
+            _move(self._temp_output, self.output_path)
+        finally:
+            if self._own_workspace:
+                self.workspace.cleanup()
+        return self.output_path
+
+    def abort(self):
+        self._process.kill()
+        self._process.wait()
+        self._log.close()
+        if self._own_workspace:
+            self.workspace.cleanup()
+
+
+class OpenCVVideoWriter:
+    def __init__(self, output_path, fps, frame_size, audio_path=None, workspace=None, ffmpeg_path=None,
+                 fourcc='mp4v', **encoder_settings):
+        """
+        Fallback writer based on cv2.VideoWriter.
+
+        Frames are written to a temporary file in the job workspace; the audio
+        is muxed afterwards with ffmpeg when available, otherwise the video is
+        saved without audio.
+
+        Args:
+            output_path (str): Path of the final video
+            fps (float): Frame rate of the video
+            frame_size (tuple): (width, height) of the frames
+            audio_path (str, optional): Audio to mux into the output
+            workspace (JobWorkspace, optional): Per-job working directory
+            ffmpeg_path (str, optional): ffmpeg executable used for muxing
+            fourcc (str): FourCC code of the intermediate video
+        """
+        self.output_path = output_path
+        self.audio_path = audio_path
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.workspace = workspace or JobWorkspace()
+        self._own_workspace = workspace is None
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+
+        self._temp_video = self.workspace.file('video' + (os.path.splitext(output_path)[1] or '.mp4'))
+        self._writer = cv2.VideoWriter(self._temp_video, cv2.VideoWriter_fourcc(*fourcc), fps, self.frame_size)
+        self.frames_written = 0
+
+    def write(self, frame):
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            frame = cv2.resize(frame, self.frame_size)
+        self._writer.write(frame)
+        self.frames_written += 1
+
+    def release(self):
+        """
+        Finish writing, mux the audio if possible and move the result to its final location.
+
+        Returns:
+            str: Path to the output video
+        """
+        self._writer.release()
+        try:
+            if self.audio_path and self.ffmpeg_path:
+                muxed = self.workspace.file('muxed' + os.path.splitext(self._temp_video)[1])
+                command = [self.ffmpeg_path, '-y', '-loglevel', 'error', '-i', self._temp_video,
+                           '-i', self.audio_path, '-c:v', 'copy', '-c:a', 'aac', '-shortest', muxed]
+                print(f"Running command: {' '.join(command)}")
+                if subprocess.call(command) == 0 and os.path.exists(muxed) and os.path.getsize(muxed) > 0:
+                    _move(muxed, self.output_path)
+                    return self.output_path
+                print("Failed to add audio, using video without audio")
+            elif self.audio_path:
+                print("ffmpeg not found in PATH, video will be without audio")
+
+            _move(self._temp_video, self.output_path)
+            return self.output_path
+        finally:
+            if self._own_workspace:
+                self.workspace.cleanup()
+
+    def abort(self):
+        self._writer.release()
+        if self._own_workspace:
+            self.workspace.cleanup()
+
+
+def open_video_writer(output_path, fps, frame_size, audio_path=None, workspace=None, use_ffmpeg=True,
+                      **encoder_settings):
+    """
+    Open the best available video writer.
+
+    Uses an ffmpeg pipe (single encode, audio muxed in the same pass) when
+    ffmpeg is available, and falls back to cv2.VideoWriter otherwise.
+
+    Args:
+        output_path (str): Path of the final video
+        fps (float): Frame rate of the video
+        frame_size (tuple): (width, height) of the frames
+        audio_path (str, optional): Audio to mux into the output
+        workspace (JobWorkspace, optional): Per-job working directory
+        use_ffmpeg (bool): Set to False to force the cv2.VideoWriter fallback
+        **encoder_settings: codec, preset, crf and threads for the ffmpeg writer
+
+    Returns:
+        FFmpegVideoWriter or OpenCVVideoWriter
+    """
+    ffmpeg_path = find_ffmpeg() if use_ffmpeg else None
+    if ffmpeg_path:
+        try:
+            return FFmpegVideoWriter(output_path, fps, frame_size, audio_path=audio_path, workspace=workspace,
+                                     ffmpeg_path=ffmpeg_path, **encoder_settings)
+        except OSError as e:
+            print(f"Could not start ffmpeg ({e}), falling back to cv2.VideoWriter")
+    return OpenCVVideoWriter(output_path, fps, frame_size, audio_path=audio_path, workspace=workspace,
+                             ffmpeg_path=ffmpeg_path)
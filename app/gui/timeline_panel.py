@@ -8,7 +8,8 @@ from mutagen.wave import WAVE
 from mutagen.oggvorbis import OggVorbis
 from app.core.project_manager import Project
 from app.gui.preview_panel import Video
-import subprocess
+from app.core.inference_worker import WorkerClient
+from app.core.shot_detection import shot_index_path
 import os
 from pathlib import Path
 from utils.main import get_video_duration
@@ -36,39 +37,16 @@ class TimeLineTrack(QWidget):
 
 
     def sync_audio_with_video(self, output_path):
-        """ Sincroniza áudio e vídeo utilizando um script externo de lipsync. """
+        """ Sincroniza áudio e vídeo utilizando o worker de lipsync (modelos já carregados). """
         video_path = self.video.path
         audio_path = self.audio_path
         print(f"Sincronizando {audio_path} com {video_path}...")
 
-        ROOT_DIR = Path(__file__).resolve().parent.parent.parent  # Voltar 3 níveis (de app.gui.timeline_panel para a raiz)
-
-        inference_script = ROOT_DIR / "Wav2Lip" / "inference.py"
-        model_path = ROOT_DIR / "app" / "core" / "wav2lip_gan.pth"
-
-        if not inference_script.exists():
-            print(f"Erro: Script de inferência não encontrado em {inference_script}")
-            exit(1)
-
-        if not model_path.exists():
-            print(f"Erro: Modelo não encontrado em {model_path}")
-            exit(1)
-        
-        command = [
-            sys.executable, str(inference_script),
-            "--checkpoint_path", str(model_path),
-            "--face", video_path,
-            "--audio", audio_path,
-            "--outfile", str(output_path)
-        ]
-
         try:
-            subprocess.run(command, check=True)
-            print(f"Lip sync concluído! Arquivo salvo em: {output_path}")
-        except subprocess.CalledProcessError as e:
+            result = WorkerClient().submit(video_path, audio_path, output_path)
+            print(f"Lip sync concluído em {result['seconds']:.1f}s! Arquivo salvo em: {result['output_path']}")
+        except Exception as e:
             print(f"Erro ao sincronizar lipsync: {e}")
-        except FileNotFoundError:
-            print("Erro: Certifique-se de que o Python está no PATH e os arquivos existem.")
 
 
     def paintEvent(self, event):
@@ -135,29 +113,14 @@ class TimelinePanel(QWidget):
         self.audios.append(audio_path)
 
     def sync_multiple_audios_with_video(self):
-        """ Sincroniza áudio e vídeo utilizando um script externo de lipsync. """
-        print(f"Sincronizando audios com {video_path}...")
-
+        """ Sincroniza todos os áudios com o vídeo, decodificando e detectando rostos uma única vez. """
         if not self.video:
             print("Erro: Nenhum vídeo selecionado.")
             return
 
         print(f"Sincronizando todos os áudios com {self.video.path}...")
 
-        ROOT_DIR = Path(__file__).resolve().parent.parent.parent  # Voltar 3 níveis (de app.gui.timeline_panel para a raiz)
-
-        inference_script = ROOT_DIR / "Wav2Lip" / "inference.py"
-        model_path = ROOT_DIR / "app" / "core" / "wav2lip.pth"
-
-        if not inference_script.exists():
-            print(f"Erro: Script de inferência não encontrado em {inference_script}")
-            exit(1)
-
-        if not model_path.exists():
-            print(f"Erro: Modelo não encontrado em {model_path}")
-            exit(1)
-
-        selected_dir = QFileDialog.getExistingDirectory(self, "Selecionar Diretório de Saída", str(output_dir))
+        selected_dir = QFileDialog.getExistingDirectory(self, "Selecionar Diretório de Saída", "")
         
         if not selected_dir:
             print("Erro: Nenhum diretório de saída selecionado.")
@@ -168,23 +131,21 @@ class TimelinePanel(QWidget):
             os.makedirs(selected_dir)
             print(f"O diretório {selected_dir} foi criado.")
 
-        for i, audio_path in enumerate(self.audios):
-            output_audio_path = Path(selected_dir) / f"synced_audio_{i+1}.mp4"
-            command = [
-                sys.executable, str(inference_script),
-                "--checkpoint_path", str(model_path),
-                "--face", self.video.path,
-                "--audio", audio_path,
-                "--outfile", str(output_audio_path)
-            ]
+        output_paths = [Path(selected_dir) / f"synced_audio_{i+1}.mp4" for i in range(len(self.audios))]
 
-            try:
-                subprocess.run(command, check=True)
+        try:
+            # Um único job: o vídeo é decodificado e os rostos detectados uma vez para todos os áudios
+            # O índice de cortes (shots) fica salvo ao lado do arquivo do projeto
+            project = getattr(self, 'project', None)
+            shot_index = shot_index_path(self.video.path, project.project_file_path) if project else None
+            # Mesmo checkpoint que a versão anterior (inference.py com app/core/wav2lip.pth)
+            model_path = Path(__file__).resolve().parent.parent / "core" / "wav2lip.pth"
+            result = WorkerClient().submit_multi(self.video.path, self.audios, output_paths,
+                                                 shot_index_path=shot_index, model_path=str(model_path))
+            for audio_path, output_audio_path in zip(self.audios, result['output_path']):
                 print(f"Lip sync concluído para {audio_path}! Arquivo salvo em: {output_audio_path}")
-            except subprocess.CalledProcessError as e:
-                print(f"Erro ao sincronizar com audio {audio_path}, erro: {e}")
-            except FileNotFoundError:
-                print("Erro: Certifique-se de que o Python está no PATH e os arquivos existem.")
+        except Exception as e:
+            print(f"Erro ao sincronizar os áudios, erro: {e}")
         
         print("Sincronização concluída para todos os áudios.")
         
@@ -248,7 +209,7 @@ def load_style(sheet_file):
     
 if __name__ == "__main__":
     import sys
-    import os
+    import subprocess
     from PyQt5.QtWidgets import QApplication, QFileDialog
     from PyQt5.QtCore import QFileInfo
     
@@ -0,0 +1,87 @@
+"""Wav2Lip on the eager, TorchScript and ONNX Runtime backends, on CPU.
+
+Exports the checkpoint to each backend (or reuses the artifacts cached next
+to it), checks the outputs against eager PyTorch (max absolute difference of
+the generated faces) at every batch size, which also checks that the dynamic
+batch axis works, and times the three backends against the plain eval-mode
+model ('eager' is the optimize_for_inference version the engine runs).
+Without --checkpoint a model with random weights is saved to a temporary
+directory and exported from there.
+
+Usage:
+    python benchmarks/backend_benchmark.py
+    python benchmarks/backend_benchmark.py --checkpoint app/core/wav2lip_gan.pth --batch_sizes 1 16 64 128
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import tempfile
+import time
+import torch
+
+from Wav2Lip.models.backends import BACKENDS, load_exported
+from Wav2Lip.models.fusion import optimize_for_inference
+from Wav2Lip.models.registry import load_wav2lip
+from Wav2Lip.models.wav2lip import Wav2Lip
+
+EXPORTED = [backend for backend in BACKENDS if backend != 'int8']  # int8: see Wav2Lip/quantize.py
+
+parser = argparse.ArgumentParser(description='Wav2Lip backend parity and throughput benchmark')
+parser.add_argument('--checkpoint', default=None, help='Wav2Lip checkpoint (default: random weights)')
+parser.add_argument('--backends', nargs='+', default=EXPORTED, choices=EXPORTED)
+parser.add_argument('--batch_sizes', nargs='+', type=int, default=[1, 16, 64])
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--threads', type=int, default=None)
+parser.add_argument('--atol', type=float, default=1e-3)
+args = parser.parse_args()
+
+
+def timed(model, inputs):
+    model(*inputs)  # warm-up (oneDNN primitives, ONNX Runtime allocations)
+    best = float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        model(*inputs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.set_grad_enabled(False)
+    torch.manual_seed(0)
+    print(f"CPU, {torch.get_num_threads()} threads")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = args.checkpoint
+        if checkpoint is None:
+            checkpoint = os.path.join(tmp, 'wav2lip_random.pth')
+            torch.save({'state_dict': Wav2Lip().state_dict()}, checkpoint)
+        eager = load_wav2lip(checkpoint, torch.device('cpu'))
+
+        models = {}
+        for backend in args.backends:
+            start = time.perf_counter()
+            if backend == 'eager':
+                models[backend] = optimize_for_inference(eager)
+            else:
+                models[backend] = load_exported(checkpoint, torch.device('cpu'), backend)
+            print(f"{backend}: ready in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'batch':>6} {'backend':>12} {'ms':>9} {'frames/s':>9} {'vs eval':>9} {'max |diff|':>11}")
+        for batch_size in args.batch_sizes:
+            inputs = (torch.randn(batch_size, 1, 80, 16), torch.rand(batch_size, 6, 96, 96))
+            reference = eager(*inputs)
+            baseline = timed(eager, inputs)
+            for backend, model in models.items():
+                diff = (model(*inputs) - reference).abs().max().item()
+                if diff > args.atol:
+                    print(f"WARNING: {backend} differs by {diff:.2e} at batch size {batch_size} (atol {args.atol})")
+                seconds = timed(model, inputs)
+                print(f"{batch_size:>6} {backend:>12} {seconds * 1000:>9.1f} {batch_size / seconds:>9.1f} "
+                      f"{baseline / seconds:>8.2f}x {diff:>11.2e}")
+
+
+if __name__ == '__main__':
+    main()
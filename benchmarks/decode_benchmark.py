@@ -0,0 +1,93 @@
+"""Compare cv2.VideoCapture + cv2.resize against the ffmpeg rawvideo decoder.
+
+Usage:
+    python benchmarks/decode_benchmark.py                 # synthetic 720p and 1080p clips
+    python benchmarks/decode_benchmark.py --video a.mp4   # your own clip(s)
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import subprocess
+import tempfile
+import time
+import cv2
+
+from app.core.frame_decoder import FFmpegFrameDecoder, probe_video
+from app.core.video_writer import find_ffmpeg
+
+parser = argparse.ArgumentParser(description='Decoder benchmark: cv2.VideoCapture vs ffmpeg pipe')
+parser.add_argument('--video', nargs='*', default=None, help='Input videos (default: generated 720p/1080p clips)')
+parser.add_argument('--seconds', type=int, default=10, help='Length of the generated clips')
+parser.add_argument('--max_resolution', type=int, default=320, help='Processing height (as in VideoAnalyser)')
+parser.add_argument('--frame_skip', nargs='+', type=int, default=[1, 2])
+args = parser.parse_args()
+
+
+def make_clip(ffmpeg_path, workdir, width, height, seconds):
+    path = os.path.join(workdir, '{}p.mp4'.format(height))
+    subprocess.check_call([ffmpeg_path, '-y', '-loglevel', 'error', '-f', 'lavfi',
+                           '-i', 'testsrc2=size={}x{}:rate=25'.format(width, height), '-t', str(seconds),
+                           '-c:v', 'libx264', '-pix_fmt', 'yuv420p', path])
+    return path
+
+
+def opencv_decode(path, size, frame_skip):
+    video = cv2.VideoCapture(path)
+    count, n, shape = 0, 0, None
+    while True:
+        ret, frame = video.read()
+        if not ret:
+            break
+        if n % frame_skip == 0:
+            if size:
+                frame = cv2.resize(frame, size)
+            shape = frame.shape
+            count += 1
+        n += 1
+    video.release()
+    return count, shape
+
+
+def ffmpeg_decode(path, size, frame_skip):
+    count, shape = 0, None
+    for frame in FFmpegFrameDecoder(path, size=size, frame_step=frame_skip):
+        shape = frame.shape
+        count += 1
+    return count, shape
+
+
+def timed(fn, *fn_args):
+    start = time.perf_counter()
+    result = fn(*fn_args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    ffmpeg_path = find_ffmpeg()
+    if ffmpeg_path is None:
+        raise RuntimeError('ffmpeg is required for this benchmark')
+
+    with tempfile.TemporaryDirectory() as workdir:
+        videos = args.video or [make_clip(ffmpeg_path, workdir, 1280, 720, args.seconds),
+                                make_clip(ffmpeg_path, workdir, 1920, 1080, args.seconds)]
+
+        print('{:<28} {:>5} {:>16} {:>16} {:>8}'.format('video', 'skip', 'opencv fps', 'ffmpeg fps', 'speedup'))
+        for path in videos:
+            _, (w, h), _ = probe_video(path)
+            size = (int(w * args.max_resolution / h), args.max_resolution) if h > args.max_resolution else None
+
+            for frame_skip in args.frame_skip:
+                (cv_count, cv_shape), cv_time = timed(opencv_decode, path, size, frame_skip)
+                (ff_count, ff_shape), ff_time = timed(ffmpeg_decode, path, size, frame_skip)
+
+                if cv_shape != ff_shape or cv_count != ff_count:
+                    print('  WARNING: output mismatch opencv {} x {} vs ffmpeg {} x {}'.format(
+                        cv_count, cv_shape, ff_count, ff_shape))
+
+                print('{:<28} {:>5} {:>16.1f} {:>16.1f} {:>7.2f}x'.format(
+                    '{} ({}x{})'.format(os.path.basename(path), w, h), frame_skip,
+                    cv_count / cv_time, ff_count / ff_time, cv_time / ff_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""CPU face detection throughput vs number of DetectionPool workers.
+
+Streams the same frames through DetectionPool.imap with 1, 2, 4 and 8
+workers (threads per worker = cores / workers, unless --threads is given),
+and through a single in-process detector using every core, as the baseline.
+Also checks that the pool returns the same boxes as the in-process detector.
+
+Usage:
+    python benchmarks/detection_pool_benchmark.py --video talking_head.mp4
+    python benchmarks/detection_pool_benchmark.py --frames 256 --workers 1 2 4 8 16 --threads 2
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import itertools
+import time
+import numpy as np
+import torch
+
+from Wav2Lip.face_detection.detection.pool import DetectionPool
+from Wav2Lip.face_detection.detection.registry import create_detector
+
+parser = argparse.ArgumentParser(description='DetectionPool scaling benchmark')
+parser.add_argument('--video', default=None, help='Input video (default: random frames)')
+parser.add_argument('--frames', type=int, default=128, help='Number of frames to detect on')
+parser.add_argument('--max_resolution', type=int, default=320, help='Processing height (as in LipSyncEngine)')
+parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4, 8])
+parser.add_argument('--threads', type=int, default=None, help='Threads per worker (default: cores / workers)')
+parser.add_argument('--chunk_size', type=int, default=4, help='Frames per worker task')
+parser.add_argument('--batch', type=int, default=16, help='Batch size of the in-process baseline')
+parser.add_argument('--face_detector', default='sfd')
+args = parser.parse_args()
+
+
+def load_frames():
+    if args.video:
+        from app.core.video_analyzer import VideoAnalyser
+        analyser = VideoAnalyser(device=torch.device('cpu'), face_track_cache=False)
+        frames = itertools.islice(analyser.iter_frames(args.video, max_resolution=args.max_resolution), args.frames)
+        return [np.ascontiguousarray(frame[..., ::-1]) for frame in frames]
+    rng = np.random.RandomState(0)
+    width = int(args.max_resolution * 16 / 9)
+    return [rng.randint(0, 256, size=(args.max_resolution, width, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+
+def same_boxes(a, b):
+    return len(a) == len(b) and (len(a) == 0 or np.allclose(a[:, :4], b[:, :4], atol=1.0))
+
+
+def main():
+    frames = load_frames()
+    cores = os.cpu_count() or 1
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, {cores} cores")
+
+    detector = create_detector(args.face_detector, torch.device('cpu'))
+    detector.detect_from_batch(np.stack(frames[:1]))  # warm-up
+    start = time.perf_counter()
+    reference = []
+    for i in range(0, len(frames), args.batch):
+        reference.extend(detector.detect_from_batch(np.stack(frames[i:i + args.batch])))
+    baseline = len(frames) / (time.perf_counter() - start)
+    del detector
+
+    print(f"{'workers':>8} {'threads':>8} {'startup s':>10} {'frames/s':>9} {'speed-up':>9} {'same boxes':>11}")
+    print(f"{'in-proc':>8} {torch.get_num_threads():>8} {'':>10} {baseline:>9.1f} {1.0:>8.2f}x {'':>11}")
+    for workers in args.workers:
+        with DetectionPool(num_workers=workers, face_detector=args.face_detector, threads_per_worker=args.threads,
+                           chunk_size=args.chunk_size) as pool:
+            list(pool.imap(frames[:workers * args.chunk_size]))  # warm-up
+            start = time.perf_counter()
+            detections = list(pool.imap(frames))
+            fps = len(frames) / (time.perf_counter() - start)
+            agree = np.mean([same_boxes(a, b) for a, b in zip(detections, reference)])
+            print(f"{workers:>8} {pool.threads_per_worker:>8} {pool.load_seconds:>10.1f} {fps:>9.1f} "
+                  f"{fps / baseline:>8.2f}x {agree:>11.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""VideoAnalyser.detect_faces throughput: per-frame S3FD loop vs batched detection.
+
+Usage:
+    python benchmarks/face_detection_benchmark.py --video talking_head.mp4
+    python benchmarks/face_detection_benchmark.py --frames 64 --batch_sizes 1 8 16 32
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import itertools
+import time
+import numpy as np
+import torch
+
+from app.core.video_analyzer import VideoAnalyser
+
+parser = argparse.ArgumentParser(description='Face detection benchmark: per-frame loop vs detect_from_batch')
+parser.add_argument('--video', default=None, help='Input video (default: random frames)')
+parser.add_argument('--frames', type=int, default=64, help='Number of frames to detect on')
+parser.add_argument('--max_resolution', type=int, default=320, help='Processing height (as in LipSyncEngine)')
+parser.add_argument('--batch_sizes', nargs='+', type=int, default=[1, 8, 16, 32])
+parser.add_argument('--device', default='cpu')
+args = parser.parse_args()
+
+
+def load_frames(analyser):
+    if args.video:
+        return list(itertools.islice(analyser.iter_frames(args.video, max_resolution=args.max_resolution),
+                                     args.frames))
+    rng = np.random.RandomState(0)
+    width = int(args.max_resolution * 16 / 9)
+    return [rng.randint(0, 256, size=(args.max_resolution, width, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+
+def per_frame_loop(face_detector, frames):
+    # Previous detect_faces: one detect_from_image call per frame, largest box kept in Python
+    regions = []
+    for frame in frames:
+        prediction = face_detector.detect_from_image(frame)
+        if len(prediction) == 0:
+            regions.append(regions[-1] if regions else None)
+            continue
+        max_area, max_pred = 0, None
+        for pred in prediction:
+            area = (pred[2] - pred[0]) * (pred[3] - pred[1])
+            if area > max_area:
+                max_area, max_pred = area, pred
+        regions.append(max_pred)
+    return regions
+
+
+def same_regions(a, b, tolerance=1.0):
+    for ra, rb in zip(a, b):
+        if (ra is None) != (rb is None):
+            return False
+        if ra is not None and np.abs(np.asarray(ra[:4]) - np.asarray(rb[:4])).max() > tolerance:
+            return False
+    return len(a) == len(b)
+
+
+def main():
+    analyser = VideoAnalyser(torch.device(args.device), face_track_cache=False)
+    frames = load_frames(analyser)
+    face_detector = analyser.get_detector().face_detector
+    print('{} frames of {}x{} on {} ({} threads)'.format(len(frames), frames[0].shape[1], frames[0].shape[0],
+                                                       args.device, torch.get_num_threads()))
+
+    # Warm-up
+    face_detector.detect_from_image(frames[0])
+
+    start = time.perf_counter()
+    reference = per_frame_loop(face_detector, frames)
+    loop_time = time.perf_counter() - start
+    print('{:<24} {:>10.1f} frames/s'.format('per-frame loop', len(frames) / loop_time))
+
+    for batch_size in args.batch_sizes:
+        analyser.detection_batch_size = batch_size
+        start = time.perf_counter()
+        regions = analyser.detect_faces(frames, cartoon_mode=False)
+        elapsed = time.perf_counter() - start
+        print('{:<24} {:>10.1f} frames/s  {:>5.2f}x  boxes match: {}'.format(
+            'batched (batch {})'.format(batch_size), len(frames) / elapsed, loop_time / elapsed,
+            'yes' if same_regions(reference, regions) else 'NO'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Speed and box agreement of the face detector backends (see face_detection.available_detectors).
+
+Runs every backend on the same frames of a video and reports ms/frame, the
+fraction of frames with a face, and how well the largest face of each frame
+agrees with the one S3FD ('sfd') finds: mean IoU, and recall at IoU 0.5.
+For the cascade backends it also prints the median (x1, y1, x2, y2) offset,
+as fractions of the box size, that brings the cascade box onto the S3FD box
+(the CascadeDetector ``box_adjust`` option).
+
+Usage:
+    python benchmarks/face_detector_benchmark.py --video clip.mp4
+    python benchmarks/face_detector_benchmark.py --video clip.mp4 --detectors sfd cascade cascade+sfd --frames 300
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import time
+import cv2
+import numpy as np
+import torch
+
+from Wav2Lip import face_detection
+
+parser = argparse.ArgumentParser(description='Face detector backend benchmark')
+parser.add_argument('--video', required=True)
+parser.add_argument('--detectors', nargs='+', default=face_detection.available_detectors(),
+                    help='Backends to compare (sfd is always run, as the reference)')
+parser.add_argument('--frames', type=int, default=200, help='Frames read from the video')
+parser.add_argument('--step', type=int, default=5, help='Keep every N-th frame')
+parser.add_argument('--max_size', type=int, default=1280, help='Longest side frames are downscaled to')
+parser.add_argument('--batch', type=int, default=16)
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+args = parser.parse_args()
+
+
+def read_frames():
+    capture = cv2.VideoCapture(args.video)
+    frames = []
+    index = 0
+    while len(frames) < args.frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        if index % args.step == 0:
+            scale = min(1.0, args.max_size / float(max(frame.shape[:2])))
+            if scale < 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            frames.append(frame[..., ::-1])  # the detectors take RGB, as FaceAlignment feeds them
+        index += 1
+    capture.release()
+    if not frames:
+        raise ValueError(f"Could not read frames from {args.video}")
+    return np.ascontiguousarray(np.stack(frames))
+
+
+def largest_faces(detector, frames):
+    """Largest face (x1, y1, x2, y2) of every frame, or None, and the seconds spent detecting."""
+    detector.detect_from_batch(frames[:1])  # warm-up
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    detections = []
+    for i in range(0, len(frames), args.batch):
+        detections.extend(detector.detect_from_batch(frames[i:i + args.batch]))
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    seconds = time.perf_counter() - start
+
+    faces = []
+    for boxes in detections:
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+        if len(boxes) == 0:
+            faces.append(None)
+            continue
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        faces.append(boxes[np.argmax(areas), :4])
+    return faces, seconds
+
+
+def iou(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def box_offset(box, reference):
+    """(x1, y1, x2, y2) offset from ``box`` to ``reference``, as fractions of the box size."""
+    w, h = box[2] - box[0], box[3] - box[1]
+    return (np.asarray(reference) - np.asarray(box)) / np.array([w, h, w, h], dtype=np.float32)
+
+
+def main():
+    frames = read_frames()
+    device = torch.device(args.device)
+    names = ['sfd'] + [name for name in args.detectors if name != 'sfd']
+    print(f"{len(frames)} frames of {frames.shape[2]}x{frames.shape[1]} ({args.device}, batch {args.batch})")
+
+    reference = None
+    print(f"{'detector':<18} {'ms/frame':>9} {'faces':>7} {'mean IoU':>9} {'recall@0.5':>11}")
+    for name in names:
+        detector = face_detection.create_detector(name, device)
+        faces, seconds = largest_faces(detector, frames)
+        if reference is None:
+            reference = faces
+
+        found = sum(face is not None for face in faces)
+        pairs = [(face, ref) for face, ref in zip(faces, reference) if ref is not None]
+        ious = [iou(face, ref) if face is not None else 0.0 for face, ref in pairs]
+        mean_iou = np.mean(ious) if ious else float('nan')
+        recall = np.mean([value >= 0.5 for value in ious]) if ious else float('nan')
+        print(f"{name:<18} {seconds / len(frames) * 1000:>9.2f} {found / len(frames):>7.1%} "
+              f"{mean_iou:>9.3f} {recall:>11.3f}")
+
+        if hasattr(detector, 'stats'):
+            stats = detector.stats()
+            print(f"{'':<18} {stats['verified_fraction']:.1%} of the frames verified by the accurate detector")
+        if name == 'cascade':
+            offsets = [box_offset(face, ref) for face, ref in pairs if face is not None and iou(face, ref) > 0.2]
+            if offsets:
+                adjust = ', '.join(f"{value:.3f}" for value in np.median(offsets, axis=0))
+                print(f"{'':<18} box_adjust matching sfd: ({adjust})")
+        del detector
+
+
+if __name__ == '__main__':
+    main()
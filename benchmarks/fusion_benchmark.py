@@ -0,0 +1,107 @@
+"""Wav2Lip and S3FD before and after optimize_for_inference (BatchNorm folding + channels_last), on CPU.
+
+Checks that the optimized model matches the eval-mode model (max absolute
+difference of every output) and times both at each batch size. Without
+--checkpoint / --s3fd_checkpoint the weights (and BatchNorm statistics) are
+random, which exercises the folding just as well.
+
+Usage:
+    python benchmarks/fusion_benchmark.py
+    python benchmarks/fusion_benchmark.py --checkpoint app/core/wav2lip_gan.pth --batch_sizes 1 32 128
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import time
+import torch
+
+from Wav2Lip.models.fusion import optimize_for_inference
+from Wav2Lip.models.registry import load_wav2lip
+from Wav2Lip.models.wav2lip import Wav2Lip
+from Wav2Lip.face_detection.detection.sfd.net_s3fd import s3fd
+from Wav2Lip.face_detection.detection.sfd.sfd_detector import load_s3fd
+
+parser = argparse.ArgumentParser(description='BatchNorm folding / channels_last benchmark')
+parser.add_argument('--checkpoint', default=None, help='Wav2Lip checkpoint (default: random weights)')
+parser.add_argument('--s3fd_checkpoint', default=None, help='S3FD weights (default: random weights)')
+parser.add_argument('--batch_sizes', nargs='+', type=int, default=[1, 32, 128])
+parser.add_argument('--s3fd_size', type=int, default=160, help='Side of the S3FD input frames')
+parser.add_argument('--s3fd_max_batch', type=int, default=32, help='Largest S3FD batch (memory)')
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--threads', type=int, default=None)
+parser.add_argument('--atol', type=float, default=1e-3)
+args = parser.parse_args()
+
+
+def randomize_batchnorm(model):
+    # Freshly built models have identity BatchNorm statistics, which would make the check trivial
+    generator = torch.Generator().manual_seed(0)
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            n = module.num_features
+            module.running_mean.copy_(torch.randn(n, generator=generator) * 0.1)
+            module.running_var.copy_(torch.rand(n, generator=generator) + 0.5)
+            module.weight.data.copy_(torch.rand(n, generator=generator) + 0.5)
+            module.bias.data.copy_(torch.randn(n, generator=generator) * 0.1)
+    return model
+
+
+def outputs(model, inputs):
+    result = model(*inputs)
+    return [t for t in (result if isinstance(result, (list, tuple)) else [result]) if t is not None]
+
+
+def timed(model, inputs):
+    outputs(model, inputs)  # warm-up (oneDNN primitive creation)
+    best = float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        outputs(model, inputs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(name, model, make_inputs, batch_sizes):
+    optimized = optimize_for_inference(model)
+    print(f"{name}: {optimized.fused_blocks} blocks fused")
+    print(f"{'batch':>6} {'eval ms':>10} {'fused ms':>10} {'speed-up':>9} {'max |diff|':>11}")
+    for batch_size in batch_sizes:
+        inputs = make_inputs(batch_size)
+        reference, result = outputs(model, inputs), outputs(optimized, inputs)
+        diff = max((a - b).abs().max().item() for a, b in zip(reference, result))
+        if diff > args.atol:
+            print(f"WARNING: {name} differs by {diff:.2e} at batch size {batch_size} (atol {args.atol})")
+        eval_time, fused_time = timed(model, inputs), timed(optimized, inputs)
+        print(f"{batch_size:>6} {eval_time * 1000:>10.1f} {fused_time * 1000:>10.1f} "
+              f"{eval_time / fused_time:>8.2f}x {diff:>11.2e}")
+
+
+def main():
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.set_grad_enabled(False)
+    torch.manual_seed(0)
+    print(f"CPU, {torch.get_num_threads()} threads")
+
+    if args.checkpoint:
+        wav2lip = load_wav2lip(args.checkpoint, torch.device('cpu'))
+    else:
+        wav2lip = randomize_batchnorm(Wav2Lip()).eval()
+    compare('Wav2Lip', wav2lip,
+            lambda b: (torch.randn(b, 1, 80, 16), torch.rand(b, 6, 96, 96)), args.batch_sizes)
+
+    if args.s3fd_checkpoint:
+        net = load_s3fd(args.s3fd_checkpoint, torch.device('cpu'))
+    else:
+        net = s3fd().eval()
+        for module in net.modules():
+            if type(module).__name__ == 'L2Norm':
+                # Its weight starts uninitialised until a checkpoint is loaded
+                module.weight.data.fill_(module.scale)
+    size = args.s3fd_size
+    compare('S3FD', net, lambda b: (torch.rand(b, 3, size, size) * 255 - 117,),
+            [b for b in args.batch_sizes if b <= args.s3fd_max_batch])
+
+
+if __name__ == '__main__':
+    main()
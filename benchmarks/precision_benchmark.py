@@ -0,0 +1,116 @@
+"""fp32 vs bf16 inference on CPU: speed and quality of Wav2Lip and S3FD.
+
+Wav2Lip: the optimized (BatchNorm-folded, channels_last) generator with
+fp32 and bf16 weights, timed at each batch size; quality is the PSNR and max
+absolute difference of the bf16 faces against the fp32 ones. Without
+--checkpoint the weights are random.
+
+S3FD: the 'sfd' detector with fp32 and bf16 weights, per-frame latency, and
+how well the bf16 boxes agree with the fp32 ones (recall / precision at IoU
+0.5, both cut at the 0.5 score threshold). Without --video the frames are
+random: latency only.
+
+bf16 only pays off on CPUs with native bfloat16 (AVX512-BF16, AMX); elsewhere
+oneDNN emulates it and it is slower than fp32.
+
+Usage:
+    python benchmarks/precision_benchmark.py
+    python benchmarks/precision_benchmark.py --checkpoint app/core/wav2lip_gan.pth --video talking_head.mp4
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import itertools
+import time
+import numpy as np
+import torch
+
+from Wav2Lip.face_detection.detection.registry import create_detector
+from Wav2Lip.face_detection.detection.sfd.quantized import box_agreement
+from Wav2Lip.models.fusion import optimize_for_inference
+from Wav2Lip.models.registry import load_wav2lip
+from Wav2Lip.models.wav2lip import Wav2Lip
+
+parser = argparse.ArgumentParser(description='fp32 vs bf16 benchmark')
+parser.add_argument('--checkpoint', default=None, help='Wav2Lip checkpoint (default: random weights)')
+parser.add_argument('--video', default=None, help='Video for the S3FD comparison (default: random frames)')
+parser.add_argument('--batch_sizes', nargs='+', type=int, default=[1, 16, 64])
+parser.add_argument('--frames', type=int, default=32, help='Frames for the S3FD comparison')
+parser.add_argument('--max_resolution', type=int, default=320, help='Processing height of the S3FD frames')
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--threads', type=int, default=None)
+args = parser.parse_args()
+
+
+def timed(fn):
+    fn()  # warm-up (oneDNN primitive creation)
+    best = float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare_wav2lip():
+    cpu = torch.device('cpu')
+    model = load_wav2lip(args.checkpoint, cpu) if args.checkpoint else Wav2Lip().eval()
+    models = {'fp32': optimize_for_inference(model), 'bf16': optimize_for_inference(model).to(torch.bfloat16)}
+
+    print('Wav2Lip')
+    print(f"{'batch':>6} {'fp32 ms':>8} {'bf16 ms':>8} {'speed-up':>9} {'PSNR dB':>8} {'max |diff|':>11}")
+    for batch_size in args.batch_sizes:
+        mel, faces = torch.randn(batch_size, 1, 80, 16), torch.rand(batch_size, 6, 96, 96)
+        inputs = {'fp32': (mel, faces), 'bf16': (mel.bfloat16(), faces.bfloat16())}
+        outputs = {name: models[name](*inputs[name]).float() for name in models}
+        seconds = {name: timed(lambda: models[name](*inputs[name])) for name in models}
+        mse = ((outputs['fp32'] - outputs['bf16']) ** 2).mean().item()
+        psnr = float('inf') if mse == 0 else 10 * np.log10(1. / mse)
+        diff = (outputs['fp32'] - outputs['bf16']).abs().max().item()
+        print(f"{batch_size:>6} {seconds['fp32'] * 1000:>8.1f} {seconds['bf16'] * 1000:>8.1f} "
+              f"{seconds['fp32'] / seconds['bf16']:>8.2f}x {psnr:>8.1f} {diff:>11.2e}")
+
+
+def load_frames():
+    if args.video:
+        from app.core.video_analyzer import VideoAnalyser
+        analyser = VideoAnalyser(device=torch.device('cpu'), face_track_cache=False)
+        frames = itertools.islice(analyser.iter_frames(args.video, max_resolution=args.max_resolution), args.frames)
+        return [np.ascontiguousarray(frame[..., ::-1]) for frame in frames]
+    rng = np.random.RandomState(0)
+    width = int(args.max_resolution * 16 / 9)
+    return [rng.randint(0, 256, size=(args.max_resolution, width, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+
+def compare_s3fd():
+    frames = load_frames()
+    detections, seconds = {}, {}
+    for precision in ('fp32', 'bf16'):
+        detector = create_detector('sfd', torch.device('cpu'), precision=precision)
+        detector.detect_from_batch(frames[0][None])  # warm-up
+        start = time.perf_counter()
+        detections[precision] = [detector.detect_from_batch(frame[None])[0] for frame in frames]
+        seconds[precision] = (time.perf_counter() - start) / len(frames)
+
+    print(f"\nS3FD, {len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"Latency per frame: fp32 {seconds['fp32'] * 1000:.1f} ms, bf16 {seconds['bf16'] * 1000:.1f} ms "
+          f"({seconds['fp32'] / seconds['bf16']:.2f}x)")
+    if args.video:
+        agreement = box_agreement(detections['fp32'], detections['bf16'])
+        print(f"bf16 boxes vs fp32 at IoU 0.5 / score 0.5: recall {agreement['recall']:.1%}, "
+              f"precision {agreement['precision']:.1%}, mean IoU {agreement['mean_iou']:.3f}, "
+              f"mean score difference {agreement['mean_score_diff']:.3f}")
+
+
+def main():
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.set_grad_enabled(False)
+    torch.manual_seed(0)
+    print(f"CPU, {torch.get_num_threads()} threads")
+    compare_wav2lip()
+    compare_s3fd()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Per-frame CPU latency of the float and int8 S3FD detectors, and how well their boxes agree.
+
+Runs the 'sfd' and 'sfd_int8' backends (see Wav2Lip/quantize_s3fd.py) over
+the same frames at each batch size and resolution, and compares the int8
+boxes to the float ones (recall / precision at IoU 0.5, both cut at the 0.5
+score threshold). Without --video the frames are random: latency only.
+
+Usage:
+    python benchmarks/s3fd_int8_benchmark.py --video talking_head.mp4
+    python benchmarks/s3fd_int8_benchmark.py --video talking_head.mp4 --resolutions 240 360 480 --batch_sizes 1 8
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import itertools
+import time
+import numpy as np
+import torch
+
+from Wav2Lip.face_detection.detection.registry import create_detector
+from Wav2Lip.face_detection.detection.sfd.quantized import box_agreement
+
+parser = argparse.ArgumentParser(description='float vs int8 S3FD benchmark')
+parser.add_argument('--video', default=None, help='Input video (default: random frames)')
+parser.add_argument('--frames', type=int, default=64, help='Number of frames to detect on')
+parser.add_argument('--resolutions', nargs='+', type=int, default=[320], help='Processing heights')
+parser.add_argument('--batch_sizes', nargs='+', type=int, default=[1, 8])
+parser.add_argument('--threads', type=int, default=None)
+args = parser.parse_args()
+
+
+def load_frames(max_resolution):
+    if args.video:
+        from app.core.video_analyzer import VideoAnalyser
+        analyser = VideoAnalyser(device=torch.device('cpu'), face_track_cache=False)
+        frames = itertools.islice(analyser.iter_frames(args.video, max_resolution=max_resolution), args.frames)
+        return [np.ascontiguousarray(frame[..., ::-1]) for frame in frames]
+    rng = np.random.RandomState(0)
+    width = int(max_resolution * 16 / 9)
+    return [rng.randint(0, 256, size=(max_resolution, width, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+
+def run(detector, frames, batch_size):
+    detector.detect_from_batch(np.stack(frames[:batch_size]))  # warm-up
+    detections = []
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        detections.extend(detector.detect_from_batch(np.stack(frames[i:i + batch_size])))
+    return detections, (time.perf_counter() - start) / len(frames)
+
+
+def main():
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.set_grad_enabled(False)
+    cpu = torch.device('cpu')
+    detectors = {'fp32': create_detector('sfd', cpu), 'int8': create_detector('sfd_int8', cpu)}
+    print(f"CPU, {torch.get_num_threads()} threads")
+
+    print(f"{'height':>7} {'batch':>6} {'fp32 ms':>8} {'int8 ms':>8} {'speed-up':>9} {'recall':>7} "
+          f"{'precision':>10} {'mean IoU':>9}")
+    for resolution in args.resolutions:
+        frames = load_frames(resolution)
+        for batch_size in args.batch_sizes:
+            reference, float_seconds = run(detectors['fp32'], frames, batch_size)
+            detections, int8_seconds = run(detectors['int8'], frames, batch_size)
+            agreement = box_agreement(reference, detections) if args.video else None
+            quality = (f"{agreement['recall']:>7.1%} {agreement['precision']:>10.1%} {agreement['mean_iou']:>9.3f}"
+                       if agreement else f"{'-':>7} {'-':>10} {'-':>9}")
+            print(f"{frames[0].shape[0]:>7} {batch_size:>6} {float_seconds * 1000:>8.1f} "
+                  f"{int8_seconds * 1000:>8.1f} {float_seconds / int8_seconds:>8.2f}x {quality}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""S3FD with and without its fine-stride heads (SFDDetector.min_face_size).
+
+Counts the convolution MACs actually executed, times forward + post-processing
+on a batch of frames, and, with --face_image, checks recall on a synthetic set:
+the face pasted at random sizes (all >= min_face_size) and positions on
+random backgrounds. Recall is measured against the pasted boxes and against
+the detections of the full network.
+
+Needs the S3FD weights (downloaded on first use, as in FaceAlignment).
+
+Usage:
+    python benchmarks/s3fd_min_face_benchmark.py --min_face_size 80
+    python benchmarks/s3fd_min_face_benchmark.py --face_image face.jpg --images 200 --size 720 1280
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import time
+import cv2
+import numpy as np
+import torch
+
+from Wav2Lip.face_detection.detection.sfd.sfd_detector import SFDDetector
+from Wav2Lip.face_detection.detection.sfd.detect import ANCHOR_SIZES, first_head_for
+
+parser = argparse.ArgumentParser(description='S3FD min_face_size benchmark')
+parser.add_argument('--min_face_size', type=int, default=80)
+parser.add_argument('--size', nargs=2, type=int, default=[720, 1280], help='Frame height and width')
+parser.add_argument('--batch', type=int, default=8)
+parser.add_argument('--repeat', type=int, default=5)
+parser.add_argument('--face_image', default=None, help='Face crop used to build the synthetic recall set')
+parser.add_argument('--images', type=int, default=100, help='Images in the synthetic recall set')
+parser.add_argument('--max_face_size', type=int, default=400)
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+
+def conv_macs(net, images, min_face_size):
+    macs = [0]
+
+    def count(module, inputs, output):
+        kh, kw = module.kernel_size
+        macs[0] += output.numel() * (module.in_channels // module.groups) * kh * kw
+
+    hooks = [m.register_forward_hook(count) for m in net.modules() if isinstance(m, torch.nn.Conv2d)]
+    try:
+        with torch.no_grad():
+            net(torch.zeros((1, 3) + images.shape[1:3], device=args.device), first_head_for(min_face_size))
+    finally:
+        for hook in hooks:
+            hook.remove()
+    return macs[0]
+
+
+def timed(detector, images, min_face_size):
+    detector.min_face_size = min_face_size
+    detector.detect_from_batch(images[:1])  # warm-up
+    best = float('inf')
+    for _ in range(args.repeat):
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        detector.detect_from_batch(images)
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def iou(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def matched(truth, boxes):
+    return any(iou(truth, box) >= 0.5 for box in boxes)
+
+
+def synthetic_set(rng):
+    face = cv2.imread(args.face_image)
+    if face is None:
+        raise ValueError(f"Could not read {args.face_image}")
+    height, width = args.size
+    images, truths = [], []
+    for _ in range(args.images):
+        # Smooth random background, so the pasted face is the only face-like structure
+        background = cv2.resize(rng.randint(0, 256, size=(9, 16, 3)).astype(np.uint8), (width, height),
+                                interpolation=cv2.INTER_CUBIC)
+        size = rng.randint(args.min_face_size, min(args.max_face_size, height) + 1)
+        fh = int(round(size * face.shape[0] / face.shape[1]))
+        if fh > height:
+            size, fh = int(size * height / fh), height
+        x, y = rng.randint(0, width - size + 1), rng.randint(0, height - fh + 1)
+        background[y:y + fh, x:x + size] = cv2.resize(face, (size, fh), interpolation=cv2.INTER_AREA)
+        images.append(background)
+        truths.append((x, y, x + size, y + fh))
+    return images, truths
+
+
+def recall(detector, images, truths):
+    """Recall of all heads and of the pruned network vs the pasted faces, and pruned vs all heads."""
+    full_hits = pruned_hits = reference_hits = reference_total = 0
+    for image, truth in zip(images, truths):
+        image = image[..., ::-1].copy()  # the detector takes RGB, as FaceAlignment feeds it
+        detector.min_face_size = None
+        reference = detector.detect_from_image(image)
+        detector.min_face_size = args.min_face_size
+        boxes = detector.detect_from_image(image)
+        full_hits += matched(truth, reference)
+        pruned_hits += matched(truth, boxes)
+        reference_total += len(reference)
+        reference_hits += sum(matched(box, boxes) for box in reference)
+    return full_hits / len(images), pruned_hits / len(images), reference_hits / max(1, reference_total)
+
+
+def main():
+    rng = np.random.RandomState(args.seed)
+    detector = SFDDetector(torch.device(args.device))
+
+    first_head = first_head_for(args.min_face_size)
+    print(f"min_face_size {args.min_face_size}: skipping heads with anchors {ANCHOR_SIZES[:first_head]} px")
+
+    height, width = args.size
+    images = rng.randint(0, 256, size=(args.batch, height, width, 3)).astype(np.uint8)
+    full_macs = conv_macs(detector.face_detector, images, None)
+    pruned_macs = conv_macs(detector.face_detector, images, args.min_face_size)
+    full_time, pruned_time = timed(detector, images, None), timed(detector, images, args.min_face_size)
+
+    print(f"{'':<14} {'GMACs/frame':>12} {'ms/frame':>10}")
+    print(f"{'all heads':<14} {full_macs / 1e9:>12.2f} {full_time / args.batch * 1000:>10.2f}")
+    print(f"{'pruned':<14} {pruned_macs / 1e9:>12.2f} {pruned_time / args.batch * 1000:>10.2f}")
+    print(f"MACs -{100 * (1 - pruned_macs / full_macs):.1f}%, time -{100 * (1 - pruned_time / full_time):.1f}% "
+          f"({args.device}, {height}x{width}, batch {args.batch})")
+
+    if args.face_image:
+        images, truths = synthetic_set(rng)
+        full_recall, pruned_recall, agreement = recall(detector, images, truths)
+        print(f"recall on {len(images)} synthetic images (faces {args.min_face_size}-{args.max_face_size} px): "
+              f"all heads {full_recall:.3f}, pruned {pruned_recall:.3f}, "
+              f"pruned vs all-heads detections {agreement:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""S3FD post-processing: per-anchor Python loop vs array-based decode + batched NMS.
+
+Feeds synthetic head outputs (softmaxed scores + box regressions, with a few
+face-like clusters of confident anchors) to the previous implementation and to
+the current one, checks that they return identical boxes and times both.
+
+Usage:
+    python benchmarks/s3fd_postprocess_benchmark.py
+    python benchmarks/s3fd_postprocess_benchmark.py --size 720 1280 --batch 16 --low_fraction 0.05
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import time
+import numpy as np
+import torch
+
+from Wav2Lip.face_detection.detection.sfd.bbox import batch_decode, batched_nms, nms
+from Wav2Lip.face_detection.detection.sfd.detect import decode_candidates
+
+parser = argparse.ArgumentParser(description='S3FD post-processing microbenchmark')
+parser.add_argument('--size', nargs=2, type=int, default=[320, 568], help='Frame height and width')
+parser.add_argument('--batch', nargs='+', type=int, default=[1, 16])
+parser.add_argument('--faces', type=int, default=3, help='Confident clusters per image')
+parser.add_argument('--low_fraction', type=float, default=0.01,
+                    help='Fraction of anchors scoring just above 0.05 (clutter; cartoon frames have more)')
+parser.add_argument('--repeat', type=int, default=5)
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+
+def synthetic_heads(batch, height, width, rng):
+    olist = []
+    for i in range(6):
+        stride = 2**(i + 2)
+        FH, FW = int(np.ceil(height / stride)), int(np.ceil(width / stride))
+        scores = rng.uniform(0.0, 0.05, size=(batch, FH, FW)).astype(np.float32)
+        scores[rng.random_sample((batch, FH, FW)) < args.low_fraction] = 0.1
+        for b in range(batch):
+            for _ in range(args.faces):
+                cy, cx = rng.randint(FH), rng.randint(FW)
+                patch = scores[b, max(0, cy - 1):cy + 2, max(0, cx - 1):cx + 2]
+                patch[...] = rng.uniform(0.3, 1.0, size=patch.shape)
+                # Saturated softmax outputs: exact ties, which NMS must break the same way
+                patch[patch > 0.9] = 1.0
+        cls = torch.from_numpy(np.stack([1 - scores, scores], axis=1))
+        reg = torch.from_numpy(rng.normal(0, 1, size=(batch, 4, FH, FW)).astype(np.float32))
+        olist += [cls, reg]
+    return olist
+
+
+def legacy_postprocess(olist, score_threshold=0.5):
+    # Previous batch_detect loop + per-image nms and list comprehension filter
+    BB = olist[0].size(0)
+    bboxlist = []
+    for i in range(len(olist) // 2):
+        ocls, oreg = olist[i * 2], olist[i * 2 + 1]
+        stride = 2**(i + 2)
+        poss = zip(*np.where(ocls[:, 1, :, :] > 0.05))
+        for Iindex, hindex, windex in poss:
+            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
+            score = ocls[:, 1, hindex, windex]
+            loc = oreg[:, :, hindex, windex].contiguous().view(BB, 1, 4)
+            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
+            box = batch_decode(loc, priors, [0.1, 0.2])
+            box = box[:, 0] * 1.0
+            bboxlist.append(torch.cat([box, score.unsqueeze(1)], 1).cpu().numpy())
+    bboxlists = np.array(bboxlist)
+    if 0 == len(bboxlists):
+        bboxlists = np.zeros((1, BB, 5))
+
+    keeps = [nms(bboxlists[:, i, :], 0.3) for i in range(bboxlists.shape[1])]
+    bboxlists = [bboxlists[keep, i, :] for i, keep in enumerate(keeps)]
+    return [[x for x in bboxlist if x[-1] > score_threshold] for bboxlist in bboxlists]
+
+
+def vectorized_postprocess(olist, score_threshold=0.5):
+    bboxlists = decode_candidates(olist)
+    if bboxlists is None:
+        bboxlists = np.zeros((1, olist[0].size(0), 5))
+    return batched_nms(bboxlists, 0.3, score_threshold)
+
+
+def timed(fn, olist):
+    best = float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = fn(olist)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    rng = np.random.RandomState(args.seed)
+    height, width = args.size
+
+    print('{:>6} {:>12} {:>14} {:>14} {:>9} {:>10}'.format('batch', 'candidates', 'loop (ms)', 'vector (ms)',
+                                                         'speedup', 'identical'))
+    for batch in args.batch:
+        olist = synthetic_heads(batch, height, width, rng)
+        candidates = sum(int((olist[i * 2][:, 1] > 0.05).sum()) for i in range(6))
+
+        legacy, legacy_time = timed(legacy_postprocess, olist)
+        vectorized, vectorized_time = timed(vectorized_postprocess, olist)
+
+        identical = all(np.array_equal(np.array(a).reshape(-1, 5), np.asarray(b).reshape(-1, 5))
+                        for a, b in zip(legacy, vectorized))
+        print('{:>6} {:>12} {:>14.2f} {:>14.2f} {:>8.1f}x {:>10}'.format(
+            batch, candidates, legacy_time * 1000, vectorized_time * 1000, legacy_time / vectorized_time,
+            'yes' if identical else 'NO'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Shot-boundary detection throughput: low-res decode and NumPy scoring.
+
+With --video, times the ffmpeg (or OpenCV) decode at the analysis size and
+the scoring separately; otherwise scores synthetic frames with known cuts and
+checks that they are found.
+
+Usage:
+    python benchmarks/shot_detection_benchmark.py
+    python benchmarks/shot_detection_benchmark.py --video movie_1080p.mp4 --decoder ffmpeg
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import time
+import numpy as np
+
+from app.core.shot_detection import ShotBoundaryDetector
+
+parser = argparse.ArgumentParser(description='Shot-boundary detection benchmark')
+parser.add_argument('--video', default=None, help='Input video (default: synthetic frames)')
+parser.add_argument('--decoder', default='auto', choices=['auto', 'ffmpeg', 'opencv'])
+parser.add_argument('--frames', type=int, default=5000, help='Synthetic frames')
+parser.add_argument('--shot_length', type=int, default=120, help='Frames per synthetic shot')
+args = parser.parse_args()
+
+
+def synthetic_frames(detector, rng):
+    # Every shot: a random background with a drifting noisy square, so frames move inside a shot
+    width, height = detector.analysis_size
+    frames = []
+    for start in range(0, args.frames, args.shot_length):
+        background = rng.randint(0, 256, size=3)
+        base = np.empty((height, width, 3), dtype=np.uint8)
+        base[:] = background
+        for i in range(min(args.shot_length, args.frames - start)):
+            frame = base.copy()
+            x = (i // 2) % (width - 16)
+            frame[10:26, x:x + 16] = rng.randint(0, 256, size=(16, 16, 3))
+            frames.append(frame)
+    return frames
+
+
+def main():
+    detector = ShotBoundaryDetector()
+
+    if args.video:
+        start = time.perf_counter()
+        frames = list(detector.iter_analysis_frames(args.video, args.decoder))
+        decode_time = time.perf_counter() - start
+        print(f"decode at {detector.analysis_size[0]}x{detector.analysis_size[1]} ({args.decoder}): "
+              f"{len(frames)} frames, {len(frames) / decode_time:.0f} frames/s")
+    else:
+        frames = synthetic_frames(detector, np.random.RandomState(0))
+        decode_time = 0.0
+
+    start = time.perf_counter()
+    shots = detector.detect(frames)
+    score_time = time.perf_counter() - start
+    print(f"scoring: {len(frames) / score_time:.0f} frames/s, {len(shots)} shots")
+    if args.video:
+        total = decode_time + score_time
+        print(f"end to end: {len(frames) / total:.0f} frames/s")
+    else:
+        expected = list(range(args.shot_length, args.frames, args.shot_length))
+        found = [start for start, _ in shots[1:]]
+        print(f"cuts found: {len(set(found) & set(expected))}/{len(expected)}, "
+              f"false positives: {len(set(found) - set(expected))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Static-image lip sync: monolithic Wav2Lip forward vs stage-split forward with cached face features.
+
+Runs a Wav2Lip model (random weights unless --checkpoint is given) over N mel
+chunks against a single face, as Wav2Lip/inference.py does for an image input,
+and checks that both paths produce the same output.
+
+Usage:
+    python benchmarks/static_image_benchmark.py
+    python benchmarks/static_image_benchmark.py --checkpoint checkpoints/wav2lip_gan.pth --chunks 2000
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import time
+import torch
+
+from Wav2Lip.models.wav2lip import Wav2Lip
+from Wav2Lip.models.feature_cache import FaceFeatureCache
+
+parser = argparse.ArgumentParser(description='Static-image benchmark of the face-feature cache')
+parser.add_argument('--checkpoint', default=None, help='Wav2Lip checkpoint (default: random weights)')
+parser.add_argument('--chunks', type=int, default=750, help='Number of mel chunks (30 s at 25 fps)')
+parser.add_argument('--batch_size', type=int, default=128, help='Wav2Lip batch size (as --wav2lip_batch_size)')
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+args = parser.parse_args()
+
+
+def load_model():
+    model = Wav2Lip()
+    if args.checkpoint:
+        checkpoint = torch.load(args.checkpoint, map_location=lambda storage, loc: storage)
+        model.load_state_dict({k.replace('module.', ''): v for k, v in checkpoint['state_dict'].items()})
+    return model.to(args.device).eval()
+
+
+def synchronize():
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+
+
+def monolithic(model, mels, face):
+    outputs = []
+    for i in range(0, len(mels), args.batch_size):
+        mel_batch = mels[i:i + args.batch_size]
+        outputs.append(model(mel_batch, face.expand(len(mel_batch), -1, -1, -1)))
+    return torch.cat(outputs)
+
+
+def stage_split(model, mels, face):
+    cache = FaceFeatureCache()
+    audio_embeddings = model.encode_audio_chunks(mels)
+    outputs = []
+    for i in range(0, len(mels), args.batch_size):
+        n = len(mels[i:i + args.batch_size])
+        feats = cache.encode(model, [0] * n, face.expand(n, -1, -1, -1))
+        outputs.append(model.decode(audio_embeddings[i:i + n], feats))
+    return torch.cat(outputs), cache.stats()
+
+
+def main():
+    torch.manual_seed(0)
+    model = load_model()
+    mels = torch.randn(args.chunks, 1, 80, 16, device=args.device)
+    face = torch.rand(1, 6, 96, 96, device=args.device)
+
+    with torch.no_grad():
+        # Warm-up (cudnn autotuning, allocator)
+        monolithic(model, mels[:args.batch_size], face)
+        stage_split(model, mels[:args.batch_size], face)
+
+        synchronize()
+        start = time.perf_counter()
+        reference = monolithic(model, mels, face)
+        synchronize()
+        monolithic_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result, stats = stage_split(model, mels, face)
+        synchronize()
+        split_time = time.perf_counter() - start
+
+    print('device: {}, chunks: {}, batch size: {}'.format(args.device, args.chunks, args.batch_size))
+    print('{:<28} {:>10.2f}s {:>10.1f} frames/s'.format('monolithic forward', monolithic_time,
+                                                       args.chunks / monolithic_time))
+    print('{:<28} {:>10.2f}s {:>10.1f} frames/s'.format('split + face feature cache', split_time,
+                                                       args.chunks / split_time))
+    print('speedup: {:.2f}x, cache hits/misses: {}/{}'.format(monolithic_time / split_time,
+                                                             stats['hits'], stats['misses']))
+    print('max abs difference: {:.3g}'.format((reference - result).abs().max().item()))
+
+
+if __name__ == '__main__':
+    main()
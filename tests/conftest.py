@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+# The packages are imported from the repository root, as the benchmarks do
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def randomize_batchnorm(model, seed=0):
+    """Random BatchNorm statistics: freshly built models have identity ones, which hide folding errors."""
+    import torch
+
+    generator = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, torch.nn.BatchNorm2d):
+                n = module.num_features
+                module.running_mean.copy_(torch.randn(n, generator=generator) * 0.1)
+                module.running_var.copy_(torch.rand(n, generator=generator) + 0.5)
+                module.weight.copy_(torch.rand(n, generator=generator) + 0.5)
+                module.bias.copy_(torch.randn(n, generator=generator) * 0.1)
+    return model
+
+
+@pytest.fixture(scope='module')
+def wav2lip():
+    """Eval-mode Wav2Lip generator with random weights (shared by a module's tests: do not modify it)."""
+    torch = pytest.importorskip('torch')
+    from Wav2Lip.models.wav2lip import Wav2Lip
+
+    torch.manual_seed(0)
+    return randomize_batchnorm(Wav2Lip()).eval()
+
+
+@pytest.fixture
+def wav2lip_inputs():
+    """(mel, faces) batch of 3 random Wav2Lip inputs: (3, 1, 80, 16) and (3, 6, 96, 96) in [0, 1]."""
+    torch = pytest.importorskip('torch')
+
+    generator = torch.Generator().manual_seed(1)
+    return torch.randn(3, 1, 80, 16, generator=generator), torch.rand(3, 6, 96, 96, generator=generator)
+
+
+@pytest.fixture(scope='module')
+def s3fd_net():
+    """Eval-mode s3fd with random weights and random L2Norm scales (shared by a module's tests)."""
+    torch = pytest.importorskip('torch')
+    from Wav2Lip.face_detection.detection.sfd.net_s3fd import L2Norm, s3fd
+
+    torch.manual_seed(0)
+    net = s3fd().eval()
+    with torch.no_grad():
+        for module in net.modules():
+            if isinstance(module, L2Norm):
+                module.weight.uniform_(1.0, 10.0)
+    return net
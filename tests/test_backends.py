@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from Wav2Lip.models.backends import (OnnxWav2Lip, TorchScriptWav2Lip, artifact_paths, export_onnx,
+                                     export_torchscript, load_exported)
+
+
+def assert_matches_eager(exported, model, mel, faces):
+    with torch.no_grad():
+        embedding, feats = model.encode_audio(mel), model.encode_face(faces)
+        torch.testing.assert_close(exported.encode_audio(mel), embedding, rtol=1e-4, atol=1e-4)
+        exported_feats = exported.encode_face(faces)
+        assert len(exported_feats) == len(feats)
+        for a, e in zip(exported_feats, feats):
+            torch.testing.assert_close(a, e, rtol=1e-4, atol=1e-4)
+        torch.testing.assert_close(exported.decode(embedding, feats), model.decode(embedding, feats),
+                                   rtol=1e-4, atol=1e-4)
+        torch.testing.assert_close(exported(mel, faces), model(mel, faces), rtol=1e-4, atol=1e-4)
+
+
+def test_torchscript_matches_eager(wav2lip, wav2lip_inputs, tmp_path):
+    path = str(tmp_path / 'wav2lip.torchscript.pt')
+    export_torchscript(wav2lip, path)
+    # Traced at batch size 2: the inputs have 3 frames
+    assert_matches_eager(TorchScriptWav2Lip(path, 'cpu'), wav2lip, *wav2lip_inputs)
+
+
+def test_onnx_matches_eager(wav2lip, wav2lip_inputs, tmp_path):
+    pytest.importorskip('onnxruntime')
+    paths = [str(tmp_path / f"wav2lip.{method}.onnx") for method in ('encode_audio', 'encode_face', 'decode')]
+    export_onnx(wav2lip, paths)
+    assert_matches_eager(OnnxWav2Lip(paths, 'cpu'), wav2lip, *wav2lip_inputs)
+
+
+def test_load_exported_reexports_changed_checkpoints(wav2lip, wav2lip_inputs, tmp_path):
+    checkpoint = str(tmp_path / 'wav2lip.pth')
+    torch.save({'state_dict': wav2lip.state_dict()}, checkpoint)
+    exported = load_exported(checkpoint, 'cpu', 'torchscript')
+    first = artifact_paths(checkpoint, 'torchscript')
+    assert os.path.isfile(first[0])
+    assert_matches_eager(exported, wav2lip, *wav2lip_inputs)
+
+    # A new version of the checkpoint gets its own export, and the stale one is removed
+    state_dict = wav2lip.state_dict()
+    state_dict['output_block.1.bias'] = state_dict['output_block.1.bias'] + 1
+    torch.save({'state_dict': state_dict}, checkpoint)
+    # Hashes are memoised per size and mtime: make sure the rewrite does not share the old mtime
+    stat = os.stat(checkpoint)
+    os.utime(checkpoint, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    load_exported(checkpoint, 'cpu', 'torchscript')
+    second = artifact_paths(checkpoint, 'torchscript')
+    assert second != first
+    assert os.path.isfile(second[0]) and not os.path.exists(first[0])
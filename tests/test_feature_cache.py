@@ -0,0 +1,83 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from Wav2Lip.models.feature_cache import FaceFeatureCache
+
+
+def entry_bytes(model, face):
+    return sum(f.numel() * f.element_size() for f in model.encode_face(face[None]))
+
+
+def assert_feats_close(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a.shape == e.shape
+        torch.testing.assert_close(a, e, rtol=1e-4, atol=1e-5)
+
+
+@pytest.fixture
+def frames():
+    # Distinct face crops, indexed by the cache keys
+    return torch.rand(5, 6, 96, 96, generator=torch.Generator().manual_seed(2))
+
+
+@torch.no_grad()
+def test_split_forward_matches_forward(wav2lip, wav2lip_inputs):
+    mel, faces = wav2lip_inputs
+    split = wav2lip.decode(wav2lip.encode_audio(mel), wav2lip.encode_face(faces))
+    torch.testing.assert_close(split, wav2lip(mel, faces), rtol=1e-4, atol=1e-5)
+
+
+@torch.no_grad()
+def test_split_forward_matches_forward_on_sequences(wav2lip):
+    # Training layout: (B, T, 1, 80, 16) mel windows and (B, 6, T, 96, 96) faces
+    generator = torch.Generator().manual_seed(3)
+    mel, faces = torch.randn(2, 5, 1, 80, 16, generator=generator), torch.rand(2, 6, 5, 96, 96, generator=generator)
+    expected = wav2lip(mel, faces)
+    for t in range(5):
+        frame = wav2lip.decode(wav2lip.encode_audio(mel[:, t]), wav2lip.encode_face(faces[:, :, t]))
+        torch.testing.assert_close(frame, expected[:, :, t], rtol=1e-4, atol=1e-5)
+
+
+@torch.no_grad()
+def test_encode_audio_chunks_matches_encode_audio(wav2lip, wav2lip_inputs):
+    mel, _ = wav2lip_inputs
+    torch.testing.assert_close(wav2lip.encode_audio_chunks(mel, batch_size=2), wav2lip.encode_audio(mel),
+                               rtol=1e-4, atol=1e-5)
+
+
+@torch.no_grad()
+def test_cache_matches_face_encoder(wav2lip, frames):
+    cache = FaceFeatureCache()
+    # Repeated keys within a batch: the frame is encoded once, and is a miss on every row
+    keys = [0, 1, 0, 2]
+    assert_feats_close(cache.encode(wav2lip, keys, frames[keys]), wav2lip.encode_face(frames[keys]))
+    assert (cache.hits, cache.misses) == (0, 4)
+
+    keys = [2, 0, 3]
+    assert_feats_close(cache.encode(wav2lip, keys, frames[keys]), wav2lip.encode_face(frames[keys]))
+    assert (cache.hits, cache.misses) == (2, 5)
+    assert cache.stats()['entries'] == 4
+
+
+@torch.no_grad()
+def test_cache_evicts_least_recently_used(wav2lip, frames):
+    cache = FaceFeatureCache(max_bytes=2 * entry_bytes(wav2lip, frames[0]))
+    for keys in ([0, 1], [2], [0, 3, 1]):
+        assert_feats_close(cache.encode(wav2lip, keys, frames[keys]), wav2lip.encode_face(frames[keys]))
+        assert cache.bytes <= cache.max_bytes
+    stats = cache.stats()
+    assert stats['evictions'] > 0
+    assert stats['entries'] == 2
+    assert not stats['bypassed']
+
+
+@torch.no_grad()
+def test_cache_turns_off_when_the_frames_do_not_fit(wav2lip, frames):
+    cache = FaceFeatureCache(max_bytes=2 * entry_bytes(wav2lip, frames[0]), num_keys=len(frames))
+    for keys in ([0, 1], [2, 0]):
+        assert_feats_close(cache.encode(wav2lip, keys, frames[keys]), wav2lip.encode_face(frames[keys]))
+    stats = cache.stats()
+    assert stats['bypassed']
+    assert (stats['entries'], stats['bytes'], stats['hits'], stats['misses']) == (0, 0, 0, 4)
@@ -0,0 +1,45 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from Wav2Lip.models.fusion import optimize_for_inference
+
+
+def assert_outputs_close(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        if e is None:
+            assert a is None
+        else:
+            torch.testing.assert_close(a, e, rtol=1e-3, atol=1e-4)
+
+
+@torch.no_grad()
+@pytest.mark.parametrize('channels_last', [True, False])
+def test_wav2lip_matches_eval_model(wav2lip, wav2lip_inputs, channels_last):
+    mel, faces = wav2lip_inputs
+    optimized = optimize_for_inference(wav2lip, channels_last=channels_last)
+    assert optimized.fused_blocks > 0
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in optimized.modules())
+    # The registry's copy is left as it was
+    assert any(isinstance(m, torch.nn.BatchNorm2d) for m in wav2lip.modules())
+
+    torch.testing.assert_close(optimized(mel, faces), wav2lip(mel, faces), rtol=1e-3, atol=1e-4)
+    # The split forward of the feature cache goes through the same blocks
+    assert_outputs_close(optimized.encode_face(faces), wav2lip.encode_face(faces))
+
+
+def test_channels_last_weights(wav2lip):
+    optimized = optimize_for_inference(wav2lip)
+    weights = [m.weight for m in optimized.modules() if isinstance(m, torch.nn.Conv2d)]
+    assert weights and all(w.is_contiguous(memory_format=torch.channels_last) for w in weights)
+
+
+@torch.no_grad()
+@pytest.mark.parametrize('first_head', [0, 2])
+def test_s3fd_matches_eval_model(s3fd_net, first_head):
+    optimized = optimize_for_inference(s3fd_net)
+    # The three L2Norm scales are folded into the heads
+    assert optimized.fused_blocks == 3
+    x = torch.randn(2, 3, 128, 160, generator=torch.Generator().manual_seed(4)) * 50
+    assert_outputs_close(optimized(x, first_head), s3fd_net(x, first_head))
@@ -0,0 +1,56 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from Wav2Lip.models.backends import export_torchscript
+from Wav2Lip.models.quantization import QuantizedWav2Lip, quantize_wav2lip, quantized_engine, save_quantized
+
+
+def random_segments(count, frames, seed):
+    generator = torch.Generator().manual_seed(seed)
+    return [(torch.randn(frames, 1, 80, 16, generator=generator), torch.rand(frames, 6, 96, 96, generator=generator))
+            for _ in range(count)]
+
+
+@pytest.fixture(scope='module')
+def quantized(wav2lip):
+    try:
+        engine = quantized_engine()
+    except RuntimeError:
+        pytest.skip("This PyTorch build has no int8 CPU kernels")
+    return quantize_wav2lip(wav2lip, random_segments(2, 8, seed=5), batch_size=4, engine=engine)
+
+
+def test_quantized_blocks(wav2lip, quantized):
+    assert any('quantized' in type(m).__module__ for m in quantized.modules())
+    # The float model is left as it was
+    assert not any('quantized' in type(m).__module__ for m in wav2lip.modules())
+
+
+@torch.no_grad()
+def test_int8_close_to_float(wav2lip, quantized):
+    (mel, faces), = random_segments(1, 6, seed=6)
+    expected = wav2lip(mel, faces)
+    result = quantized.decode(quantized.encode_audio(mel), quantized.encode_face(faces))
+    assert result.shape == expected.shape
+    # Generated faces are in [0, 1]
+    assert (result - expected).abs().mean().item() < 0.02
+
+
+@torch.no_grad()
+def test_saved_checkpoint_matches(quantized, tmp_path):
+    path = str(tmp_path / 'wav2lip.int8.pt')
+    save_quantized(quantized, path, {'engine': torch.backends.quantized.engine, 'frames': 16})
+    loaded = QuantizedWav2Lip(path, 'cpu')
+    assert loaded.metadata['frames'] == 16
+
+    (mel, faces), = random_segments(1, 3, seed=7)
+    expected = quantized.decode(quantized.encode_audio(mel), quantized.encode_face(faces))
+    torch.testing.assert_close(loaded(mel, faces), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_float_torchscript_is_not_an_int8_checkpoint(wav2lip, tmp_path):
+    path = str(tmp_path / 'wav2lip.torchscript.pt')
+    export_torchscript(wav2lip, path)
+    with pytest.raises(ValueError):
+        QuantizedWav2Lip(path, 'cpu')
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from Wav2Lip.face_detection.detection.sfd.quantized import (QuantizedS3FD, box_agreement, box_iou, preprocess,
+                                                            quantize_s3fd, save_quantized_s3fd)
+from Wav2Lip.models.quantization import quantized_engine
+
+
+def random_frames(count, seed, size=(128, 160)):
+    rng = np.random.RandomState(seed)
+    return [rng.randint(0, 256, size=size + (3,), dtype=np.uint8) for _ in range(count)]
+
+
+@pytest.fixture(scope='module')
+def quantized(s3fd_net):
+    try:
+        engine = quantized_engine()
+    except RuntimeError:
+        pytest.skip("This PyTorch build has no int8 CPU kernels")
+    return quantize_s3fd(s3fd_net, random_frames(4, seed=0), engine=engine)
+
+
+@torch.no_grad()
+def test_int8_close_to_float(s3fd_net, quantized):
+    x = preprocess(np.stack(random_frames(2, seed=1)))
+    expected, result = s3fd_net(x), list(quantized(x))
+    assert len(result) == len(expected) == 12
+    for i, (a, e) in enumerate(zip(result, expected)):
+        assert a.shape == e.shape
+        if i % 2 == 0:
+            # Face scores, as detect.py reads them
+            a, e = torch.softmax(a, dim=1), torch.softmax(e, dim=1)
+            assert (a - e).abs().mean().item() < 0.02
+        else:
+            assert ((a - e).abs().mean() / e.abs().mean()).item() < 0.1
+
+
+@torch.no_grad()
+def test_saved_checkpoint_skips_heads(quantized, tmp_path):
+    frame = random_frames(1, seed=2)[0]
+    path = str(tmp_path / 's3fd.int8.pt')
+    save_quantized_s3fd(quantized, path, {'engine': torch.backends.quantized.engine}, frame)
+    loaded = QuantizedS3FD(path)
+
+    # Traced on one frame size, run on another
+    x = preprocess(np.stack(random_frames(2, seed=3, size=(96, 128))))
+    expected = list(quantized(x))
+    for first_head in (0, 2):
+        outputs = loaded(x, first_head)
+        assert outputs[:2 * first_head] == [None] * (2 * first_head)
+        for a, e in zip(outputs[2 * first_head:], expected[2 * first_head:]):
+            torch.testing.assert_close(a, e, rtol=1e-4, atol=1e-4)
+
+
+def test_missing_checkpoint(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        QuantizedS3FD(str(tmp_path / 's3fd.int8.pt'))
+
+
+def test_box_iou():
+    a = np.array([[0, 0, 10, 10], [0, 0, 10, 10]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float32)
+    np.testing.assert_allclose(box_iou(a, b), [[1, 1 / 3, 0], [1, 1 / 3, 0]], rtol=1e-6)
+
+
+def test_box_agreement():
+    reference = [np.array([[0, 0, 10, 10, 0.9]]), np.zeros((0, 5))]
+    detections = [np.array([[1, 0, 11, 10, 0.8], [50, 50, 60, 60, 0.6]]), np.zeros((0, 5))]
+    agreement = box_agreement(reference, detections)
+    assert (agreement['frames'], agreement['faces']) == (2, 1)
+    assert agreement['recall'] == 1.0
+    assert agreement['precision'] == 0.5
+    assert agreement['mean_iou'] == pytest.approx(90 / 110, rel=1e-5)
+    assert agreement['mean_score_diff'] == pytest.approx(0.1, rel=1e-5)
+    assert agreement['same_face_count'] == 0.5
+
+    # No match under the IoU threshold
+    assert box_agreement(reference, detections, iou_threshold=0.9)['recall'] == 0.0
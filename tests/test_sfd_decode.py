@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from Wav2Lip.face_detection.detection.sfd.bbox import batch_decode, batched_nms, nms
+from Wav2Lip.face_detection.detection.sfd.detect import decode_candidates, first_head_for
+
+
+def synthetic_heads(batch, height=96, width=128, seed=0):
+    # Softmaxed scores and box regressions of the 6 heads, with clusters of confident anchors
+    rng = np.random.RandomState(seed)
+    olist = []
+    for i in range(6):
+        stride = 2**(i + 2)
+        FH, FW = int(np.ceil(height / stride)), int(np.ceil(width / stride))
+        scores = rng.uniform(0.0, 0.05, size=(batch, FH, FW)).astype(np.float32)
+        scores[rng.random_sample((batch, FH, FW)) < 0.05] = 0.1
+        for b in range(batch):
+            for _ in range(2):
+                cy, cx = rng.randint(FH), rng.randint(FW)
+                patch = scores[b, max(0, cy - 1):cy + 2, max(0, cx - 1):cx + 2]
+                patch[...] = rng.uniform(0.3, 1.0, size=patch.shape)
+                # Saturated softmax outputs: exact ties, which NMS must break the same way
+                patch[patch > 0.9] = 1.0
+        olist.append(torch.from_numpy(np.stack([1 - scores, scores], axis=1)))
+        olist.append(torch.from_numpy(rng.normal(0, 1, size=(batch, 4, FH, FW)).astype(np.float32)))
+    return olist
+
+
+def per_anchor_candidates(olist):
+    # The per-anchor loop decode_candidates replaced (heads skipped for min_face_size are None)
+    bboxlist = []
+    for i in range(len(olist) // 2):
+        ocls, oreg = olist[i * 2], olist[i * 2 + 1]
+        if ocls is None:
+            continue
+        BB = ocls.size(0)
+        stride = 2**(i + 2)
+        for _, hindex, windex in zip(*np.where(ocls[:, 1, :, :] > 0.05)):
+            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
+            score = ocls[:, 1, hindex, windex]
+            loc = oreg[:, :, hindex, windex].contiguous().view(BB, 1, 4)
+            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
+            box = batch_decode(loc, priors, [0.1, 0.2])[:, 0]
+            bboxlist.append(torch.cat([box, score.unsqueeze(1)], 1).numpy())
+    return np.array(bboxlist) if bboxlist else None
+
+
+def per_image_nms(dets, score_threshold):
+    # Per-image nms and score filter of the detector before batched_nms
+    results = []
+    for i in range(dets.shape[1]):
+        kept = dets[nms(dets[:, i, :], 0.3), i, :]
+        results.append(kept[kept[:, 4] > score_threshold])
+    return results
+
+
+@pytest.mark.parametrize('batch', [1, 4])
+def test_decode_candidates_matches_per_anchor_loop(batch):
+    olist = synthetic_heads(batch)
+    expected = per_anchor_candidates(olist)
+    candidates = decode_candidates(olist)
+    assert candidates.shape == expected.shape == (len(expected), batch, 5)
+    np.testing.assert_allclose(candidates, expected, rtol=1e-6, atol=1e-4)
+
+
+def test_decode_candidates_skips_heads():
+    olist = synthetic_heads(2)
+    olist[:4] = [None] * 4
+    np.testing.assert_allclose(decode_candidates(olist), per_anchor_candidates(olist), rtol=1e-6, atol=1e-4)
+
+
+def test_decode_candidates_without_faces():
+    olist = synthetic_heads(2)
+    for ocls in olist[::2]:
+        ocls[:, 1] = 0.01
+        ocls[:, 0] = 0.99
+    assert decode_candidates(olist) is None
+
+
+@pytest.mark.parametrize('score_threshold', [0.05, 0.5])
+def test_batched_nms_matches_per_image_nms(score_threshold):
+    dets = decode_candidates(synthetic_heads(4, seed=1))
+    results = batched_nms(dets, 0.3, score_threshold)
+    expected = per_image_nms(dets, score_threshold)
+    assert len(results) == len(expected)
+    for result, reference in zip(results, expected):
+        # Same boxes, in the same (descending score, ties as in nms) order
+        np.testing.assert_array_equal(result, reference)
+
+
+def test_first_head_for():
+    assert first_head_for(None) == 0
+    assert first_head_for(32) == 0
+    assert first_head_for(40) == 1
+    assert first_head_for(100) == 2
+    # The two coarsest heads are always run
+    assert first_head_for(10000) == 4